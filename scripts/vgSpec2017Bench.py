@@ -0,0 +1,320 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Measures how fast vgSpec2017GetResults.py processes results, on
+# synthetic cachegrind outputs so no SPEC run is needed. For each size
+# asked for, a raw result, its annotated file and the source files they
+# point at are generated, then every stage of the post-processing is
+# timed on its own: folder prep, annotation, reformatting, parsing and
+# each flavour of the hotspot analysis.
+#
+# Args to this script
+#   --sizes     Comma separated sizes of the raw results to generate, in MB (default: 1,16,128)
+#   --files N   The number of source files the results are spread over (default: 20)
+#   --events    The events to find hotspots for (default: DLmr,Bcm)
+#   --workdir   Where to generate the results (default: a temporary folder, removed after)
+#   --output FILE   Also write the measurements to FILE as JSON
+#   --baseline FILE Compare the measurements to those of an earlier --output
+#
+# Every stage runs in a child process of its own, so its peak memory (the child's
+# peak resident set size) is not mixed up with any other stage's. The annotation
+# stage runs cg_annotate when it is installed, and is skipped otherwise (the
+# generated annotated file stands in for its output).
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017GetResults
+
+#########################################
+#           BENCHMARK SETTINGS          #
+#########################################
+linesPerFunction = 100 # Source lines in every synthetic function
+countPoolSize = 4096 # Distinct count rows the synthetic lines cycle through
+cycleStride = 2654435761 # Spreads the count rows over the lines
+
+#########################################
+#         SYNTHETIC RESULTS             #
+#########################################
+# Makes the rows of counts the synthetic lines are given. Most lines are cold and
+# a few are very hot, so the hotspot searches have something to find.
+# ARGS: the random generator
+# RETURNS: a list of [count per event] rows
+def makeCountPool(rng):
+    pool = []
+    numEvents = len(vgSpec2017Parser.cgEvents)
+    for i in range(countPoolSize):
+        if rng.random() < 0.3:
+            pool.append([0] * numEvents)
+        else:
+            heat = int(rng.paretovariate(1.2) * 100)
+            pool.append([rng.randint(0, heat) if rng.random() < 0.7 else 0 for j in range(numEvents)])
+    return pool
+
+# RETURNS: one count of an annotated line, the way cg_annotate prints it
+def formatAnnotatedCount(value):
+    return "{:,}".format(value) if value else "."
+
+# Writes a raw cachegrind result, the annotated file cg_annotate would make of it and
+# the source files both point at, all from the same counts
+# ARGS: the raw result to write, the annotated file to write, the folder for the
+# sources, the size of the raw result (bytes), the number of source files
+# RETURNS: nothing
+def writeSyntheticResult(rawResult, annotatedResult, srcDir, sizeBytes, numFiles):
+    rng = random.Random(sizeBytes)
+    pool = makeCountPool(rng)
+    events = vgSpec2017Parser.cgEvents
+    # Size the sources from the average raw record, line number and cold lines included
+    bytesPerLine = sum(len(" ".join(str(x) for x in counts)) + 7 for counts in pool if any(counts)) / float(len(pool))
+    linesPerFile = max(int(sizeBytes / (numFiles * bytesPerLine)), 1)
+    header = " ".join(events)
+    totals = [0] * len(events)
+    if not os.path.isdir(srcDir):
+        os.makedirs(srcDir)
+    with open(rawResult, 'w') as raw:
+        with open(annotatedResult + ".body", 'w') as body:
+            raw.write("desc: I1 cache: 32768 B, 64 B, 8-way associative\n")
+            raw.write("desc: D1 cache: 32768 B, 64 B, 8-way associative\n")
+            raw.write("desc: LL cache: 2097152 B, 64 B, 16-way associative\n")
+            raw.write("cmd: ./synthetic\nevents: " + header + "\n")
+            row = 0
+            for fileNo in range(numFiles):
+                source = os.path.join(srcDir, "file" + str(fileNo) + ".c")
+                raw.write("fl=" + source + "\n")
+                body.write("-" * 80 + "\n-- Auto-annotated source: " + source + "\n" + "-" * 80 + "\n" + header + "\n\n")
+                with open(source, 'w') as src:
+                    for lineNo in range(1, linesPerFile + 1):
+                        if lineNo % linesPerFunction == 1:
+                            raw.write("fn=fn" + str(fileNo) + "_" + str(lineNo // linesPerFunction) + "\n")
+                        code = "    x[" + str(lineNo) + "] = y[" + str(lineNo) + "] + z;"
+                        src.write(code + "\n")
+                        counts = pool[(row * cycleStride) % countPoolSize]
+                        row += 1
+                        if any(counts):
+                            raw.write(str(lineNo) + " " + " ".join(str(x) for x in counts) + "\n")
+                            for i in range(len(counts)):
+                                totals[i] += counts[i]
+                        body.write(" ".join(formatAnnotatedCount(x).rjust(10) for x in counts) + "  " + code + "\n")
+                body.write("\n")
+            raw.write("summary: " + " ".join(str(x) for x in totals) + "\n")
+            body.write("-" * 80 + "\n" + header + "\n" + "-" * 80 + "\n")
+            body.write(" ".join("100" for x in events) + "  percentage of events annotated\n\n")
+    # The header of the annotated file needs the totals, so it goes on last
+    with open(annotatedResult, 'w') as annotated:
+        annotated.write("-" * 80 + "\nI1 cache:         32768 B, 64 B, 8-way associative\n")
+        annotated.write("Command:          ./synthetic\nEvents recorded:  " + header + "\n" + "-" * 80 + "\n")
+        annotated.write(header + "\n" + "-" * 80 + "\n")
+        annotated.write(" ".join(formatAnnotatedCount(x) for x in totals) + "  PROGRAM TOTALS\n\n")
+        with open(annotatedResult + ".body") as body:
+            shutil.copyfileobj(body, annotated, 1 << 20)
+    os.remove(annotatedResult + ".body")
+
+#########################################
+#             MEASUREMENT               #
+#########################################
+# Runs one stage in a child process and measures it
+# ARGS: the stage function and its arguments
+# RETURNS: (wall clock seconds, peak resident set size of the child in KB, whether it succeeded).
+# The peak is None where there is no fork/wait4, and the stage then runs in this process.
+def measure(stage, *stageArgs):
+    if not (hasattr(os, "fork") and hasattr(os, "wait4")):
+        start = time.time()
+        stage(*stageArgs)
+        return time.time() - start, None, True
+    sys.stdout.flush()
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        # The stages report their progress, which would get in the way of the report
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        code = 0
+        try:
+            stage(*stageArgs)
+            sys.stdout.flush()
+        except BaseException:
+            code = 1
+        os._exit(code)
+    pid, status, usage = os.wait4(pid, 0)
+    seconds = time.time() - start
+    return seconds, usage.ru_maxrss, os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+# RETURNS: nothing - the stage a measurement of the baseline memory is made with
+def doNothing():
+    pass
+
+# Copies a file outside of any measurement, so a stage can change it in place
+def freshCopy(source, dest):
+    shutil.copy(source, dest)
+    return dest
+
+# Stage: the results folders and moving the raw result into raw/
+def stagePrep(dirs, filename):
+    root, raw, annotated, formatted = dirs
+    vgSpec2017GetResults.prepResultsFolder(root, raw, annotated, formatted)
+    vgSpec2017GetResults.prepBenchmarkFolder(root, raw, formatted, filename)
+
+# Stage: the hotspot search of analyzeHotspots or analyzeHotspotsStream for every event
+def stageAnalyze(analyze, bmkName, annotatedResult, fmtDir, events):
+    for event in events:
+        outputDir = vgSpec2017GetResults.getEventOutputDir(fmtDir, bmkName, event)
+        analyze(bmkName, annotatedResult, outputDir, outputDir + "summary.txt", event, .90, 30, 10)
+
+# Stage: every event at once from one NumPy table
+def stageEngine(bmkName, annotatedResult, fmtDir, events):
+    vgSpec2017GetResults.analyzeHotspotsEngine(bmkName, annotatedResult, fmtDir, events, .90, 30, 10, [])
+
+# Stage: parsing the raw result and analyzing its table (GetResults --native)
+def stageNative(bmkName, rawResult, fmtDir, events):
+    table = vgSpec2017Parser.parseCachegrindOut(rawResult)
+    for event in events:
+        outputDir = vgSpec2017GetResults.getEventOutputDir(fmtDir, bmkName, event)
+        vgSpec2017GetResults.analyzeTableHotspots(bmkName, table, outputDir, outputDir + "summary.txt", event, .90, 30, 10)
+
+# Generates the results of one size and times every stage on them
+# ARGS: the working folder, the size of the raw result (MB), the number of source
+# files, the events to analyze, whether cg_annotate is installed
+# RETURNS: a list of measurements, one dict per stage
+def benchmarkSize(workDir, sizeMB, numFiles, events, haveCgAnnotate):
+    bmkName = "500.synthetic_" + str(sizeMB) + "MB"
+    filename = bmkName + ".txt"
+    root = os.path.join(workDir, bmkName) + "/"
+    dirs = (root, root + "raw/", root + "annotated/", root + "formatted/")
+    vgSpec2017GetResults.makeResultsDir(root)
+    sys.stdout.write("Generating a " + str(sizeMB) + " MB result...")
+    sys.stdout.flush()
+    generated = root + "generated.annotated"
+    writeSyntheticResult(root + filename, generated, root + "src/", int(sizeMB * 1024 * 1024), numFiles)
+    rawMB = os.path.getsize(root + filename) / 1048576.0
+    annotatedMB = os.path.getsize(generated) / 1048576.0
+    sys.stdout.write("done (" + "{0:.1f}".format(annotatedMB) + " MB annotated)\n")
+    rawResult = dirs[1] + filename
+    annotatedResult = dirs[2] + filename
+    stages = [("prep", rawMB, stagePrep, (dirs, filename))]
+    if haveCgAnnotate:
+        stages.append(("annotate", rawMB, vgSpec2017GetResults.annotateResult, (rawResult, annotatedResult)))
+    # Both reformats start from the unformatted annotated file, the analyses from the reformatted one
+    stages.append(("reformat", annotatedMB, vgSpec2017GetResults.reformatResult, (generated + ".copy", False)))
+    stages.append(("reformat --stream", annotatedMB, vgSpec2017GetResults.reformatResult, (generated + ".stream", True)))
+    stages.append(("analyze", annotatedMB, stageAnalyze, (vgSpec2017GetResults.analyzeHotspots, bmkName, generated + ".stream", dirs[3] + "classic/", events)))
+    stages.append(("analyze --stream", annotatedMB, stageAnalyze, (vgSpec2017GetResults.analyzeHotspotsStream, bmkName, generated + ".stream", dirs[3] + "stream/", events)))
+    if vgSpec2017Engine.available():
+        stages.append(("analyze --engine", annotatedMB, stageEngine, (bmkName, generated + ".stream", dirs[3] + "engine/", events)))
+    stages.append(("parse", rawMB, vgSpec2017Parser.parseCachegrindOut, (rawResult,)))
+    stages.append(("parse+analyze --native", rawMB, stageNative, (bmkName, rawResult, dirs[3] + "native/", events)))
+    baselineSeconds, baselineKB, ok = measure(doNothing)
+    measurements = []
+    for name, inputMB, stage, stageArgs in stages:
+        if name.startswith("reformat"):
+            freshCopy(generated, stageArgs[0])
+        seconds, peakKB, ok = measure(stage, *stageArgs)
+        measurements.append({"sizeMB": sizeMB, "stage": name, "inputMB": inputMB, "seconds": seconds,
+                             "mbPerSec": inputMB / seconds if seconds > 0 else None, "peakKB": peakKB,
+                             "overBaselineKB": peakKB - baselineKB if peakKB is not None and baselineKB is not None else None,
+                             "ok": ok})
+    return measurements
+
+#########################################
+#               REPORT                  #
+#########################################
+# RETURNS: the change from an earlier measurement as a percentage string, "" if there is none
+def changeFrom(before, after):
+    if before is None or after is None or before == 0:
+        return ""
+    return "{0:+.1f}%".format((after - before) * 100.0 / before)
+
+# Writes the measurements as a table, compared to the baseline measurements if given
+# ARGS: the measurements, {(size, stage) : measurement} of the baseline (empty for none)
+# RETURNS: nothing
+def writeReport(measurements, baseline):
+    columns = "{:>8} {:<24} {:>10} {:>10} {:>10} {:>10} {:>9} {:>9}\n"
+    sys.stdout.write("\n" + columns.format("Size MB", "Stage", "Input MB", "Seconds", "MB/s", "Peak MB", "MB/s", "Peak"))
+    sys.stdout.write(columns.format("", "", "", "", "", "", "vs base", "vs base"))
+    for m in measurements:
+        before = baseline.get((m["sizeMB"], m["stage"]), {})
+        peakMB = "{0:.1f}".format(m["peakKB"] / 1024.0) if m["peakKB"] is not None else "-"
+        rate = "{0:.1f}".format(m["mbPerSec"]) if m["mbPerSec"] is not None else "-"
+        if not m["ok"]:
+            rate = "FAILED"
+        sys.stdout.write(columns.format(m["sizeMB"], m["stage"], "{0:.1f}".format(m["inputMB"]), "{0:.2f}".format(m["seconds"]),
+                                        rate, peakMB, changeFrom(before.get("mbPerSec"), m["mbPerSec"]),
+                                        changeFrom(before.get("peakKB"), m["peakKB"])))
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments, with the size and event lists split out
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the throughput of vgSpec2017GetResults.py on synthetic results")
+    parser.add_argument("--sizes", default="1,16,128",
+                        help="comma separated sizes of the raw results to generate, in MB (default: 1,16,128)")
+    parser.add_argument("--files", type=int, default=20,
+                        help="the number of source files the results are spread over (default: 20)")
+    parser.add_argument("--events", default="DLmr,Bcm",
+                        help="comma separated events to find hotspots for (default: DLmr,Bcm)")
+    parser.add_argument("--workdir", help="where to generate the results (default: a temporary folder, removed after)")
+    parser.add_argument("--output", metavar="FILE", help="also write the measurements to FILE as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare to the measurements of an earlier --output")
+    args = parser.parse_args(argv)
+    try:
+        args.sizesMB = [float(size) if "." in size else int(size) for size in args.sizes.split(",") if size]
+    except ValueError:
+        parser.error("--sizes takes comma separated numbers of MB")
+    args.eventsToAnalyze = [event for event in args.events.split(",") if event]
+    for event in args.eventsToAnalyze:
+        if event not in vgSpec2017Parser.cgEvents:
+            parser.error("unknown event " + event + " (expected one of " + " ".join(vgSpec2017Parser.cgEvents) + ")")
+    if args.files < 1:
+        parser.error("--files needs at least one source file")
+    return args
+
+# Generates and measures every size asked for on the command line
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    args = parseArgs()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            for m in json.load(f)["measurements"]:
+                baseline[(m["sizeMB"], m["stage"])] = m
+    haveCgAnnotate = any(os.access(os.path.join(path, "cg_annotate"), os.X_OK) for path in os.environ.get("PATH", "").split(os.pathsep))
+    if not haveCgAnnotate:
+        sys.stdout.write("cg_annotate not found, the annotation stage is skipped\n")
+    workDir = args.workdir or tempfile.mkdtemp(prefix="vgSpecBench")
+    measurements = []
+    try:
+        for sizeMB in args.sizesMB:
+            measurements.extend(benchmarkSize(workDir, sizeMB, args.files, args.eventsToAnalyze, haveCgAnnotate))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workDir)
+    writeReport(measurements, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"python": sys.version.split()[0], "numpy": vgSpec2017Engine.available(),
+                       "measurements": measurements}, f, indent=4, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
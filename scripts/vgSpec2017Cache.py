@@ -0,0 +1,126 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Keeps parsed results on disk so a run's raw cachegrind output only
+# has to be parsed once. Each benchmark's EventTable is stored as an
+# .npz file in the run's "cache/" folder, keyed by a hash of the raw
+# result and the parser version. A changed result or a new parser
+# makes the key miss and the result is parsed again.
+#
+# Needs NumPy, same as vgSpec2017Engine.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import errno
+import zipfile
+import hashlib
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Compress
+
+# What a damaged .npz file raises on loading (zipfile.BadZipfile before Python 3.2)
+BadZipFile = getattr(zipfile, "BadZipFile", None) or zipfile.BadZipfile
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Hashes a file in chunks so large results never sit in memory
+# ARGS: the full path of the file
+# RETURNS: the hex SHA-1 of the file's contents
+def hashFile(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        chunk = f.read(1 << 20)
+        while chunk:
+            sha.update(chunk)
+            chunk = f.read(1 << 20)
+    return sha.hexdigest()
+
+# RETURNS: the cache key of a raw result: its hash plus the parser version
+def cacheKey(rawResult):
+    return hashFile(rawResult) + "-" + str(vgSpec2017Parser.PARSER_VERSION)
+
+# RETURNS: the cache file a raw result is kept in, the same whether or not the result is compressed
+def cacheFile(rawResult, cacheDir):
+    return os.path.join(cacheDir, os.path.basename(vgSpec2017Compress.stripCompression(rawResult))[:-4] + ".npz")
+
+# Makes a folder everyone can write to, unless it is already there
+# ARGS: the folder
+# RETURNS: nothing
+def makeDir(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        # Another job may have just made it
+        if e.errno != errno.EEXIST:
+            raise
+        return
+    os.chmod(path, 0o777)
+
+#########################################
+#           LOADING AND SAVING          #
+#########################################
+# Writes an EventTable to an .npz file
+# ARGS: the table, the cache key it belongs to, the file to write
+# RETURNS: nothing
+def saveTable(table, key, path):
+    np = vgSpec2017Engine.np
+    # Write to the side and rename, so a killed run never leaves half a cache file
+    tmpPath = vgSpec2017Compress.tempPath(path)
+    try:
+        with open(tmpPath, 'wb') as f:
+            np.savez_compressed(f, key=np.array(key), events=np.array(table.events, dtype=str),
+                                counts=table.counts, lines=table.lines, files=table.files, fns=table.fns,
+                                fileNames=np.array(table.fileNames, dtype=str), fnNames=np.array(table.fnNames, dtype=str),
+                                summary=np.array(table.summary, dtype=np.int64))
+        os.rename(tmpPath, path)
+    except BaseException:
+        if os.path.lexists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+# Reads an EventTable back from an .npz file
+# ARGS: the file to read, the key it has to have been saved with
+# RETURNS: the table, or None if the file is missing or was saved with another key
+def readTable(path, key):
+    np = vgSpec2017Engine.np
+    if not os.path.isfile(path):
+        return None
+    try:
+        # Opened here, so the file is closed even when np.load fails on it
+        with open(path, 'rb') as f:
+            with np.load(f) as data:
+                if str(data['key']) != key:
+                    return None
+                return vgSpec2017Engine.EventTable([str(e) for e in data['events']], data['counts'], data['lines'],
+                                                   data['files'], data['fns'], [str(n) for n in data['fileNames']],
+                                                   [str(n) for n in data['fnNames']], data['summary'])
+    except (IOError, ValueError, KeyError, EOFError, BadZipFile):
+        # A damaged cache file is just a miss
+        return None
+
+# Gets the EventTable of a raw result, parsing it only if the cache has no current copy
+# ARGS: the raw cachegrind output file, the folder the cache files are kept in
+# RETURNS: the table and whether it came from the cache
+def loadTable(rawResult, cacheDir):
+    key = cacheKey(rawResult)
+    path = cacheFile(rawResult, cacheDir)
+    table = readTable(path, key)
+    if table is not None:
+        return table, True
+    table = vgSpec2017Engine.fromCgTable(vgSpec2017Parser.parseCachegrindOut(rawResult))
+    makeDir(cacheDir)
+    saveTable(table, key, path)
+    return table, False
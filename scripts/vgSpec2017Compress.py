@@ -0,0 +1,141 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Compressed results. Raw cachegrind outputs and annotated results can be
+# kept as gzip (".gz") or zstd (".zst") files, and every reader of results
+# opens them through openResult, which decompresses while reading - a
+# compressed result is never unpacked to disk.
+#
+# gzip always works. zstd needs the zstandard module, everything else in
+# vgSpec 2017 runs without it.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import io
+import gzip
+import socket
+import shutil
+import fnmatch
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The file extension of every compression method
+compressExtensions = {
+    'gzip' : ".gz",
+    'zstd' : ".zst"
+}
+compressLevels = {
+    'gzip' : 6,
+    'zstd' : 3
+}
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# RETURNS: True if results can be written and read with the compression method
+def available(method):
+    return method == 'gzip' or (method == 'zstd' and zstandard is not None)
+
+# Names a temporary file next to a file, to write to the side and rename over it.
+# The name is unique to this host, process and thread, so writers racing on the
+# same file never write into each other's temporary file.
+# ARGS: the full path of the file
+# RETURNS: the temporary file's full path
+def tempPath(path):
+    return "%s.%s.%d.%d.tmp" % (path, socket.gethostname(), os.getpid(), threading.current_thread().ident)
+
+# RETURNS: the compression method of a file from its extension, None if it is not compressed
+def methodOf(path):
+    for method, ext in compressExtensions.items():
+        if path.endswith(ext):
+            return method
+    return None
+
+# RETURNS: the path without its compression extension
+def stripCompression(path):
+    method = methodOf(path)
+    if method is None:
+        return path
+    return path[0:-len(compressExtensions[method])]
+
+# RETURNS: the path of a result once compressed with the method (None for no compression)
+def compressedName(path, method):
+    path = stripCompression(path)
+    if method is None:
+        return path
+    return path + compressExtensions[method]
+
+# Finds a result whether it was kept plain or compressed
+# ARGS: the path of the uncompressed result
+# RETURNS: the path of the result that exists, None if there is none
+def findResult(path):
+    for candidate in [path] + [path + ext for ext in sorted(compressExtensions.values())]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+# Lists the result files in a folder, plain or compressed
+# ARGS: the folder, the pattern of an uncompressed result (i.e. "*.*.txt")
+# RETURNS: the matching file names
+def listResults(folder, pattern):
+    names = os.listdir(folder)
+    found = fnmatch.filter(names, pattern)
+    for ext in compressExtensions.values():
+        found.extend(fnmatch.filter(names, pattern + ext))
+    return found
+
+#########################################
+#           READING AND WRITING         #
+#########################################
+# Opens a result for reading or writing, decompressing or compressing on the fly
+# ARGS: the path, the mode ('r', 'w', 'rb' or 'wb'), the compression method
+# (default: the one the path's extension names)
+# RETURNS: a file object
+def openResult(path, mode='r', method=None):
+    if method is None:
+        method = methodOf(path)
+    if method is None:
+        return open(path, mode)
+    binary = 'b' in mode or sys.version_info[0] < 3
+    if method == 'gzip':
+        return gzip.open(path, mode[0] + ('b' if binary else 't'), compressLevels['gzip'])
+    if zstandard is None:
+        raise IOError("the zstandard module is needed for " + path)
+    if mode[0] == 'w':
+        cctx = zstandard.ZstdCompressor(level=compressLevels['zstd'])
+        return zstandard.open(path, mode[0] + ('b' if binary else 't'), cctx=cctx)
+    if binary:
+        # The bare zstd reader cannot read by line
+        return io.BufferedReader(zstandard.open(path, 'rb'), 1 << 20)
+    return zstandard.open(path, 'rt')
+
+# Compresses a result, replacing the plain file
+# ARGS: the path of the plain result, the compression method
+# RETURNS: the path of the compressed result
+def compressFile(path, method):
+    compressedPath = compressedName(path, method)
+    # Write to the side and rename, so a killed run never leaves half a result
+    tmpPath = tempPath(compressedPath)
+    with open(path, 'rb') as src:
+        with openResult(tmpPath, 'wb', method) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    os.rename(tmpPath, compressedPath)
+    os.remove(path)
+    return compressedPath
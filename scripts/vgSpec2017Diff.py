@@ -0,0 +1,192 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Compares two vgSpec 2017 runs (i.e. two compiler flags or cache
+# configurations) benchmark by benchmark. Both runs' raw results are
+# lined up by source file, function and line number, and the lines
+# whose events changed the most are reported.
+#
+# Args to this script
+#   1) The name of the directory of the baseline run's results (i.e. "3_21_vgRun")
+#   2) The name of the directory of the run to compare to it (i.e. "4_02_vgRun")
+#   --events    The events to compare (default: DLmr,Bcm)
+#   --top       The most regressions and improvements to report per event (default: 10)
+#   --jobs N    Compare N benchmarks at once (default: 1)
+#   --workspace DIR  The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#               else /local/alec/cole_workspace/)
+#
+# The reports go in "diff_<baseline run>/" in the compared run's results folder.
+# Needs NumPy. Parsed tables are cached the same way as vgSpec2017GetResults.py --native.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import multiprocessing
+import argparse
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Cache
+import vgSpec2017Compress
+import vgSpec2017Jobs
+from vgSpec2017GetResults import findResults, makeResultsDir
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Finds a benchmark's raw result in a run, whether or not it has been moved into raw/ yet
+# and whether or not it is compressed
+# ARGS: the root results directory of the run, the name of the result file
+# RETURNS: the full path of the raw result
+def findRawResult(root, filename):
+    rawResult = vgSpec2017Compress.findResult(root + "raw/" + filename)
+    if rawResult is not None:
+        return rawResult
+    return vgSpec2017Compress.findResult(root + filename) or root + filename
+
+# RETURNS: the change as a percentage of the baseline, as a string
+def percentChange(before, after):
+    if before == 0:
+        return "new" if after else "0.00 %"
+    return "{0:+.2f} %".format((after - before) * 100.0 / before)
+
+#########################################
+#              COMPARISON               #
+#########################################
+# Writes the rows of one side of an event's changes
+# ARGS: the open output file, the AlignedTables, the rows to write, the event's column
+# RETURNS: nothing
+def writeChanges(out, aligned, rows, eventIndex):
+    before = aligned.counts[0][:, eventIndex]
+    after = aligned.counts[1][:, eventIndex]
+    out.write("    {:<40} {:<30} {:>7} {:>16} {:>16} {:>16}\n".format("Source File", "Function", "Line", "Before", "After", "Change"))
+    out.write("    {:<40} {:<30} {:>7} {:>16} {:>16} {:>16}\n".format("-----------", "--------", "----", "------", "-----", "------"))
+    for i in rows:
+        out.write("    {:<40} {:<30} {:>7} {:>16,} {:>16,} {:>+16,}\n".format(
+            os.path.basename(aligned.fileNames[aligned.files[i]]), aligned.fnNames[aligned.fns[i]][:30],
+            int(aligned.lines[i]), int(before[i]), int(after[i]), int(after[i] - before[i])))
+
+# Compares one benchmark between two runs and writes its report
+# ARGS: the benchmark's result file name, the (baseline, compared) root results
+# directories, the output directory, the events to compare, the most changes to report
+# RETURNS: {event : (baseline total, compared total)}
+def diffBenchmark(filename, roots, outputDir, eventsToCompare, topInstructions):
+    bmkName = filename[0:-4]
+    tables = []
+    for root in roots:
+        table, cached = vgSpec2017Cache.loadTable(findRawResult(root, filename), root + "cache/")
+        tables.append(table)
+    aligned = vgSpec2017Engine.AlignedTables(tables[0], tables[1])
+    totals = {}
+    with open(outputDir + bmkName + ".txt", 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ DIFFERENCES FOR " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n"
+        out.write(header)
+        for event in eventsToCompare:
+            if event not in aligned.events:
+                continue
+            eventIndex = aligned.events.index(event)
+            before = int(aligned.counts[0][:, eventIndex].sum())
+            after = int(aligned.counts[1][:, eventIndex].sum())
+            totals[event] = (before, after)
+            out.write("\n" + event + ": " + "{:,}".format(before) + " -> " + "{:,}".format(after) + " (" + percentChange(before, after) + ")\n\n")
+            regressions, improvements = aligned.topChanges(event, topInstructions)
+            out.write("  Largest regressions\n")
+            writeChanges(out, aligned, regressions, eventIndex)
+            out.write("\n  Largest improvements\n")
+            writeChanges(out, aligned, improvements, eventIndex)
+        out.write("-------------------------------------------------------------------------------------------------\n")
+    return totals
+
+# Runs diffBenchmark on a (filename, roots, outputDir, events, top) tuple, for the process pool
+# RETURNS: the benchmark name and its totals
+def diffBenchmarkTask(task):
+    return task[0][0:-4], diffBenchmark(*task)
+
+# Writes the per-benchmark totals of every compared event
+# ARGS: the summary file, the (baseline, compared) run names, {benchmark : totals}, the events
+# RETURNS: nothing
+def writeDiffSummary(summaryOutputFile, runs, allTotals, eventsToCompare):
+    with open(summaryOutputFile, 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ " + runs[1] + " COMPARED TO " + runs[0] + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n\n"
+        out.write(header)
+        out.write(("{:<20}" + " {:>24}" * len(eventsToCompare)).format("Benchmark", *eventsToCompare) + "\n")
+        for bmkName in sorted(allTotals):
+            totals = allTotals[bmkName]
+            changes = [percentChange(*totals[event]) if event in totals else "-" for event in eventsToCompare]
+            out.write(("{:<20}" + " {:>24}" * len(eventsToCompare)).format(bmkName, *changes) + "\n")
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments, with the event list split out
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the results of two vgSpec 2017 runs")
+    parser.add_argument("baseline", help="the name of the directory of the baseline run's results (i.e. \"3_21_vgRun\")")
+    parser.add_argument("compared", help="the name of the directory of the run to compare to it (i.e. \"4_02_vgRun\")")
+    parser.add_argument("--events", default="DLmr,Bcm",
+                        help="comma separated events to compare (default: DLmr,Bcm)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="the most regressions and improvements to report per event (default: 10)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="the number of benchmarks to compare at once (default: 1)")
+    parser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                        help="the folder holding spec/ and vgSpec2017/ (default: " + vgSpec2017Jobs.defaultWorkspace + ")")
+    args = parser.parse_args(argv)
+    args.eventsToCompare = [event for event in args.events.split(",") if event]
+    for event in args.eventsToCompare:
+        if event not in vgSpec2017Parser.cgEvents:
+            parser.error("unknown event " + event + " (expected one of " + " ".join(vgSpec2017Parser.cgEvents) + ")")
+    if not vgSpec2017Engine.available():
+        parser.error("comparing runs needs NumPy")
+    return args
+
+# Compares every benchmark the two runs named on the command line have in common
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    args = parseArgs()
+    resultDir = os.path.join(os.path.abspath(args.workspace), "vgSpec2017", "results")
+    roots = (os.path.join(resultDir, args.baseline, ""), os.path.join(resultDir, args.compared, ""))
+    files = [set(findResults(root, root + "raw/")) for root in roots]
+    for root, only in zip(roots, (files[0] - files[1], files[1] - files[0])):
+        for filename in sorted(only):
+            sys.stdout.write("Skipping " + filename[0:-4] + ", only " + root + " has it\n")
+    outputDir = roots[1] + "diff_" + args.baseline + "/"
+    makeResultsDir(outputDir)
+    tasks = [(filename, roots, outputDir, args.eventsToCompare, args.top) for filename in sorted(files[0] & files[1])]
+    allTotals = {}
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            for bmkName, totals in pool.imap_unordered(diffBenchmarkTask, tasks):
+                sys.stdout.write("Compared " + bmkName + "\n")
+                allTotals[bmkName] = totals
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            bmkName, totals = diffBenchmarkTask(task)
+            sys.stdout.write("Compared " + bmkName + "\n")
+            allTotals[bmkName] = totals
+    writeDiffSummary(outputDir + "summary.txt", (args.baseline, args.compared), allTotals, args.eventsToCompare)
+    sys.stdout.write("Comparison complete. Please see " + outputDir + "\n")
+
+if __name__ == "__main__":
+    main()
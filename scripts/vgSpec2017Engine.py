@@ -0,0 +1,292 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Column-oriented analysis of a benchmark's results. The 13 cachegrind
+# event columns are read once into NumPy arrays, and every hotspot list
+# and derived metric is then worked out from those arrays.
+#
+# Needs NumPy. Everything else in vgSpec 2017 runs without it.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import vgSpec2017Parser
+import vgSpec2017Compress
+
+#########################################
+#           DERIVED METRICS             #
+#########################################
+# Each metric is sum(numerator events) / sum(denominator events) * scale
+derivedMetrics = {
+    'D1mrate'  : (['D1mr', 'D1mw'], ['Dr', 'Dw'], 100.0),                 # D1 miss rate (%)
+    'LLdmrate' : (['DLmr', 'DLmw'], ['Dr', 'Dw'], 100.0),                 # LL data miss rate (%)
+    'LLmrate'  : (['ILmr', 'DLmr', 'DLmw'], ['Ir', 'Dr', 'Dw'], 100.0),   # LL miss rate (%)
+    'Bmrate'   : (['Bcm', 'Bim'], ['Bc', 'Bi'], 100.0),                   # Branch mispredict rate (%)
+    'D1MPKI'   : (['D1mr', 'D1mw'], ['Ir'], 1000.0),                      # D1 misses per 1000 instructions
+    'LLMPKI'   : (['ILmr', 'DLmr', 'DLmw'], ['Ir'], 1000.0),              # LL misses per 1000 instructions
+    'BrMPKI'   : (['Bcm', 'Bim'], ['Ir'], 1000.0)                         # Branch mispredicts per 1000 instructions
+}
+
+# Works out a derived metric from a benchmark's program totals (no NumPy needed)
+# ARGS: the metric name (see derivedMetrics), {event : total}
+# RETURNS: the metric (0 if the denominator is 0), None if the totals lack an event it needs
+def metricFromTotals(name, totals):
+    numerator, denominator, scale = derivedMetrics[name]
+    if any(event not in totals for event in numerator + denominator):
+        return None
+    den = sum(totals[event] for event in denominator)
+    if den == 0:
+        return 0.0
+    return sum(totals[event] for event in numerator) * scale / float(den)
+
+# RETURNS: True if NumPy could be imported
+def available():
+    return np is not None
+
+#########################################
+#             EVENT TABLE               #
+#########################################
+# One row per source line (or per source line and function), one column per event
+#   events    : the event names, in column order
+#   counts    : rows x events array of event counts
+#   lines     : the line number of every row
+#   files     : index into fileNames of every row
+#   fns       : index into fnNames of every row (all 0 when functions are not known)
+#   summary   : the program totals, one count per event (default: the sum of every row)
+class EventTable(object):
+    def __init__(self, events, counts, lines, files, fns, fileNames, fnNames, summary=None):
+        self.events = list(events)
+        self.counts = counts
+        self.lines = lines
+        self.files = files
+        self.fns = fns
+        self.fileNames = list(fileNames)
+        self.fnNames = list(fnNames)
+        if summary is None:
+            summary = self.totals()
+        self.summary = [int(x) for x in summary]
+
+    def eventIndex(self, event):
+        return self.events.index(event)
+
+    # RETURNS: the count of the event on every row
+    def column(self, event):
+        return self.counts[:, self.eventIndex(event)]
+
+    # RETURNS: the total of the event over every row
+    def total(self, event):
+        return int(self.column(event).sum())
+
+    # RETURNS: the totals of every event as a list
+    def totals(self):
+        return [int(x) for x in self.counts.sum(axis=0)]
+
+    # Picks the hot rows for an event the same way analyzeHotspots does: the hottest rows
+    # that make up <percentToAnalyze> of all events, cut off at <topInstructions>
+    # RETURNS: the hot row indexes, hottest first
+    def hotRows(self, event, percentToAnalyze, topInstructions):
+        column = self.column(event)
+        # Stable so ties go to the earlier row
+        order = np.argsort(-column, kind='stable')
+        threshold = percentToAnalyze * float(column.sum())
+        # Rows needed before the running total reaches the threshold
+        before = np.cumsum(column[order]) - column[order]
+        needed = int(np.count_nonzero(before < threshold))
+        return order[:min(needed, topInstructions)]
+
+    # Sums the event per (source file, line number) over every function
+    # RETURNS: {(source file, line number) : count} for every line with a nonzero count
+    def lineTotals(self, event):
+        column = self.column(event)
+        keys = np.stack([self.files, self.lines], axis=1)
+        uniqueKeys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        sums = np.bincount(inverse.ravel(), weights=column, minlength=len(uniqueKeys))
+        totals = {}
+        for i in np.nonzero(sums)[0]:
+            totals[(self.fileNames[uniqueKeys[i, 0]], int(uniqueKeys[i, 1]))] = int(sums[i])
+        return totals
+
+    # Sums every event per group (i.e. self.files or self.fns), one bincount per event column
+    # RETURNS: groups x events array of counts
+    def groupTotals(self, groups, numGroups):
+        sums = np.zeros((numGroups, len(self.events)), dtype=np.int64)
+        for i in range(len(self.events)):
+            sums[:, i] = np.bincount(groups, weights=self.counts[:, i], minlength=numGroups)
+        return sums
+
+    # RETURNS: True if the rows know which function they belong to (not so for annotated files)
+    def hasFunctions(self):
+        return self.fnNames != ["???"]
+
+    # Rolls the rows up by source file ("fl") or by function ("fn"). Functions are told
+    # apart by their source file as well, since static functions may share a name.
+    # ARGS: "fl" or "fn"
+    # RETURNS: (group names, groups x events array of counts)
+    def rollup(self, by):
+        if by == "fl":
+            return list(self.fileNames), self.groupTotals(self.files, len(self.fileNames))
+        numFns = max(len(self.fnNames), 1)
+        uniqueKeys, groups = np.unique(self.files * numFns + self.fns, return_inverse=True)
+        names = [self.fileNames[key // numFns] + ":" + self.fnNames[key % numFns] for key in uniqueKeys]
+        return names, self.groupTotals(groups.ravel(), len(uniqueKeys))
+
+    # Ranks the source files or functions by an event
+    # ARGS: the event, "fl" or "fn", the most groups to return
+    # RETURNS: [(name, count)] for the hottest groups with a nonzero count, hottest first,
+    # and the total of the event over every row
+    def topGroups(self, event, by, topGroups):
+        names, sums = self.rollup(by)
+        column = sums[:, self.eventIndex(event)]
+        # Stable so ties go to the group seen first
+        order = np.argsort(-column, kind='stable')[:topGroups]
+        return [(names[i], int(column[i])) for i in order if column[i] > 0], int(column.sum())
+
+    # Works out a derived metric for every row of a counts array
+    # ARGS: the metric name (see derivedMetrics), a rows x events array (default: every row)
+    # RETURNS: the metric per row, 0 where the denominator is 0
+    def metric(self, name, counts=None):
+        if counts is None:
+            counts = self.counts
+        numerator, denominator, scale = derivedMetrics[name]
+        num = counts[..., [self.eventIndex(e) for e in numerator]].sum(axis=-1).astype(np.float64)
+        den = counts[..., [self.eventIndex(e) for e in denominator]].sum(axis=-1).astype(np.float64)
+        out = np.zeros(np.shape(num))
+        np.divide(num * scale, den, out=out, where=den > 0)
+        return out
+
+    # RETURNS: the derived metric over the whole benchmark
+    def totalMetric(self, name):
+        return float(self.metric(name, self.counts.sum(axis=0)))
+
+#########################################
+#          COMPARING TABLES             #
+#########################################
+# Lines two tables up row for row by (source file, function, line number), so runs
+# can be compared without re-parsing or re-annotating either one
+#   events    : the events both tables have, in the first table's order
+#   counts    : (a counts, b counts) - rows x events arrays, 0 where a table has no such row
+#   lines, files, fns, fileNames, fnNames : the aligned rows, as in EventTable
+class AlignedTables(object):
+    def __init__(self, a, b):
+        self.events = [e for e in a.events if e in b.events]
+        fileIds = {}
+        fnIds = {}
+        keys = []
+        for table in (a, b):
+            # Give both tables the same file and function ids
+            fileMap = np.array([fileIds.setdefault(n, len(fileIds)) for n in table.fileNames], dtype=np.int64)
+            fnMap = np.array([fnIds.setdefault(n, len(fnIds)) for n in table.fnNames], dtype=np.int64)
+            keys.append((fileMap[table.files], fnMap[table.fns], table.lines))
+        # Pack every (file, function, line) into one integer, so the rows can be
+        # matched with a 1-D sort
+        numFns = max(len(fnIds), 1)
+        numLines = int(max([lines.max() for f, fn, lines in keys if len(lines)] + [0])) + 1
+        packed = [(f * numFns + fn) * numLines + lines for f, fn, lines in keys]
+        uniqueKeys, inverse = np.unique(np.concatenate(packed), return_inverse=True)
+        self.counts = []
+        start = 0
+        for table, tableKeys in zip((a, b), packed):
+            counts = np.zeros((len(uniqueKeys), len(self.events)), dtype=np.int64)
+            columns = table.counts[:, [table.eventIndex(e) for e in self.events]]
+            np.add.at(counts, inverse[start:start + len(tableKeys)], columns)
+            self.counts.append(counts)
+            start += len(tableKeys)
+        self.counts = tuple(self.counts)
+        self.lines = uniqueKeys % numLines
+        self.fns = (uniqueKeys // numLines) % numFns
+        self.files = uniqueKeys // numLines // numFns
+        self.fileNames = sorted(fileIds, key=fileIds.get)
+        self.fnNames = sorted(fnIds, key=fnIds.get)
+
+    # RETURNS: the change (b - a) of every event on every row
+    def deltas(self):
+        return self.counts[1] - self.counts[0]
+
+    # Picks the rows that changed the most for an event
+    # ARGS: the event, the most rows to return
+    # RETURNS: (regressions, improvements) - the row indexes that grew the most, biggest
+    # first, and the ones that shrank the most, biggest first
+    def topChanges(self, event, topInstructions):
+        delta = self.deltas()[:, self.events.index(event)]
+        regressions = np.argsort(-delta, kind='stable')[:topInstructions]
+        improvements = np.argsort(delta, kind='stable')[:topInstructions]
+        return regressions[delta[regressions] > 0], improvements[delta[improvements] < 0]
+
+#########################################
+#           BUILDING TABLES             #
+#########################################
+# Builds an event table from a table parsed by vgSpec2017Parser, one row per
+# (source file, function, line number)
+# ARGS: a CgTable
+# RETURNS: an EventTable
+def fromCgTable(cgTable):
+    fileIds = {}
+    fnIds = {}
+    rows = []
+    lines = []
+    files = []
+    fns = []
+    for (fl, fn), fnLines in cgTable.functions.items():
+        fileId = fileIds.setdefault(fl, len(fileIds))
+        fnId = fnIds.setdefault(fn, len(fnIds))
+        for lineNo, counts in fnLines.items():
+            rows.append(counts)
+            lines.append(lineNo)
+            files.append(fileId)
+            fns.append(fnId)
+    fileNames = sorted(fileIds, key=fileIds.get)
+    fnNames = sorted(fnIds, key=fnIds.get)
+    counts = np.array(rows, dtype=np.int64).reshape(len(rows), len(cgTable.events))
+    return EventTable(cgTable.events, counts, np.array(lines, dtype=np.int64),
+                      np.array(files, dtype=np.int64), np.array(fns, dtype=np.int64), fileNames, fnNames, cgTable.summary)
+
+# Builds an event table from a reformatted (line numbered) cg_annotate file in one
+# pass. Keeps the rows analyzeHotspots would look at, with the annotated file's
+# line number as the line and the "Auto-annotated source" section as the file.
+# ARGS: the full path of the reformatted annotated file
+# RETURNS: an EventTable
+def fromAnnotated(resultToAnalyze):
+    numEvents = len(vgSpec2017Parser.cgEvents)
+    fileIds = {}
+    rows = []
+    lines = []
+    files = []
+    dataStart = False
+    fileId = 0
+    with vgSpec2017Compress.openResult(resultToAnalyze) as annotatedFile:
+        for line in annotatedFile:
+            if ("Auto-annotated source" in line):
+                dataStart = True
+                fileId = fileIds.setdefault(line.split(None, 1)[1].split(":", 1)[-1].strip(), len(fileIds))
+            elif (dataStart and "percentage of events annotated" in line):
+                dataStart = False
+            elif (dataStart):
+                splitData = line.split(None, numEvents + 1)
+                # Need the line number and every event column, and no comment lines
+                if (len(splitData) > numEvents and "-" not in splitData[1]):
+                    try:
+                        counts = [int(x.replace(',', '')) if x != '.' else 0 for x in splitData[1:numEvents + 1]]
+                    except ValueError:
+                        continue
+                    rows.append(counts)
+                    lines.append(int(splitData[0]))
+                    files.append(fileId)
+    fileNames = sorted(fileIds, key=fileIds.get)
+    counts = np.array(rows, dtype=np.int64).reshape(len(rows), numEvents)
+    return EventTable(vgSpec2017Parser.cgEvents, counts, np.array(lines, dtype=np.int64),
+                      np.array(files, dtype=np.int64), np.zeros(len(rows), dtype=np.int64), fileNames, ["???"])
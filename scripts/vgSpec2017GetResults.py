@@ -7,6 +7,27 @@
 #
 # Args to this script
 #   1) The name of the dirctory of the run's results (i.e. "3_21_vgRun")
+#   --native    Parse the raw cachegrind output directly instead of running cg_annotate
+#   --stream    Reformat and analyze the annotated results in bounded memory
+#   --engine    Analyze every event from one NumPy table per benchmark (needs NumPy)
+#   --events    The events to find hotspots for (default: DLmr,Bcm)
+#   --metrics   The derived metrics to report, see vgSpec2017Engine.derivedMetrics
+#   --rollup    Also rank the functions and source files by each event (needs NumPy)
+#   --percent, --region, --top  The share of events to cover, the lines of code
+#               around each hotspot and the most hotspots to report
+#   --jobs N    Process N benchmarks at once (default: 1)
+#   --compress  Keep the raw and annotated results compressed: gzip or zstd (zstd needs
+#               the zstandard module). Defaults to how the Manager stored the raw results.
+#   --no-cache  Always re-parse the raw results in --native mode instead of using
+#               the parsed tables cached in the run's "cache/" folder
+#   --workspace DIR  The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#               else /local/alec/cole_workspace/)
+#
+# The rollups are written to "formatted/<benchmark>/rollup.txt". Functions are only
+# known in --native mode, annotated results are rolled up by source file alone.
+#
+# Runs made with --toggle-collect hold callgrind output, which cg_annotate cannot
+# read, so they are always analyzed as if --native was given.
 #
 # NOTE: This Software is provided AS IS.
 # If we did not have as much control over these parameters
@@ -30,10 +51,37 @@ from collections import deque
 import re
 import csv
 import fnmatch
+import linecache
+import heapq
+import bisect
+import shutil
+import multiprocessing
+import threading
+import argparse
+import json
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Cache
+import vgSpec2017Index
+import vgSpec2017Summary
+import vgSpec2017Compress
+import vgSpec2017Jobs
 
 #########################################
 #           UTILITY FUNCTIONS           #
 #########################################
+# Makes a folder with the permissions every results folder gets
+# ARGS: the full path of the folder to make
+# RETURNS: nothing
+def makeResultsDir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        os.chmod(path, 0o777)
+
 # Formats the results folder into raw valgrind outputs and annotated ones
 # ARGS: the root results directory, the raw results directory to make,
 # the annotated results directory to make, and a temporary copy of the annotated results
@@ -41,46 +89,52 @@ import fnmatch
 def prepResultsFolder(root, raw, annotated, formatted):
     # Make the dirs
     sys.stdout.write("Preparing results folder...")
-    makeDirCmd = "mkdir -m 777 " + raw
-    makeDir = subprocess.Popen(makeDirCmd, shell = True)
-    makeDir.communicate()
-    makeDirCmd = "mkdir -m 777 " + annotated
-    makeDir = subprocess.Popen(makeDirCmd, shell = True)
-    makeDir.communicate()
-    makeDirCmd = "mkdir -m 777 " + formatted
-    makeDir = subprocess.Popen(makeDirCmd, shell = True)
-    makeDir.communicate()
-    # Copy the raw results
-    copyResCmd = "cp " + root + "*.*.txt " + raw
-    copyRes = subprocess.Popen(copyResCmd, shell = True)
-    copyRes.communicate()
-    # Delete the old copies
-    delResCmd = "rm " + root + "*.*.txt "
-    delRes = subprocess.Popen(delResCmd, shell = True)
-    delRes.communicate()
-    # Making the final formatted results directories
-    for root,dirs,files in os.walk(raw):
-        for filename in files:
-            newFile = formatted + "/" + filename[:-4] + "/"
-            makeDirCmd = "mkdir -m 777 " + newFile
-            makeDir = subprocess.Popen(makeDirCmd, shell = True)
-            makeDir.communicate()
-            makeDirCmd = "mkdir -m 777 " + newFile + "branch/"
-            makeDir = subprocess.Popen(makeDirCmd, shell = True)
-            makeDir.communicate()
-            makeDirCmd = "mkdir -m 777 " + newFile + "cache/"
-            makeDir = subprocess.Popen(makeDirCmd, shell = True)
-            makeDir.communicate()
+    makeResultsDir(raw)
+    makeResultsDir(annotated)
+    makeResultsDir(formatted)
     sys.stdout.write("done\n")
 
+# Moves one benchmark's raw result into the raw folder and makes its formatted folders
+# ARGS: the root results directory, the raw results directory, the formatted results
+# directory, the name of the result file (i.e. "505.mcf_r.txt"), the compression method
+# to keep the raw result in (default: leave it as it is)
+# RETURNS: the full path of the raw result
+def prepBenchmarkFolder(root, raw, formatted, filename, compress=None):
+    # Move the raw result, unless an earlier pass already did
+    rootResult = vgSpec2017Compress.findResult(root + filename)
+    if rootResult is not None:
+        shutil.copy(rootResult, raw + os.path.basename(rootResult))
+        os.remove(rootResult)
+    rawResult = vgSpec2017Compress.findResult(raw + filename)
+    if compress and rawResult is not None and vgSpec2017Compress.methodOf(rawResult) is None:
+        rawResult = vgSpec2017Compress.compressFile(rawResult, compress)
+    # Making the final formatted results directories
+    newFile = formatted + filename[:-4] + "/"
+    makeResultsDir(newFile)
+    makeResultsDir(newFile + "branch/")
+    makeResultsDir(newFile + "cache/")
+    return rawResult
+
+# Gets (and makes if needed) the directory the hotspot files for an event go in.
+# DLmr goes in "cache/" and Bcm in "branch/" as always, anything else in a folder of its own.
+# ARGS: the formatted results directory, the benchmark name, the event (string)
+# RETURNS: the directory, ending in "/"
+def getEventOutputDir(fmtDir, bmkName, event):
+    eventDirs = {'DLmr' : "cache/", 'Bcm' : "branch/"}
+    outputDir = fmtDir + bmkName + "/" + eventDirs.get(event, event + "/")
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+        os.chmod(outputDir, 0o777)
+    return outputDir
+
 # The main payload of this script. Finds the hotspots for the given event in the given
 # benchmark and grabs the region of code each one lies within. It then generates a file
 # for each hotspot and its region, as well as a summary file for all hotspots of the benchmark
 # ARGS: the benchmark name, the annotated result file, directory of formatted results,
 # the summary output file, the event to analyze (string), the percentage to analyze (decimal < 1),
-# the number of lines above and below the hot spot to grab
+# the number of lines above and below the hot spot to grab, the most hotspots to report
 # RETURNS: nothing
-def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze):
+def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze, topInstructions=10):
     sys.stdout.write("Beginning hotspot search on " + bmkName + "...")
     # Switch on the event to find the column which is cared about
     switchOnEvent = {
@@ -104,10 +158,14 @@ def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile,
     eventData = []
     sortedEventData = []
     splitData = []
-    rawData = open(resultToAnalyze).readlines()
+    with vgSpec2017Compress.openResult(resultToAnalyze) as annotatedFile:
+        rawData = annotatedFile.readlines()
     dataStart = False
     totalEvents = 0
+    sectionLines = [] # Where every "Auto-annotated source" header is, for finding a line's source
     for line in range(len(rawData)):
+        if (line > 0 and "Auto-annotated source" in rawData[line]):
+            sectionLines.append(line)
         # Wait until the first source annotated shows up
         if (not dataStart and "Auto-annotated source" in rawData[line]):
             dataStart = True
@@ -154,9 +212,8 @@ def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile,
         out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*header))
         out.write('\n')
 
-    # For now we'll only do the analysis on the top 10 (if there are at least 10)
-    topInstructions = 10
-    if len(hotList) < 10:
+    # Only do the analysis on the top <topInstructions> (if there are that many)
+    if len(hotList) < topInstructions:
         topInstructions = len(hotList)
     percAccum = 0
     eventAccum = 0
@@ -165,26 +222,22 @@ def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile,
         k = hotList[j][0]
         code = []
         source = ""
-        # First get the source file the hot instruction is from by walking up
-        while (k > 0):
-            if ("Auto-annotated source" in rawData[k]):
-                source = rawData[k].split(None, 1)[1]
-                break
-            k -= 1
+        # First get the source file the hot instruction is from: the last header at or above it
+        section = bisect.bisect_right(sectionLines, k) - 1
+        if (section >= 0):
+            source = rawData[sectionLines[section]].split(None, 1)[1]
         # We grab the region of code around the hot instruction
         while (i <= (hotList[j][0] + regionToAnalyze)):
-            # To avoid an out of range error
-            if (i < len(rawData)):
-                if (rawData[i].split() > 14):
-                    if (len(rawData[i].split(None, 14)) > 14):
-                        # A little confusing, but just grabs the line number, the data point, and the code for that line while preserving tabs
-                        buff = [str(rawData[i].split(None, 14)[0]), str(rawData[i].split(None, 14)[eventIndex]), str(rawData[i].split(None, 13)[-1].split(' ',1)[1]).rstrip()]
-                        code.append('{0:<20} {1:<20} {2}'.format(*buff))
+            # To avoid an out of range error (or wrapping around to the end of the file)
+            if (0 <= i < len(rawData)):
+                regionLine = formatRegionLine(rawData[i], eventIndex)
+                if regionLine is not None:
+                    code.append(regionLine)
             i += 1
         # Writing to the ouput file for this hotspot
         # TODO: Add file name to indivOutputFile by searching up until file is found
         indivOutputFile = indivOutputDir + "top" + str(j+1) + ".txt"
-        with open(indivOutputFile, 'a') as out:
+        with open(indivOutputFile, 'w') as out:
             # Prepare the header to the output file
             percOfTotal = str(float(hotList[j][1])/float(totalEvents)*100.0)
             header = "--------------------------------------------------------------------------------------------------\n"
@@ -204,14 +257,389 @@ def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile,
                 out.write('\n')
         # Iteratively update the final summary file
         with open(summaryOutputFile, 'a') as out:
-            value = rawData[hotList[j][0]].split(None, 14)[eventIndex]
-            value = value.replace(',' , '') if value != '.' else '0'
+            summaryLine, value, percent = formatSummaryLine(rawData[hotList[j][0]], eventIndex, totalEvents)
+            percAccum += percent
+            eventAccum += value
+            out.write(summaryLine)
+            out.write('\n')
+
+    # Finish the summary file
+    with open(summaryOutputFile, 'a') as out:
+        footer = "-------------------------------------------------------------------------------------------------\n"
+        out.write(footer)
+        footer = ['TOTALS', str(eventAccum), str(percAccum)[0:5] + ' %',' ']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*footer))
+        out.write('\n')
+    sys.stdout.write("done\n")
+
+# Formats one line of an annotated region for a hotspot's output file
+# ARGS: the reformatted annotated line, the column of the event
+# RETURNS: the formatted line, or None if the line holds no source code
+def formatRegionLine(rawLine, eventIndex):
+    splitLine = rawLine.split(None, 14)
+    if (len(splitLine) > 14):
+        # A little confusing, but just grabs the line number, the data point, and the code for that line while preserving tabs
+        buff = [str(splitLine[0]), str(splitLine[eventIndex]), str(rawLine.split(None, 13)[-1].split(' ',1)[1]).rstrip()]
+        return '{0:<20} {1:<20} {2}'.format(*buff)
+    return None
+
+# Formats a hot line of an annotated file for the summary file
+# ARGS: the reformatted annotated line, the column of the event, the total number of events
+# RETURNS: the formatted line, the event count and its percent of the total
+def formatSummaryLine(rawLine, eventIndex, totalEvents):
+    splitLine = rawLine.split(None, 14)
+    value = splitLine[eventIndex]
+    value = value.replace(',' , '') if value != '.' else '0'
+    percent = float(value)/float(totalEvents) * 100.0
+    percentstr = str(percent)[0:5] + " %"
+    # Similar buffer to the region lines, only including the percentage
+    buff = [str(splitLine[0]), str(splitLine[eventIndex]), percentstr, str(splitLine[-1].rstrip())]
+    return '{0:^20} {1:^20} {2:^20} {3}'.format(*buff), int(value), percent
+
+# Streams the (line number, event count) pair of every annotated source line in a
+# reformatted annotated file - the same lines analyzeHotspots collects
+# ARGS: the open annotated file, the column of the event
+# RETURNS: a generator of (line number, event count)
+def iterAnnotatedEvents(annotatedFile, eventIndex):
+    dataStart = False
+    for line in annotatedFile:
+        # Wait until the first source annotated shows up
+        if (not dataStart and "Auto-annotated source" in line):
+            dataStart = True
+        # Process until the final summary is seen
+        elif (dataStart and "percentage of events annotated" in line):
+            dataStart = False
+        elif (dataStart):
+            splitData = line.split()
+            # Make sure this line has at least an expected number of columns and is not a comment
+            if (len(splitData) > eventIndex and "-" not in splitData[1]):
+                value = splitData[eventIndex].replace(',' , '') if splitData[eventIndex] != '.' else '0'
+                if (value.isdigit()):
+                    yield (int(splitData[0]), int(value))
+
+# Collects the lines around each hot line of a reformatted annotated file. The file is
+# indexed in one pass, then each region is a binary search plus a slice of the mapped file.
+# The index keeps an offset for every line, so it is only worth building where one index
+# serves the regions of every event at once (see analyzeHotspotsEngine). A compressed
+# file cannot be mapped, so its regions are picked out in one forward pass.
+# ARGS: the annotated file, the annotated line numbers of the hot lines, the number of
+# lines above and below each hot line to grab
+# RETURNS: {line number : line} for every line in a region, and
+# {hot line number : the "Auto-annotated source" header above it}
+def collectRegions(resultToAnalyze, hotLineNos, regionToAnalyze):
+    if vgSpec2017Compress.methodOf(resultToAnalyze):
+        return collectRegionsStream(resultToAnalyze, hotLineNos, regionToAnalyze)
+    index = vgSpec2017Index.AnnotatedIndex(resultToAnalyze)
+    regionData = {}
+    sources = {}
+    try:
+        for lineNo in hotLineNos:
+            regionData.update(index.lines(lineNo - regionToAnalyze, lineNo + regionToAnalyze))
+            sources[lineNo] = index.source(lineNo)
+    finally:
+        index.close()
+    return regionData, sources
+
+# Same as collectRegions, in one forward pass over the file keeping only the lines in
+# the regions, so memory does not grow with the size of the file
+def collectRegionsStream(resultToAnalyze, hotLineNos, regionToAnalyze):
+    hotSet = set(hotLineNos)
+    hotLineNos = sorted(hotSet)
+    regionData = {}
+    sources = {}
+    header = ""
+    nextHot = 0
+    with vgSpec2017Compress.openResult(resultToAnalyze) as annotatedFile:
+        for i, line in enumerate(annotatedFile):
+            # Line 0 is never taken as a header, same as analyzeHotspots
+            if (i > 0 and "Auto-annotated source" in line):
+                header = line.split(None, 1)[1]
+            # Skip the regions that end before this line
+            while nextHot < len(hotLineNos) and hotLineNos[nextHot] + regionToAnalyze < i:
+                nextHot += 1
+            if nextHot == len(hotLineNos):
+                break
+            if hotLineNos[nextHot] - regionToAnalyze <= i:
+                regionData[i] = line
+            if i in hotSet:
+                sources[i] = header
+    return regionData, sources
+
+# Writes the summary file and a file per hotspot, in the same format as analyzeHotspots
+# ARGS: the benchmark name, the hot (line number, event count) list, the total number of
+# events, the lines and sources from collectRegions, directory of formatted results, the
+# summary output file, the event (string), the number of lines above and below the hot spot
+# RETURNS: nothing
+def writeHotspotFiles(bmkName, hotList, totalEvents, regionData, sources, indivOutputDir, summaryOutputFile, eventToAnalyze, regionToAnalyze):
+    eventIndex = vgSpec2017Parser.cgEvents.index(eventToAnalyze) + 1
+    # Before doing the processing, prepare the final summary file
+    sys.stdout.write("Generating output files for " + bmkName + "...")
+    with open(summaryOutputFile, 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ SUMMARY OF TOP INSTRUCTIONS FOR " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n\n"
+        out.write(header)
+        header = ['Line Number', eventToAnalyze, 'Percent of Total','Instruction']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*header))
+        out.write('\n')
+        header = ['-----------', '------', '----------------', '-----------']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*header))
+        out.write('\n')
+
+    percAccum = 0
+    eventAccum = 0
+    for j in range(len(hotList)):
+        lineNo, value = hotList[j]
+        code = []
+        for i in range(lineNo - regionToAnalyze, lineNo + regionToAnalyze + 1):
+            if i in regionData:
+                regionLine = formatRegionLine(regionData[i], eventIndex)
+                if regionLine is not None:
+                    code.append(regionLine)
+        # Writing to the ouput file for this hotspot
+        indivOutputFile = indivOutputDir + "top" + str(j+1) + ".txt"
+        with open(indivOutputFile, 'w') as out:
+            # Prepare the header to the output file
+            percOfTotal = str(float(value)/float(totalEvents)*100.0)
+            header = "--------------------------------------------------------------------------------------------------\n"
+            header = header + "--- Hot Instruction Number " + str(j+1) + " has " + str(value) + " events associated with it (" + percOfTotal[0:5] + " % of total events) ---\n"
+            header = header + "--------------------------------------------------------------------------------------------------\n"
+            header = header + sources[lineNo] + "\n"
+            out.write(header)
+            header = ['Line Number', eventToAnalyze, 'Instruction']
+            out.write('{0:<20} {1:<20} {2}'.format(*header))
+            out.write('\n')
+            header = ['------', '------', '------']
+            out.write('{0:<20} {1:<20} {2}'.format(*header))
+            out.write('\n')
+            # Write all of the lines to the file
+            for line in code:
+                out.write(line)
+                out.write('\n')
+        # Iteratively update the final summary file
+        with open(summaryOutputFile, 'a') as out:
+            summaryLine, lineValue, percent = formatSummaryLine(regionData[lineNo], eventIndex, totalEvents)
+            percAccum += percent
+            eventAccum += lineValue
+            out.write(summaryLine)
+            out.write('\n')
+
+    # Finish the summary file
+    with open(summaryOutputFile, 'a') as out:
+        footer = "-------------------------------------------------------------------------------------------------\n"
+        out.write(footer)
+        footer = ['TOTALS', str(eventAccum), str(percAccum)[0:5] + ' %',' ']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*footer))
+        out.write('\n')
+    sys.stdout.write("done\n")
+
+# Streaming version of analyzeHotspots. Makes one pass over the annotated file keeping
+# only a running total and a heap of the <topInstructions> hottest lines, then a second
+# pass to pick up just the regions around those lines. Peak memory no longer grows with
+# the size of the file, and the output files match analyzeHotspots.
+# ARGS: same as analyzeHotspots
+# RETURNS: nothing
+def analyzeHotspotsStream(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze, topInstructions=10):
+    sys.stdout.write("Beginning hotspot search on " + bmkName + "...")
+    eventIndex = vgSpec2017Parser.cgEvents.index(eventToAnalyze) + 1
+
+    # Keep the hottest lines in a min-heap. Ties go to the earlier line, same as the
+    # stable sort in analyzeHotspots, so the order counter is negated.
+    heap = []
+    totalEvents = 0
+    with vgSpec2017Compress.openResult(resultToAnalyze) as annotatedFile:
+        for order, (lineNo, value) in enumerate(iterAnnotatedEvents(annotatedFile, eventIndex)):
+            totalEvents += value
+            item = (value, -order, lineNo)
+            if len(heap) < topInstructions:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    topList = [(lineNo, value) for value, order, lineNo in sorted(heap, reverse=True)]
+    sys.stdout.write("search complete\n")
+    # Determine how many of the top lines it takes to cover <percentToAnalyze> percent
+    hotList = []
+    threshold = percentToAnalyze * float(totalEvents)
+    accumulator = 0
+    for hotLine in topList:
+        if (accumulator >= threshold):
+            break
+        hotList.append(hotLine)
+        accumulator += hotLine[1]
+
+    # Second pass: keep only the lines in each hot region and the source each hot line is from
+    regionData, sources = collectRegionsStream(resultToAnalyze, [lineNo for lineNo, value in hotList], regionToAnalyze)
+    writeHotspotFiles(bmkName, hotList, totalEvents, regionData, sources, indivOutputDir, summaryOutputFile, eventToAnalyze, regionToAnalyze)
+
+# Analyzes any number of events at once on a reformatted annotated file. The file is read
+# once into an EventTable to find every event's hot lines, and once more to grab the
+# regions around all of them. Output files match analyzeHotspots.
+# ARGS: the benchmark name, the annotated result file, directory of formatted results for
+# this run, the events to analyze (list of strings), the percentage to analyze (decimal < 1),
+# the number of lines above and below the hot spot to grab, the most hotspots to report,
+# the derived metrics to report (list of strings), whether to write the function and file rollups
+# RETURNS: nothing
+def analyzeHotspotsEngine(bmkName, resultToAnalyze, fmtDir, eventsToAnalyze, percentToAnalyze, regionToAnalyze, topInstructions, metricsToReport, rollup=False):
+    sys.stdout.write("Beginning hotspot search on " + bmkName + "...")
+    table = vgSpec2017Engine.fromAnnotated(resultToAnalyze)
+    hotLists = {}
+    for eventToAnalyze in eventsToAnalyze:
+        column = table.column(eventToAnalyze)
+        hotLists[eventToAnalyze] = [(int(table.lines[row]), int(column[row])) for row in table.hotRows(eventToAnalyze, percentToAnalyze, topInstructions)]
+    sys.stdout.write("search complete\n")
+    hotLineNos = set()
+    for hotList in hotLists.values():
+        hotLineNos.update(lineNo for lineNo, value in hotList)
+    regionData, sources = collectRegions(resultToAnalyze, sorted(hotLineNos), regionToAnalyze)
+    for eventToAnalyze in eventsToAnalyze:
+        indivOutputDir = getEventOutputDir(fmtDir, bmkName, eventToAnalyze)
+        writeHotspotFiles(bmkName, hotLists[eventToAnalyze], table.total(eventToAnalyze), regionData, sources,
+                          indivOutputDir, indivOutputDir + "summary.txt", eventToAnalyze, regionToAnalyze)
+    if metricsToReport:
+        writeMetrics(bmkName, table, metricsToReport, fmtDir + bmkName + "/metrics.txt")
+    if rollup:
+        writeRollups(bmkName, table, eventsToAnalyze, topInstructions, fmtDir + bmkName + "/rollup.txt")
+
+# Writes the derived metrics of a benchmark, over the whole benchmark and per source file
+# ARGS: the benchmark name, its EventTable, the metrics to report (list of strings), the output file
+# RETURNS: nothing
+def writeMetrics(bmkName, table, metricsToReport, metricsOutputFile):
+    fileTotals = table.groupTotals(table.files, len(table.fileNames))
+    fileMetrics = [table.metric(name, fileTotals) for name in metricsToReport]
+    # List the files with the most instructions first
+    fileOrder = vgSpec2017Engine.np.argsort(-fileTotals[:, table.eventIndex('Ir')], kind='stable')
+    with open(metricsOutputFile, 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ DERIVED METRICS FOR " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n\n"
+        out.write(header)
+        row = ['TOTAL'] + ['{0:.4f}'.format(table.totalMetric(name)) for name in metricsToReport]
+        out.write(('{:<50}' + ' {:>12}' * len(metricsToReport)).format('Source File', *metricsToReport))
+        out.write('\n')
+        out.write(('{:<50}' + ' {:>12}' * len(metricsToReport)).format(*row))
+        out.write('\n')
+        out.write("-------------------------------------------------------------------------------------------------\n")
+        for i in fileOrder:
+            row = [table.fileNames[i]] + ['{0:.4f}'.format(values[i]) for values in fileMetrics]
+            out.write(('{:<50}' + ' {:>12}' * len(metricsToReport)).format(*row))
+            out.write('\n')
+
+# Writes the functions and source files with the most of each event, so hotspots spread
+# over many lines (a loop nest, inlined helpers) show up as one entry
+# ARGS: the benchmark name, its EventTable, the events to rank by (list of strings), the
+# most functions and files to list, the output file
+# RETURNS: nothing
+def writeRollups(bmkName, table, eventsToAnalyze, topGroups, rollupOutputFile):
+    groupings = [("fn", "FUNCTIONS"), ("fl", "SOURCE FILES")] if table.hasFunctions() else [("fl", "SOURCE FILES")]
+    with open(rollupOutputFile, 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ FUNCTION AND FILE ROLLUPS FOR " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n"
+        out.write(header)
+        if not table.hasFunctions():
+            out.write("Functions are not known for annotated results, use --native to roll up by function\n")
+        for eventToAnalyze in eventsToAnalyze:
+            for by, title in groupings:
+                topList, totalEvents = table.topGroups(eventToAnalyze, by, topGroups)
+                explained = sum(value for name, value in topList)
+                out.write("\n------------------------ " + eventToAnalyze + " BY " + title + " ------------------------\n")
+                out.write("Top " + str(len(topList)) + " " + title.lower() + " account for " + "{:,}".format(explained) +
+                          " of " + "{:,}".format(totalEvents) + " " + eventToAnalyze + " (" + percentOf(explained, totalEvents) + ")\n")
+                out.write("{:>4} {:>20} {:>8} {:>8}  {}\n".format("Rank", eventToAnalyze, "%", "Cum. %", "Name"))
+                cumulative = 0
+                for rank, (name, value) in enumerate(topList):
+                    cumulative += value
+                    out.write("{:>4} {:>20} {:>8} {:>8}  {}\n".format(rank + 1, "{:,}".format(value), percentOf(value, totalEvents),
+                                                                    percentOf(cumulative, totalEvents), name))
+
+# RETURNS: part as a percentage of whole, formatted for the output files
+def percentOf(part, whole):
+    return "{0:.2f}%".format(part * 100.0 / whole) if whole else "0.00%"
+
+# Same analysis as analyzeHotspots, but on a table parsed straight from the raw
+# cachegrind output. Line numbers are source line numbers and the source text is
+# only read for the lines that end up in the output files.
+# ARGS: the benchmark name, the parsed table (a CgTable or an EventTable), directory of
+# formatted results, the summary output file, the event to analyze (string), the percentage
+# to analyze (decimal < 1), the number of lines above and below the hot spot to grab,
+# the most hotspots to report
+# RETURNS: nothing
+def analyzeTableHotspots(bmkName, table, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze, topInstructions=10):
+    sys.stdout.write("Beginning hotspot search on " + bmkName + "...")
+    lineTotals = table.lineTotals(eventToAnalyze)
+    totalEvents = sum(lineTotals.values())
+    # Sort the lines by most number of events
+    eventData = sorted(lineTotals.items(), key=lambda x:x[1], reverse=True)
+    sys.stdout.write("search complete\n")
+    # Determine the top <percentToAnalyze> percent of the hot lines
+    hotList = []
+    threshold = percentToAnalyze * float(totalEvents)
+    accumulator = 0
+    iterator = 0
+    while (accumulator < threshold):
+        hotList.append(eventData[iterator])
+        accumulator += eventData[iterator][1]
+        iterator += 1
+
+    # Before doing the processing, prepare the final summary file
+    sys.stdout.write("Generating output files for " + bmkName + "...")
+    with open(summaryOutputFile, 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ SUMMARY OF TOP INSTRUCTIONS FOR " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n\n"
+        out.write(header)
+        header = ['Line Number', eventToAnalyze, 'Percent of Total','Instruction']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*header))
+        out.write('\n')
+        header = ['-----------', '------', '----------------', '-----------']
+        out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*header))
+        out.write('\n')
+
+    # Only do the analysis on the top <topInstructions> (if there are that many)
+    if len(hotList) < topInstructions:
+        topInstructions = len(hotList)
+    percAccum = 0
+    eventAccum = 0
+    for j in range(topInstructions):
+        (source, lineNo), value = hotList[j]
+        # We grab the region of code around the hot line straight from the source file
+        code = []
+        for i in range(max(1, lineNo - regionToAnalyze), lineNo + regionToAnalyze + 1):
+            text = linecache.getline(source, i)
+            if text:
+                count = lineTotals.get((source, i), 0)
+                buff = [str(i), "{:,}".format(count) if count else '.', text.rstrip()]
+                code.append('{0:<20} {1:<20} {2}'.format(*buff))
+        # Writing to the ouput file for this hotspot
+        indivOutputFile = indivOutputDir + "top" + str(j+1) + ".txt"
+        with open(indivOutputFile, 'w') as out:
+            # Prepare the header to the output file
+            percOfTotal = str(float(value)/float(totalEvents)*100.0)
+            header = "--------------------------------------------------------------------------------------------------\n"
+            header = header + "--- Hot Instruction Number " + str(j+1) + " has " + str(value) + " events associated with it (" + percOfTotal[0:5] + " % of total events) ---\n"
+            header = header + "--------------------------------------------------------------------------------------------------\n"
+            header = header + source + "\n\n"
+            out.write(header)
+            header = ['Line Number', eventToAnalyze, 'Instruction']
+            out.write('{0:<20} {1:<20} {2}'.format(*header))
+            out.write('\n')
+            header = ['------', '------', '------']
+            out.write('{0:<20} {1:<20} {2}'.format(*header))
+            out.write('\n')
+            # Write all of the lines to the file
+            if not code:
+                out.write("(source not available)\n")
+            for line in code:
+                out.write(line)
+                out.write('\n')
+        # Iteratively update the final summary file
+        with open(summaryOutputFile, 'a') as out:
             percent = float(value)/float(totalEvents) * 100.0
             percAccum += percent
-            eventAccum += int(value)
+            eventAccum += value
             percentstr = str(percent)[0:5] + " %"
-            # Similar buffer to before, only including the percentage
-            buff = [str(rawData[hotList[j][0]].split(None, 14)[0]), str(rawData[hotList[j][0]].split(None, 14)[eventIndex]), percentstr, str(rawData[hotList[j][0]].split(None, 14)[-1].rstrip())]
+            instruction = os.path.basename(source) + ": " + linecache.getline(source, lineNo).strip()
+            buff = [str(lineNo), "{:,}".format(value), percentstr, instruction]
             out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*buff))
             out.write('\n')
 
@@ -222,13 +650,14 @@ def analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile,
         footer = ['TOTALS', str(eventAccum), str(percAccum)[0:5] + ' %',' ']
         out.write('{0:^20} {1:^20} {2:^20} {3}'.format(*footer))
         out.write('\n')
+    linecache.clearcache()
     sys.stdout.write("done\n")
 
 #########################################
 #      DEFINE ABSOLUTE DIRECTORIES      #
 #########################################
 # Absolute path to the workspace
-baseOperatingDir = "/local/alec/cole_workspace/"
+baseOperatingDir = os.path.join(os.path.abspath(vgSpec2017Jobs.defaultWorkspace), "")
 #Base directories for vgSpec2017(ours) and spec2017(spec's)
 spec2017Dir = baseOperatingDir + "spec/"
 vgSpecDir = baseOperatingDir + "vgSpec2017/"
@@ -250,81 +679,245 @@ spec2017RunDir = "run/" # NOTE: relative path - but its the same for every bmk
 #########################################
 #            HANDLE CLA                 #
 #########################################
-sys.stdout.write("Parsing directory arg...")
-if (len(sys.argv) != 2):
-    USAGE = ("\nUSAGE\t:\n" +
-            "\t\"python vgSpec2017GetResults.py <1>\"\n" +
-            "\t<1> = The name of the directory of the run's results (i.e. \"3_21_vgRun\")")
-    print USAGE
-    quit()
-else:
-    vgSpecThisResultsDir = vgResultDir + sys.argv[1] + "/"
-    vgSpecThisResultsRaw = vgSpecThisResultsDir + "raw/"
-    vgSpecThisResultsAnn = vgSpecThisResultsDir + "annotated/"
-    vgSpecThisResultsFmt = vgSpecThisResultsDir + "formatted/"
-    # Make the raw and annoted directories as well as the temporary
-    sys.stdout.write("done\n")
-    prepResultsFolder(vgSpecThisResultsDir, vgSpecThisResultsRaw, vgSpecThisResultsAnn, vgSpecThisResultsFmt)
+# Parses the command line of this script
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments, with the event and metric lists split out
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Organize a vgSpec 2017 run's results and find their hotspots")
+    parser.add_argument("run", help="the name of the directory of the run's results (i.e. \"3_21_vgRun\")")
+    parser.add_argument("--native", action="store_true",
+                        help="parse the raw cachegrind output directly instead of running cg_annotate")
+    parser.add_argument("--stream", action="store_true",
+                        help="reformat and analyze the annotated results in bounded memory")
+    parser.add_argument("--engine", action="store_true",
+                        help="analyze every event from one NumPy table per benchmark")
+    parser.add_argument("--events", default="DLmr,Bcm",
+                        help="comma separated events to find hotspots for (default: DLmr,Bcm)")
+    parser.add_argument("--metrics", default="",
+                        help="comma separated derived metrics to report (" + ",".join(sorted(vgSpec2017Engine.derivedMetrics)) + ")")
+    parser.add_argument("--rollup", action="store_true",
+                        help="also rank the functions and source files by each event")
+    parser.add_argument("--percent", type=float, default=.90,
+                        help="share of the events the hotspots are picked from (default: .90)")
+    parser.add_argument("--region", type=int, default=30,
+                        help="lines of code to grab above and below each hotspot (default: 30)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="the most hotspots to report per event (default: 10)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="the number of benchmarks to process at once (default: 1)")
+    parser.add_argument("--compress", choices=sorted(vgSpec2017Compress.compressExtensions), default=None,
+                        help="keep the raw and annotated results compressed (default: as the Manager stored them)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="always re-parse the raw results in --native mode")
+    parser.add_argument("--workspace", default=baseOperatingDir,
+                        help="the folder holding spec/ and vgSpec2017/ (default: " + baseOperatingDir + ")")
+    args = parser.parse_args(argv)
+    args.eventsToAnalyze = [event for event in args.events.split(",") if event]
+    args.metricsToReport = [metric for metric in args.metrics.split(",") if metric]
+    for event in args.eventsToAnalyze:
+        if event not in vgSpec2017Parser.cgEvents:
+            parser.error("unknown event " + event + " (expected one of " + " ".join(vgSpec2017Parser.cgEvents) + ")")
+    for metric in args.metricsToReport:
+        if metric not in vgSpec2017Engine.derivedMetrics:
+            parser.error("unknown metric " + metric)
+    if (args.engine or args.metricsToReport or args.rollup) and not vgSpec2017Engine.available():
+        parser.error("--engine, --metrics and --rollup need NumPy")
+    if args.compress and not vgSpec2017Compress.available(args.compress):
+        parser.error("--compress " + args.compress + " needs the zstandard module")
+    return args
 
 #########################################
-#        ANNOTATION OF RESULTS          #
+#        PROCESSING OF RESULTS          #
 #########################################
-# Walk through all of the results files and annotate
-files = os.listdir(vgSpecThisResultsRaw)
-pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
-sys.stdout.write("Annotating all results...")
-for file in files:
-    if fnmatch.fnmatch(file, pattern):
-        # NOTE: This annotate is not going to work locally because we do not have the source locally, so we cannot test it locally
-        annotateCmd = "cg_annotate --auto=yes " + vgSpecThisResultsRaw + file + " > " + vgSpecThisResultsAnn + file
+# Runs cg_annotate on a raw result
+# ARGS: the raw result file, the annotated file to write (either may be compressed)
+# RETURNS: nothing
+def annotateResult(rawResult, annotatedResult):
+    # NOTE: This annotate is not going to work locally because we do not have the source locally, so we cannot test it locally
+    if not vgSpec2017Compress.methodOf(rawResult) and not vgSpec2017Compress.methodOf(annotatedResult):
+        annotateCmd = "cg_annotate --auto=yes " + rawResult + " > " + annotatedResult
         annotateRes = subprocess.Popen(annotateCmd, shell = True)
         annotateRes.communicate()
-sys.stdout.write("done\n")
+        return
+    # cg_annotate reads the result from a pipe and its output is compressed as it comes,
+    # so nothing is ever unpacked to disk
+    annotateRes = subprocess.Popen(["cg_annotate", "--auto=yes", "/dev/stdin"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feeder = threading.Thread(target=feedPipe, args=(rawResult, annotateRes.stdin))
+    feeder.start()
+    with vgSpec2017Compress.openResult(annotatedResult, 'wb') as out:
+        shutil.copyfileobj(annotateRes.stdout, out, 1 << 20)
+    feeder.join()
+    annotateRes.wait()
 
-#########################################
-#          SORTING OF RESULTS           #
-#########################################
-# Walk through all of the results files and annotate
-files = os.listdir(vgSpecThisResultsAnn)
-pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
-data = [] # Holds the entire text dump of the annotated results
-sys.stdout.write("Reformatting annotated results...")
-for file in files:
-    if fnmatch.fnmatch(file, pattern):
-        data = open(vgSpecThisResultsAnn + file).readlines()
-        # Prepend a line number to each line
-        i = 0
-        for line in range(len(data)):
-            data[line] = str(i) + "\t" + data[line]
-            i += 1
-        # Write the formatted data back to the file
-        with open(vgSpecThisResultsAnn + file, 'w') as updatedData:
-            for item in data:
-                updatedData.write(item)
-sys.stdout.write("done\n")
-
-# Analyze the hotspots for every benchmark
-files = os.listdir(vgSpecThisResultsAnn)
-pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
-for file in files:
-    # Only do analysis if there is an annotated copy
-    if fnmatch.fnmatch(file, pattern):
-        # Prepare the function call
-        bmkName = file[0:-4]
-        resultToAnalyze = vgSpecThisResultsAnn + file
-        indivOutputDir = vgSpecThisResultsFmt + bmkName +"/cache/"
-        summaryOutputFile = indivOutputDir + "summary.txt"
-        eventToAnalyze = "DLmr"
-        percentToAnalyze = .90
-        regionToAnalyze = 30
-        # Do the analysis on DLmr
-        analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze)
-        # Do the analysis on Bcm
-        indivOutputDir = vgSpecThisResultsFmt + bmkName + "/branch/"
+# Writes a (possibly compressed) result, decompressed, into a pipe and closes it
+# ARGS: the result file, the pipe
+# RETURNS: nothing
+def feedPipe(result, pipe):
+    try:
+        with vgSpec2017Compress.openResult(result, 'rb') as src:
+            shutil.copyfileobj(src, pipe, 1 << 20)
+    except (IOError, OSError):
+        # The reader quit early, it has its own error to report
+        pass
+    finally:
+        try:
+            pipe.close()
+        except (IOError, OSError):
+            pass
+
+# Prepends a line number to every line of an annotated result
+# ARGS: the annotated file (may be compressed), whether to stream it instead of holding it in memory
+# RETURNS: nothing
+def reformatResult(annotatedResult, stream):
+    method = vgSpec2017Compress.methodOf(annotatedResult)
+    if stream:
+        # Copy line by line into a temporary file instead of holding the whole file
+        with vgSpec2017Compress.openResult(annotatedResult) as data:
+            with vgSpec2017Compress.openResult(annotatedResult + ".tmp", 'w', method) as updatedData:
+                for i, item in enumerate(data):
+                    updatedData.write(str(i) + "\t" + item)
+        os.rename(annotatedResult + ".tmp", annotatedResult)
+        return
+    with vgSpec2017Compress.openResult(annotatedResult) as annotatedFile:
+        data = annotatedFile.readlines()
+    # Prepend a line number to each line
+    i = 0
+    for line in range(len(data)):
+        data[line] = str(i) + "\t" + data[line]
+        i += 1
+    # Write the formatted data back to the file
+    with vgSpec2017Compress.openResult(annotatedResult, 'w') as updatedData:
+        for item in data:
+            updatedData.write(item)
+
+# Runs the whole pipeline on one benchmark: folder prep, then either the native
+# parse or cg_annotate and reformatting, then the hotspot analysis
+# ARGS: the name of the result file (i.e. "505.mcf_r.txt"), the parsed arguments,
+# the (root, raw, annotated, formatted) results directories
+# RETURNS: nothing
+def processBenchmark(file, args, resultDirs):
+    root, raw, annotated, formatted = resultDirs
+    bmkName = file[0:-4]
+    rawResult = prepBenchmarkFolder(root, raw, formatted, file, args.compress)
+    # Parse the raw result once and run every analysis on the parsed table
+    if args.native:
+        sys.stdout.write("Parsing " + bmkName + "...")
+        if args.cache and vgSpec2017Engine.available():
+            # Only parsed if the result changed since the table was cached
+            table, cached = vgSpec2017Cache.loadTable(rawResult, root + "cache/")
+            if cached:
+                sys.stdout.write("loaded from cache...")
+        else:
+            table = vgSpec2017Parser.parseCachegrindOut(rawResult)
+            if args.engine or args.metricsToReport or args.rollup:
+                table = vgSpec2017Engine.fromCgTable(table)
+        sys.stdout.write("done\n")
+        for eventToAnalyze in args.eventsToAnalyze:
+            indivOutputDir = getEventOutputDir(formatted, bmkName, eventToAnalyze)
+            analyzeTableHotspots(bmkName, table, indivOutputDir, indivOutputDir + "summary.txt", eventToAnalyze, args.percent, args.region, args.top)
+        if args.metricsToReport:
+            writeMetrics(bmkName, table, args.metricsToReport, formatted + bmkName + "/metrics.txt")
+        if args.rollup:
+            writeRollups(bmkName, table, args.eventsToAnalyze, args.top, formatted + bmkName + "/rollup.txt")
+        return
+    # Otherwise annotate and reformat
+    sys.stdout.write("Annotating " + bmkName + "...")
+    resultToAnalyze = vgSpec2017Compress.compressedName(annotated + file, args.compress)
+    annotateResult(rawResult, resultToAnalyze)
+    sys.stdout.write("done\n")
+    sys.stdout.write("Reformatting " + bmkName + "...")
+    reformatResult(resultToAnalyze, args.stream)
+    sys.stdout.write("done\n")
+    # Analyze the hotspots
+    # Every event at once from a single table
+    if args.engine or args.metricsToReport or args.rollup:
+        analyzeHotspotsEngine(bmkName, resultToAnalyze, formatted, args.eventsToAnalyze, args.percent, args.region, args.top, args.metricsToReport, args.rollup)
+        return
+    # Otherwise do the analysis on each event (DLmr and Bcm by default)
+    analyze = analyzeHotspotsStream if args.stream else analyzeHotspots
+    for eventToAnalyze in args.eventsToAnalyze:
+        indivOutputDir = getEventOutputDir(formatted, bmkName, eventToAnalyze)
         summaryOutputFile = indivOutputDir + "summary.txt"
-        eventToAnalyze = "Bcm"
-        analyzeHotspots(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, percentToAnalyze, regionToAnalyze)
-sys.stdout.write("Job has completed. Please see the results folder for this run.\n")
+        analyze(bmkName, resultToAnalyze, indivOutputDir, summaryOutputFile, eventToAnalyze, args.percent, args.region, args.top)
+
+# Runs processBenchmark with its progress messages held back, so benchmarks
+# processed at the same time never interleave their output
+# ARGS: a (file, args, resultDirs) tuple for processBenchmark
+# RETURNS: the progress messages of the benchmark
+def processBenchmarkTask(task):
+    realStdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        processBenchmark(*task)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = realStdout
+
+# Reads the settings the Manager recorded for a run (see run_info.json)
+# ARGS: the root results directory
+# RETURNS: the settings as a dict, empty for runs made before they were recorded
+def readRunInfo(root):
+    try:
+        with open(root + "run_info.json") as runInfoFile:
+            return json.load(runInfoFile)
+    except (IOError, OSError, ValueError):
+        return {}
+
+# Lists every result of the run, whether or not it has been moved into raw/ yet
+# ARGS: the root results directory, the raw results directory
+# RETURNS: the sorted result file names, without the extension of compressed results
+def findResults(root, raw):
+    pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
+    files = set(vgSpec2017Compress.stripCompression(f) for f in vgSpec2017Compress.listResults(root, pattern))
+    if os.path.isdir(raw):
+        files.update(vgSpec2017Compress.stripCompression(f) for f in vgSpec2017Compress.listResults(raw, pattern))
+    return sorted(files)
+
+# Organizes and analyzes every result of the run named on the command line
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    sys.stdout.write("Parsing directory arg...")
+    args = parseArgs()
+    vgSpecThisResultsDir = os.path.join(os.path.abspath(args.workspace), "vgSpec2017", "results", args.run) + "/"
+    vgSpecThisResultsRaw = vgSpecThisResultsDir + "raw/"
+    vgSpecThisResultsAnn = vgSpecThisResultsDir + "annotated/"
+    vgSpecThisResultsFmt = vgSpecThisResultsDir + "formatted/"
+    resultDirs = (vgSpecThisResultsDir, vgSpecThisResultsRaw, vgSpecThisResultsAnn, vgSpecThisResultsFmt)
+    # Make the raw and annoted directories as well as the temporary
+    sys.stdout.write("done\n")
+    prepResultsFolder(vgSpecThisResultsDir, vgSpecThisResultsRaw, vgSpecThisResultsAnn, vgSpecThisResultsFmt)
+    runInfo = readRunInfo(vgSpecThisResultsDir)
+    if runInfo:
+        sys.stdout.write("Run simulated the " + runInfo.get("workload", "ref") + " workload with " + runInfo.get("tool", "cachegrind") + "\n")
+    # cg_annotate only reads cachegrind output
+    if runInfo.get("tool") == "callgrind" and not args.native:
+        sys.stdout.write("Region-of-interest run, parsing the raw results natively\n")
+        args.native = True
+    # Keep the results compressed the same way the Manager did
+    if args.compress is None and vgSpec2017Compress.available(runInfo.get("compress")):
+        args.compress = runInfo.get("compress")
+
+    # Every benchmark goes through its own pipeline, one after another or in a process pool
+    tasks = [(file, args, resultDirs) for file in findResults(vgSpecThisResultsDir, vgSpecThisResultsRaw)]
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            for progress in pool.imap_unordered(processBenchmarkTask, tasks):
+                sys.stdout.write(progress)
+                sys.stdout.flush()
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            processBenchmark(*task)
+    # Totals of every benchmark side by side, for ranking the suite
+    rows = vgSpec2017Summary.buildRunSummary(vgSpecThisResultsDir, max(args.jobs, 1))
+    failedRows = [row for row in rows if row.get("failed")]
+    sys.stdout.write("Summarized " + str(len(rows)) + " benchmarks in " + vgSpecThisResultsDir + vgSpec2017Summary.summaryCsvName +
+                     (" (" + str(len(failedRows)) + " FAILED: " + " ".join(row["benchmark"] for row in failedRows) + ")" if failedRows else "") + "\n")
+    sys.stdout.write("Job has completed. Please see the results folder for this run.\n")
 
 #########################################
 #           UNUSED FUNCTIONS            #
@@ -341,49 +934,17 @@ sys.stdout.write("Job has completed. Please see the results folder for this run.
 # We have left them in for this reason.
 
 # *** THIS FUNCTION IS UNUSED ***
-# Loops through all benchmarcks in the directory and sorts them by the event
-# ARGS: the resuls directory being worked with, a string of the event to sort by
+# Sorts all benchmarks of the run by the event (or derived metric), using the run summary
+# so only the summary line at the end of each raw result is read
+# ARGS: the root results directory of the run, a string of the event to sort by
 # RETURNS: a list of the benchmarks sorted by the event: "benchmark.name <tab> #"
 def sortBenchmarksBy(resDir, eventToSortBy):
-    # Prep the return list
-    sortedBenchmarks = []
     fmtedSortedBenchmarks = []
-    # Switch on the event to find the column which is cared about
-    switchOnEvent = {
-            'Ir'    : 1,
-            'I1mr'  : 2,
-            'ILmr'  : 3,
-            'Dr'    : 4,
-            'D1mr'  : 5,
-            'DLmr'  : 6,
-            'Dw'    : 7,
-            'D1mw'  : 8,
-            'DLmw'  : 9,
-            'Bc'    : 10,
-            'Bcm'   : 11,
-            'Bi'    : 12,
-            'Bim'   : 13
-    }
-    eventIndex = switchOnEvent.get(eventToSortBy, "NA")
-    # Loop through every file for sorting
-    files = os.listdir(resDir)
-    pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
-    for file in files:
-        if fnmatch.fnmatch(file, pattern):
-            # Get all of the lines in the file
-            data = open(resDir + file).readlines()
-            for line in range(len(data)):
-                data[line] = data[line].split()
-                # Look for the program totals line
-                if ("PROGRAM" in data[line] and "TOTALS" in data[line]):
-                    value = int(data[line][eventIndex].replace(',' , ''))
-                    sortedBenchmarks.append((file, value))
-    # Sort the list by most number of events
-    sortedBenchmarks.sort(key=lambda x:x[1], reverse=True)
-    for bmk in sortedBenchmarks:
+    rows = vgSpec2017Summary.buildRunSummary(resDir)
+    for bmkName, value in vgSpec2017Summary.rankBenchmarks(rows, eventToSortBy):
         # Excuse the syntax, this is just for good looking printing
-        num = "{:,}".format(bmk[1])
-        tmpStr = "%-30s %s" % (bmk[0], num)
+        num = "{:,}".format(value) if isinstance(value, int) else "{0:.4f}".format(value)
+        tmpStr = "%-30s %s" % (bmkName + ".txt", num)
         fmtedSortedBenchmarks.append(tmpStr)
     return fmtedSortedBenchmarks
 
@@ -427,3 +988,6 @@ def getUserSortParameters(resDir):
         else:
             continue
     return sortEvent
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Random access into a reformatted (line numbered) cg_annotate file.
+# One forward pass records the byte offset of every line and where
+# every "Auto-annotated source" section starts. After that, finding
+# the source of a line is a binary search and pulling out a region of
+# lines is a slice of the memory-mapped file, no matter how long the
+# file is.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import mmap
+import bisect
+from array import array
+
+# Turns bytes read from the file into the same text reading it in text mode gives
+def _text(data):
+    if isinstance(data, str):
+        return data
+    return data.decode("utf-8", "replace")
+
+class AnnotatedIndex(object):
+    # Builds the index in one forward pass over the file
+    # ARGS: the full path of the reformatted annotated file
+    def __init__(self, path):
+        self.path = path
+        self.offsets = array('l', [0])  # offsets[i] is where line i starts, offsets[-1] is the file size
+        self.sectionLines = []          # line number of every "Auto-annotated source" header
+        self.sectionHeaders = []        # the header text after the line number, i.e. "-- Auto-annotated source: file.c\n"
+        offset = 0
+        with open(path, 'rb') as f:
+            for i, line in enumerate(f):
+                offset += len(line)
+                self.offsets.append(offset)
+                # Line 0 is never taken as a header, same as analyzeHotspots
+                if (i > 0 and b"Auto-annotated source" in line):
+                    self.sectionLines.append(i)
+                    self.sectionHeaders.append(_text(line).split(None, 1)[1])
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if offset else None
+
+    # RETURNS: the number of lines in the file
+    def numLines(self):
+        return len(self.offsets) - 1
+
+    # Finds the "Auto-annotated source" header a line falls under
+    # ARGS: the line number
+    # RETURNS: the header text, or "" if the line comes before every header
+    def source(self, lineNo):
+        section = bisect.bisect_right(self.sectionLines, lineNo) - 1
+        if section < 0:
+            return ""
+        return self.sectionHeaders[section]
+
+    # Slices a run of lines out of the file
+    # ARGS: the first and last line number wanted (clipped to the file)
+    # RETURNS: {line number : line} for every line in the range
+    def lines(self, first, last):
+        first = max(first, 0)
+        last = min(last, self.numLines() - 1)
+        if first > last:
+            return {}
+        return dict((i, _text(self._map[self.offsets[i]:self.offsets[i + 1]])) for i in range(first, last + 1))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,576 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Shared job handling for vgSpec2017Manager.py and vgSpec2017Monitor.py.
+# Holds the speccmds.cmd parser, the valgrind command builder and the
+# worker pool the Manager uses to own every valgrind child process.
+# The pool decides which job runs next, an executor decides where: the
+# LocalExecutor here runs jobs as child processes, the RemoteExecutor of
+# vgSpec2017Remote.py hands them to workers on other hosts.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import time
+import shlex
+import subprocess
+import threading
+import multiprocessing
+from collections import deque
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+#########################################
+#             JOB SETTINGS              #
+#########################################
+vgExeCmdFile = "speccmds.cmd" # Expected in the benchmark executable directory
+valgrindCommand = "valgrind" # The valgrind to run (the Manager's --valgrind may replace it)
+valgrindOptions = "--tool=cachegrind --branch-sim=yes --LL=2097152,16,64"
+# Cachegrind cannot limit collection to a region of interest, so runs that ask for one
+# use callgrind with the same cache and branch simulation. Name and position compression
+# are turned off so the output reads like cachegrind's.
+roiValgrindOptions = ("--tool=callgrind --cache-sim=yes --branch-sim=yes --LL=2097152,16,64 "
+                      "--collect-atstart=no --compress-strings=no --compress-pos=no")
+progressInterval = 3 # Seconds between reads of the running jobs' logs
+# The folder holding spec/ and vgSpec2017/, unless a script is told otherwise
+defaultWorkspace = os.environ.get("VGSPEC2017_WORKSPACE", "/local/alec/cole_workspace/")
+maxOomRetries = 2 # Times a job killed for running out of memory is run again
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Pulls the executable command out of one line of speccmds.cmd
+# ARGS: the line, starting with its -o or -i flag
+# RETURNS: the executable command (relative to the executable directory)
+def _parseExeCommand(cmd):
+    # Once the -o or -i flag is seen, get the command from the line (and just the command)
+    exeCommand = ""
+    copyStart = False
+    for i in range(len(cmd)):
+        if (cmd[i:i+3] == "../"):
+            copyStart = True
+            exeCommand = exeCommand + cmd[i]
+        elif (cmd[i:i+2] == " >"):
+            break
+        elif (copyStart):
+            exeCommand = exeCommand + cmd[i]
+    return exeCommand.strip()
+
+# Gets every command spec2017 runs for a benchmark's workload from its speccmds.cmd
+# ARGS: the full path of the directory of the benchmark executable
+# RETURNS: the executable commands (relative to the executable directory), in file order
+def getExeCommands(benchmarkExeDir):
+    with open(os.path.join(benchmarkExeDir, vgExeCmdFile)) as f:
+        commands = f.readlines()
+    exeCommands = []
+    for cmd in commands:
+        if (cmd[0:2] == "-o" or cmd[0:2] == "-i"):
+            exeCommand = _parseExeCommand(cmd)
+            if exeCommand:
+                exeCommands.append(exeCommand)
+    return exeCommands
+
+# Gets the command used to run a benchmark from its speccmds.cmd
+# ARGS: the full path of the directory of the benchmark executable
+# RETURNS: the first executable command (relative to the executable directory)
+def getExeCommand(benchmarkExeDir):
+    exeCommands = getExeCommands(benchmarkExeDir)
+    return exeCommands[0] if exeCommands else ""
+
+# Names the result file of one invocation of a benchmark with several
+# ARGS: the benchmark's results file, the invocation number (from 0)
+# RETURNS: the full path of the invocation's results file
+def getPartResFile(benchmarkResFile, part):
+    root, ext = os.path.splitext(benchmarkResFile)
+    # Cachegrind results lose their ".txt", so they are never taken for a finished benchmark
+    if ext == ".txt":
+        return root + ".part" + str(part)
+    return root + ".part" + str(part) + ext
+
+# Gets the valgrind options a run uses
+# ARGS: the functions to limit collection to (empty or None for the whole program)
+# RETURNS: the options as a string, without the output file
+def getValgrindOptions(toggleCollect=None):
+    if not toggleCollect:
+        return valgrindOptions
+    return roiValgrindOptions + "".join(" --toggle-collect=" + fn for fn in toggleCollect)
+
+# Builds the valgrind command for a benchmark
+# ARGS: the full path of the file to store the results in, the executable command,
+# the functions to limit collection to (empty or None for the whole program)
+# RETURNS: the valgrind command as a string
+def getValgrindCmd(benchmarkResFile, exeCommand, toggleCollect=None):
+    if not toggleCollect:
+        outFileOption = " --cachegrind-out-file="
+    else:
+        outFileOption = " --callgrind-out-file="
+    return valgrindCommand + " " + getValgrindOptions(toggleCollect) + outFileOption + benchmarkResFile + " " + exeCommand
+
+# Overwrites the status word on the first line of a benchmark's meta log
+# ARGS: the meta log file, the status to write (i.e. "Done")
+# RETURNS: nothing
+def writeStatus(benchmarkLogFile, status):
+    with open(benchmarkLogFile, 'r+') as metaLogFile:
+        metaLogFile.seek(0, 0)
+        # Padded so it covers "Running..." - no functional impact
+        metaLogFile.write(status.ljust(10) + "\n")
+
+# Follows a growing log file, handing back only what was added since the last read
+class LogTail(object):
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.partial = ""
+
+    # RETURNS: the complete lines written since the last call
+    def readLines(self):
+        try:
+            with open(self.path, 'r') as f:
+                f.seek(self.offset)
+                data = f.read()
+                self.offset = f.tell()
+        except IOError:
+            return []
+        lines = (self.partial + data).split("\n")
+        # Hold on to a half-written last line until it is finished
+        self.partial = lines.pop()
+        return lines
+
+#########################################
+#             MEMORY USE                #
+#########################################
+# Reads one "<name>: <value> kB" field out of a /proc file
+# ARGS: the /proc file, the field name
+# RETURNS: the value, or None if the file or field is missing
+def _readProcField(path, field):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+# RETURNS: the memory the system can still hand out without swapping (KB), None if unknown
+def availableMemory():
+    return _readProcField("/proc/meminfo", "MemAvailable")
+
+# RETURNS: the resident memory of a running process (KB), None if unknown
+def processMemory(pid):
+    return _readProcField("/proc/" + str(pid) + "/status", "VmRSS")
+
+# RETURNS: how many processes the kernel's OOM killer has killed since boot, None if unknown
+def oomKillCount():
+    try:
+        with open("/proc/vmstat") as f:
+            for line in f:
+                if line.startswith("oom_kill "):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+#########################################
+#          RUNTIME ESTIMATES            #
+#########################################
+# SPEC's reference machine runtimes of the benchmarks (seconds), to order benchmarks
+# that were never simulated before. Only how they compare to each other matters.
+referenceRuntimes = {
+    "500.perlbench_r" : 1592, "502.gcc_r"       : 1416, "503.bwaves_r"    : 10028, "505.mcf_r"      : 1616,
+    "507.cactuBSSN_r" : 1265, "508.namd_r"      : 950,  "510.parest_r"    : 2616,  "511.povray_r"   : 2335,
+    "519.lbm_r"       : 1054, "520.omnetpp_r"   : 1312, "521.wrf_r"       : 2240,  "523.xalancbmk_r": 1056,
+    "525.x264_r"      : 1751, "526.blender_r"   : 1523, "527.cam4_r"      : 1749,  "531.deepsjeng_r": 1145,
+    "538.imagick_r"   : 2487, "541.leela_r"     : 1656, "544.nab_r"       : 1683,  "548.exchange2_r": 2619,
+    "549.fotonik3d_r" : 3897, "554.roms_r"      : 1589, "557.xz_r"        : 1080,
+    "600.perlbench_s" : 1774, "602.gcc_s"       : 3981, "603.bwaves_s"    : 58864, "605.mcf_s"      : 4721,
+    "607.cactuBSSN_s" : 16708, "619.lbm_s"      : 4733, "620.omnetpp_s"   : 1630,  "621.wrf_s"      : 11856,
+    "623.xalancbmk_s" : 1417, "625.x264_s"      : 1763, "627.cam4_s"      : 9335,  "628.pop2_s"     : 18616,
+    "631.deepsjeng_s" : 1433, "638.imagick_s"   : 14436, "641.leela_s"    : 1707,  "644.nab_s"      : 17475,
+    "648.exchange2_s" : 2881, "649.fotonik3d_s" : 10325, "654.roms_s"     : 18247, "657.xz_s"       : 6182,
+}
+
+# RETURNS: the expected runtime of a benchmark's longest job from its history, None if it never ran
+def _knownBenchmarkRuntime(benchmark, history):
+    known = [history.expected(name) for name in history.jobNames() if name == benchmark or name.startswith(benchmark + " (")]
+    known = [runtime for runtime in known if runtime is not None]
+    return max(known) if known else None
+
+# Expected runtime of a benchmark's longest job, for ordering the benchmarks. A benchmark
+# that never ran is estimated from its reference runtime, scaled by how long the benchmarks
+# that did run took against theirs. Any other benchmark gets the typical runtime.
+# ARGS: the benchmark name, the RuntimeHistory of like runs
+# RETURNS: the expected runtime in seconds (0 with nothing to go on)
+def expectedBenchmarkRuntime(benchmark, history):
+    known = _knownBenchmarkRuntime(benchmark, history)
+    if known is not None:
+        return known
+    reference = referenceRuntimes.get(benchmark)
+    if reference is None:
+        return history.typical() or 0
+    ratios = []
+    for name in referenceRuntimes:
+        runtime = _knownBenchmarkRuntime(name, history)
+        if runtime is not None:
+            ratios.append(runtime / float(referenceRuntimes[name]))
+    if not ratios:
+        return float(reference)
+    ratios.sort()
+    return reference * ratios[len(ratios) // 2]
+
+# Works out how long the rest of the pool's work should take, by handing the
+# expected runtimes out to the free slots the way the pool will
+# ARGS: the JobPool, a function giving a job's expected runtime in seconds (None if
+# unknown), the runtime to assume for jobs with no estimate and for expected jobs
+# RETURNS: the estimated seconds until every job is done
+def estimateRemaining(jobPool, expectedRuntime, defaultRuntime):
+    now = time.time()
+    slots = []
+    for job in jobPool.running:
+        runtime = expectedRuntime(job) or defaultRuntime
+        slots.append(max(runtime - (now - job.startTime), 0))
+    slots.extend([0] * (jobPool.maxJobs - len(slots)))
+    waiting = [expectedRuntime(job) or defaultRuntime for job in jobPool.queued()]
+    waiting.extend([defaultRuntime] * jobPool.expected)
+    for runtime in waiting:
+        slots.sort()
+        slots[0] += runtime
+    return max(slots) if slots else 0
+
+# The shortest any schedule of the given jobs could take: no shorter than the longest
+# job, and no shorter than all the work spread evenly over every slot
+# ARGS: the runtimes of the jobs (seconds), the number of jobs run at once
+# RETURNS: the lower bound in seconds
+def makespanLowerBound(runtimes, maxJobs):
+    if not runtimes:
+        return 0
+    return max(max(runtimes), sum(runtimes) / float(maxJobs))
+
+#########################################
+#               JOB POOL                #
+#########################################
+# A single valgrind simulation of one benchmark (or of one of its invocations)
+class Job(object):
+    def __init__(self, name, exeDir, logFile, resFile, toggleCollect=None, exeCommand=None, key=None, command=None):
+        self.name = name        # Benchmark name (i.e. "505.mcf_r")
+        self.exeDir = exeDir    # Directory holding the executable and speccmds.cmd
+        self.logFile = logFile  # Meta log the valgrind output goes to
+        self.resFile = resFile  # Cachegrind output file
+        self.toggleCollect = toggleCollect or [] # Functions to limit collection to
+        self.exeCommand = exeCommand # Command to simulate (default: the first in speccmds.cmd)
+        self.key = key          # Simulation cache key (None if the result is not to be kept)
+        self.command = command  # Command to run instead of the valgrind simulation (i.e. a trace capture)
+        self.proc = None
+        self.tail = None
+        self.startTime = None
+        self.endTime = None
+        self.returncode = None
+        self.maxRss = None      # Peak resident set size of valgrind (KB)
+        self.memoryHint = None  # Least memory the job is known to need (KB), after an OOM kill
+        self.oomKills = 0       # Times the OOM killer has killed this job
+        self.oomBefore = None
+        self.userTime = None    # CPU time valgrind spent in user mode (seconds)
+        self.sysTime = None     # CPU time valgrind spent in the kernel (seconds)
+        self.oomKilled = False  # Whether the OOM killer ended the last attempt
+        self.host = None        # The host running the job (None for this one)
+        self.lostHost = None    # The host the last attempt was lost with, if its worker went away
+        self.timeout = None     # Seconds the job may run before it is killed (None for no limit)
+        self.timedOut = False   # Whether the last attempt was killed for running too long
+        self.failures = 0       # Times the job failed and was run again
+        self.failure = None     # Why the last attempt failed (None if it did not)
+        self.notBefore = None   # The job waits in the queue until this time after a failure
+
+    def runTime(self):
+        return self.endTime - self.startTime
+
+# Runs jobs as child processes of this one. Every child has a thread blocked on
+# its exit, so a finished job is picked up the moment it exits.
+class LocalExecutor(object):
+    checksMemory = True # Jobs run here, so the memory they use can be read
+
+    # RETURNS: the most jobs the executor can run at once, None for no limit of its own
+    def capacity(self):
+        return None
+
+    # Starts valgrind on the job with its output going to the end of the meta log
+    # ARGS: the job, the queue to put ("exit", job) on once it is done
+    def start(self, job, events):
+        exeCommand = job.exeCommand or getExeCommand(job.exeDir)
+        valgrindCmd = job.command or getValgrindCmd(job.resFile, exeCommand, job.toggleCollect)
+        with open(job.logFile, 'a') as output:
+            job.proc = subprocess.Popen(shlex.split(valgrindCmd), cwd=job.exeDir,
+                                        stdout=output, stderr=subprocess.STDOUT)
+        job.oomBefore = oomKillCount()
+        reaper = threading.Thread(target=self._reap, args=(job, events))
+        reaper.daemon = True
+        reaper.start()
+
+    # RETURNS: the resident memory of a running job (KB), None if unknown
+    def memoryUsed(self, job):
+        return processMemory(job.proc.pid)
+
+    # Kills a running job - its exit is reported as usual
+    def kill(self, job):
+        try:
+            job.proc.kill()
+        except OSError:
+            pass
+
+    # Blocks on the child's exit and hands the job back to the pool. Reaped with wait4
+    # where there is one, so the child's resource usage comes back with its status.
+    def _reap(self, job, events):
+        if hasattr(os, "wait4"):
+            pid, status, usage = os.wait4(job.proc.pid, 0)
+            if os.WIFSIGNALED(status):
+                job.proc.returncode = -os.WTERMSIG(status)
+            else:
+                job.proc.returncode = os.WEXITSTATUS(status)
+            job.maxRss = usage.ru_maxrss
+            job.userTime = usage.ru_utime
+            job.sysTime = usage.ru_stime
+        else:
+            job.proc.wait()
+        job.returncode = job.proc.returncode
+        job.oomKilled = self._oomKilled(job)
+        events.put(("exit", job))
+
+    # RETURNS: True if the kernel's OOM killer ended the job
+    def _oomKilled(self, job):
+        if job.returncode != -9 or job.oomBefore is None:
+            return False
+        oomAfter = oomKillCount()
+        return oomAfter is not None and oomAfter > job.oomBefore
+
+    def close(self):
+        pass
+
+# Runs queued jobs with at most <maxJobs> alive at once, on the executor it is given
+# (default: a LocalExecutor). Every job is started and reaped through the pool so
+# concurrency is decided by the pool, not by shell backgrounding. Jobs can also be
+# handed in from other threads while the pool is running (see expect).
+# Queued jobs start in the order they were submitted, or highest priority first
+# if the pool is given a priority function. A queued job is then also held back
+# while an expected job announced with a higher priority has yet to arrive.
+#
+# Given a function predicting each job's peak memory, a job is only started when
+# it fits in the memory left over once the running jobs reach their own peaks.
+# Jobs further down the queue that fit go ahead of one that does not. A job the
+# OOM killer takes down is queued again, needing at least the memory it died at.
+# A job lost along with the worker running it is queued again as it was.
+#
+# Given a function giving each job's timeout, a job running longer is killed. A job
+# that times out, exits with an error or leaves a result the checkResult function
+# finds fault with is run again up to <maxRetries> times, waiting <retryDelay>
+# seconds before the first retry and twice as long before each one after.
+class JobPool(object):
+    def __init__(self, maxJobs=None, priority=None, memoryOf=None, memoryReserve=0, executor=None,
+                 timeoutOf=None, checkResult=None, maxRetries=0, retryDelay=60):
+        self.executor = executor or LocalExecutor()
+        if not maxJobs or maxJobs < 1:
+            maxJobs = self.executor.capacity() or multiprocessing.cpu_count()
+        self.maxJobs = maxJobs
+        self.priority = priority
+        self.memoryOf = memoryOf            # Predicted peak memory of a job (KB)
+        self.memoryReserve = memoryReserve  # Memory always left free (KB)
+        self.timeoutOf = timeoutOf          # Seconds a job may run (None for no limit)
+        self.checkResult = checkResult      # What is wrong with a finished job's result (None if nothing)
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.pending = deque()
+        self.running = []
+        self.completed = []
+        self.expected = 0
+        self.expectedPriorities = []
+        self.events = queue.Queue()
+
+    def submit(self, job):
+        self.pending.append(job)
+
+    # Tells the pool <count> more jobs will arrive through submitAsync, so run()
+    # keeps going until they have all arrived. Given a priority, lower priority jobs
+    # wait for them (the same priority has to be passed to submitAsync).
+    def expect(self, count, priority=None):
+        self.expected += count
+        if priority is not None:
+            self.expectedPriorities.extend([priority] * count)
+
+    # Hands in an expected job from any thread. A list of jobs may stand in for the one
+    # expected job, and None (or an empty list) means the job will not come after all.
+    def submitAsync(self, job, priority=None):
+        self.events.put(("submit", (job, priority)))
+
+    # RETURNS: the queued jobs in the order they will be started
+    def queued(self):
+        if self.priority is None:
+            return list(self.pending)
+        # Stable, so equal priorities keep their submission order
+        return sorted(self.pending, key=self.priority, reverse=True)
+
+    # RETURNS: how many jobs can run at once right now
+    def slots(self):
+        capacity = self.executor.capacity()
+        return self.maxJobs if capacity is None else min(self.maxJobs, capacity)
+
+    # RETURNS: the most memory the job is expected to need (KB)
+    def _memoryNeeded(self, job):
+        return max(self.memoryOf(job) or 0, job.memoryHint or 0)
+
+    # RETURNS: True if the job can start without running the system out of memory
+    def _fits(self, job):
+        if self.memoryOf is None or not self.running or not self.executor.checksMemory:
+            # A job too big to ever fit still gets to run on its own
+            return True
+        available = availableMemory()
+        if available is None:
+            return True
+        # The running jobs can still grow to their predicted peaks
+        growth = 0
+        for other in self.running:
+            growth += max(self._memoryNeeded(other) - (self.executor.memoryUsed(other) or 0), 0)
+        return self._memoryNeeded(job) + growth + self.memoryReserve <= available
+
+    # Takes the next job to start off the queue
+    # RETURNS: the job, or None if every queued job has to wait for a higher priority job
+    # still to arrive, for memory or to be retried
+    def _next(self):
+        now = time.time()
+        for job in self.queued():
+            if job.notBefore is not None and job.notBefore > now:
+                continue
+            if self.priority and self.expectedPriorities and self.priority(job) < max(self.expectedPriorities):
+                return None
+            if self._fits(job):
+                self.pending.remove(job)
+                return job
+        return None
+
+    def numJobs(self):
+        return len(self.pending) + len(self.running) + len(self.completed) + self.expected
+
+    # Starts the job on the executor, after a header in its meta log
+    def _start(self, job):
+        with open(job.logFile, 'w') as output:
+            output.write("Running...\n" + "Executing benchmark in folder: " + job.exeDir + "\n")
+            job.tail = LogTail(job.logFile, output.tell())
+        job.lostHost = None
+        job.timedOut = False
+        job.failure = None
+        job.timeout = self.timeoutOf(job) if self.timeoutOf else None
+        self.executor.start(job, self.events)
+        job.startTime = time.time()
+        self.running.append(job)
+
+    # Puts a job the OOM killer ended back in the queue, if it has retries left
+    # RETURNS: True if the job was queued again
+    def _requeue(self, job):
+        if job.lostHost is not None:
+            self.running.remove(job)
+            self.pending.append(job)
+            writeStatus(job.logFile, "Requeued")
+            return True
+        if job.timedOut or not job.oomKilled or job.oomKills >= maxOomRetries:
+            return False
+        job.oomKills += 1
+        # It needs at least what it had when it was killed, and likely more
+        job.memoryHint = max(job.memoryHint or 0, job.maxRss or 0, self._memoryNeeded(job)) * 3 // 2
+        self.running.remove(job)
+        self.pending.append(job)
+        writeStatus(job.logFile, "Requeued")
+        return True
+
+    # RETURNS: why a finished job failed, None if it did not
+    def _failure(self, job):
+        if job.timedOut:
+            return "timed out after " + str(int(job.timeout)) + " s"
+        if job.returncode != 0:
+            return "exited with " + str(job.returncode)
+        if self.checkResult:
+            return self.checkResult(job)
+        return None
+
+    # Puts a failed job back in the queue to be run again after a delay, if it has retries left
+    # RETURNS: True if the job was queued again
+    def _retry(self, job):
+        job.failure = self._failure(job)
+        # Jobs the OOM killer keeps ending have had their retries already
+        if job.failure is None or job.oomKilled or job.failures >= self.maxRetries:
+            return False
+        job.failures += 1
+        job.notBefore = time.time() + self.retryDelay * 2 ** (job.failures - 1)
+        self.running.remove(job)
+        self.pending.append(job)
+        writeStatus(job.logFile, "Retrying")
+        return True
+
+    def _finish(self, job):
+        job.endTime = time.time()
+        self.running.remove(job)
+        self.completed.append(job)
+        writeStatus(job.logFile, "Failed" if job.failure else "Done")
+
+    # Kills every running job that has gone past its timeout
+    def _killOverdue(self):
+        now = time.time()
+        for job in self.running:
+            if job.timeout and not job.timedOut and now - job.startTime > job.timeout:
+                job.timedOut = True
+                self.executor.kill(job)
+
+    # Runs every submitted job to completion
+    # ARGS: optional callbacks taking the job, called when a job starts and when it is done,
+    # one taking the job and a line, called for every new line of a running job's log,
+    # and one taking the job, called when an OOM killed, lost or failed job is queued again
+    # RETURNS: the list of completed jobs in order of completion
+    def run(self, onStart=None, onDone=None, onProgress=None, onRequeue=None):
+        while self.pending or self.running or self.expected:
+            if self.pending and not self.running and self.slots() == 0:
+                raise RuntimeError("no executor is left to run the " + str(len(self.pending)) + " queued jobs")
+            # Fill every free slot
+            while self.pending and len(self.running) < self.slots():
+                job = self._next()
+                if job is None:
+                    break
+                self._start(job)
+                if onStart:
+                    onStart(job)
+            # Sleep until a job exits or arrives, waking up now and then to follow the logs
+            try:
+                kind, eventJob = self.events.get(True, progressInterval)
+            except queue.Empty:
+                kind, eventJob = None, None
+            if onProgress:
+                for job in self.running:
+                    for line in job.tail.readLines():
+                        onProgress(job, line)
+            self._killOverdue()
+            if kind == "submit":
+                eventJob, priority = eventJob
+                self.expected -= 1
+                if priority is not None:
+                    self.expectedPriorities.remove(priority)
+                if isinstance(eventJob, list):
+                    self.pending.extend(eventJob)
+                elif eventJob:
+                    self.pending.append(eventJob)
+            elif kind == "exit":
+                if self._requeue(eventJob) or self._retry(eventJob):
+                    if onRequeue:
+                        onRequeue(eventJob)
+                    continue
+                self._finish(eventJob)
+                if onDone:
+                    onDone(eventJob)
+        return self.completed
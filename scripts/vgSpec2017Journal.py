@@ -0,0 +1,140 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# The run journal: one JSON object per line in the run's results
+# folder ("journal.jsonl"), appended as the run goes. Every line is
+# flushed to disk before the run moves on, so a run that dies part way
+# through can be resumed with only the benchmarks it had not finished.
+#
+# The same JSON-lines files also hold the Manager's per-job telemetry
+# ("logs/events.jsonl") and the runtimes of every job ever run
+# ("history.jsonl"), which the run time estimates are worked out from.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import json
+import time
+import threading
+
+journalName = "journal.jsonl"
+
+# Appends records to a run's journal (or any other JSON-lines file) and reads them back
+class RunJournal(object):
+    def __init__(self, resultsDir, name=journalName):
+        self.path = os.path.join(resultsDir, name)
+        self.lock = threading.Lock()
+
+    # Appends one record, stamped with the time
+    # ARGS: the kind of record (i.e. "done") and its fields
+    # RETURNS: nothing
+    def record(self, kind, **fields):
+        fields["event"] = kind
+        fields["time"] = time.time()
+        line = json.dumps(fields, sort_keys=True) + "\n"
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    # RETURNS: every record in the journal, oldest first. A half-written last line
+    # (the run died while writing it) is left out.
+    def records(self):
+        entries = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except IOError:
+            pass
+        return entries
+
+    # RETURNS: the set of benchmarks the journal says have their final result
+    def completed(self):
+        return set(entry["benchmark"] for entry in self.records() if entry["event"] == "done")
+
+    # RETURNS: {benchmark : why it failed} for every benchmark the journal says failed
+    # and that has not been finished since (i.e. by a resume)
+    def failed(self):
+        failures = {}
+        for entry in self.records():
+            if entry["event"] == "failed":
+                failures[entry["benchmark"]] = entry.get("reason", "")
+            elif entry["event"] == "done":
+                failures.pop(entry["benchmark"], None)
+        return failures
+
+# The runtimes and peak memory of past jobs, for estimating what a job will take
+#   history : the RunJournal the "end" record of every job is appended to
+#   setting : what a job's runtime depends on besides its name (the workload and
+#             valgrind options), so only like runs are compared
+class RuntimeHistory(object):
+    def __init__(self, history, setting):
+        self.history = history
+        self.setting = setting
+        self.runtimes = {}
+        self.peaks = {}
+        # The Manager adds to the history while other threads estimate from it
+        self.lock = threading.RLock()
+        for entry in history.records():
+            if entry["event"] == "end" and entry.get("setting") == setting:
+                self._note(entry)
+
+    # Keeps the runtime of a successful job and the peak memory of any job
+    def _note(self, entry):
+        with self.lock:
+            if entry.get("returncode") == 0 and not entry.get("failure"):
+                self.runtimes.setdefault(entry["job"], []).append(entry["runtime"])
+            if entry.get("maxRssKB"):
+                self.peaks.setdefault(entry["job"], []).append(entry["maxRssKB"])
+
+    # Adds a finished job to the history
+    # ARGS: the fields of the job's "end" record
+    # RETURNS: nothing
+    def add(self, entry):
+        entry = dict(entry, setting=self.setting)
+        self.history.record("end", **entry)
+        self._note(entry)
+
+    # RETURNS: the names of every job with a runtime in the history
+    def jobNames(self):
+        with self.lock:
+            return list(self.runtimes)
+
+    # RETURNS: the median runtime of the last 5 runs of the job, None if it never ran
+    def expected(self, jobName):
+        with self.lock:
+            runtimes = sorted(self.runtimes.get(jobName, [])[-5:])
+        if not runtimes:
+            return None
+        return runtimes[len(runtimes) // 2]
+
+    # RETURNS: the mean expected runtime over every job in the history, None if it is empty
+    def typical(self):
+        estimates = [self.expected(name) for name in self.jobNames()]
+        if not estimates:
+            return None
+        return sum(estimates) / float(len(estimates))
+
+    # RETURNS: the highest peak memory (KB) of the last 5 runs of the job, None if unknown
+    def expectedPeak(self, jobName):
+        with self.lock:
+            peaks = self.peaks.get(jobName, [])[-5:]
+        if not peaks:
+            return None
+        return max(peaks)
@@ -5,7 +5,50 @@
 # Intended to manage valgrind simulations of the SPEC2017 bencmarks.
 #
 # Args to this script
-#   NONE
+#   --jobs N    The most benchmarks to simulate at once (default: number of cores, or the
+#               slots of every --worker)
+#   --stage-jobs N  The most benchmarks to stage at once (default: 4)
+#   --stage-mode    How changed files are staged: auto (reflink, else copy),
+#                   link (hard link, else copy) or copy
+#   --workload      Which spec2017 run directory to simulate: test, train or ref (default)
+#   --toggle-collect FN  Only collect events inside function FN (repeatable)
+#   --resume RUN    Finish the run in results folder RUN (i.e. "3_21_vgRun"), simulating
+#                   only the benchmarks its journal does not list as done
+#   --no-sim-cache  Simulate every benchmark, even ones the simulation cache has a result for
+#   --schedule      The order queued jobs start in: longest (expected runtime from earlier
+#                   runs, longest first - the default) or fifo (staging order). Benchmarks
+#                   that never ran are expected to take as long as SPEC's reference runtime
+#                   suggests, scaled to the benchmarks that did run.
+#   --job-mem GB    Peak memory assumed for jobs with no history (default: 2)
+#   --mem-reserve GB  Memory always left free when admitting jobs (default: 1)
+#   --no-mem-check  Start jobs whenever a slot is free, whatever memory is left
+#   --timeout-factor F  Kill a job once it runs F times longer than like runs took (default: 4,
+#                   0 for no timeouts)
+#   --timeout-min S The shortest timeout, in seconds (default: 600)
+#   --job-timeout S The timeout of jobs never run before, in seconds (default: 0, no limit)
+#   --retries N     Times a job that timed out, failed or left an incomplete result is run
+#                   again (default: 2)
+#   --retry-delay S Seconds before the first retry, doubled for every retry after (default: 60)
+#   --capture-trace Capture each benchmark's memory accesses with lackey instead of
+#                   simulating it (see vgSpec2017Trace.py), for vgSpec2017Sweep.py
+#   --trace-skip N  Accesses to skip before capturing (default: 0)
+#   --trace-window N  The most accesses to capture per invocation (default: 20000000, 0 for all)
+#   --workspace DIR The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#                   else /local/alec/cole_workspace/)
+#   --valgrind CMD  The valgrind command to run (default: valgrind) - i.e. the stand-in of
+#                   vgSpec2017SchedSim.py
+#   --compress METHOD  Compress every benchmark's result once it is final: gzip or zstd
+#                   (zstd needs the zstandard module). vgSpec2017GetResults.py reads them as they are.
+#   --worker N:CMD  Run up to N jobs at once on the worker CMD starts (repeatable) instead of
+#                   on this host - i.e. "8:ssh hostA python <scripts>/vgSpec2017Remote.py worker".
+#                   Workers see the staged benchmarks through a shared or mirrored workspace,
+#                   and every result is shipped back here (see vgSpec2017Remote.py).
+#
+# Besides logs/logfile.txt, every job's start and end (exit code, peak RSS, user and
+# system CPU time) go to logs/events.jsonl, one JSON object per line. Job runtimes are
+# kept in history.jsonl and give the estimated time remaining written to the run log.
+# Benchmarks that still fail after their retries are listed as failed in the run log,
+# the run journal and the run summary, and are run again by --resume.
 #
 # NOTE: This Software is provided AS IS.
 # If we did not have as much control over these parameters
@@ -24,35 +67,111 @@ import datetime
 import time
 import subprocess
 import os
+import argparse
+import re
+import json
 from collections import deque
+from multiprocessing.pool import ThreadPool
+import vgSpec2017Jobs
+import vgSpec2017Staging
+import vgSpec2017Parser
+import vgSpec2017SimCache
+import vgSpec2017Journal
+import vgSpec2017Trace
+import vgSpec2017Summary
+import vgSpec2017Compress
+import vgSpec2017Remote
 
 
 #########################################
 #           UTILITY FUNCTIONS           #
 #########################################
 # Finds the most recently run directory in a given path
-# ARGS: the full path to the benchmarks's spec2017 run directory. Expects
-# standard spec2017 run directory format: "run_base_ref<type>_<configname>.<4digitnumber>"
+# ARGS: the full path to the benchmarks's spec2017 run directory, the workload size
+# ("test", "train" or "ref"). Expects standard spec2017 run directory format:
+# "run_<tune>_<size>_<configname>.<4digitnumber>" (i.e. "run_base_refrate_mytest-m64.0000")
 # RETURNS: the path to the most up-to-date directory containing executables within
 # the passed directory
-def findMostRecentExeDir(pathToParentDir):
-    children = os.listdir(pathToParentDir)
-    currentGuessDir = children[0]
-    currentGuessNum = int(currentGuessDir[-4:])
-    for child in children:
+def findMostRecentExeDir(pathToParentDir, workload="ref"):
+    currentGuessDir = None
+    currentGuessNum = -1
+    for child in os.listdir(pathToParentDir):
         # By convention, the directory will start with "run" and end in a 4 digit ID
-        if (child[0:3] == "run"):
+        if (re.match("run_[^_]+_" + workload, child) and child[-4:].isdigit()):
             runDirNum = child[-4:]
             if (int(runDirNum) > currentGuessNum):
                 currentGuessNum = int(runDirNum)
                 currentGuessDir = child
+    if currentGuessDir is None:
+        raise OSError("no " + workload + " run directory in " + pathToParentDir)
     return currentGuessDir
 
+#########################################
+#            HANDLE CLA                 #
+#########################################
+parser = argparse.ArgumentParser(description="Manage valgrind simulations of the SPEC2017 benchmarks")
+parser.add_argument("--jobs", type=int, default=None,
+                    help="the most benchmarks to simulate at once (default: number of cores, or the slots of every --worker)")
+parser.add_argument("--stage-jobs", type=int, default=4,
+                    help="the most benchmarks to stage at once (default: 4)")
+parser.add_argument("--stage-mode", choices=vgSpec2017Staging.stageModes, default="auto",
+                    help="how changed files are staged: auto (reflink, else copy), link (hard link, else copy) or copy")
+parser.add_argument("--workload", choices=["test", "train", "ref"], default="ref",
+                    help="which spec2017 run directory to simulate (default: ref)")
+parser.add_argument("--toggle-collect", action="append", default=[], metavar="FN",
+                    help="only collect events inside this function (repeatable) - runs callgrind instead of cachegrind")
+parser.add_argument("--resume", metavar="RUN",
+                    help="finish an interrupted run (i.e. \"3_21_vgRun\") - only its unfinished benchmarks are simulated")
+parser.add_argument("--no-sim-cache", dest="sim_cache", action="store_false",
+                    help="simulate every benchmark, even ones the simulation cache has a result for")
+parser.add_argument("--schedule", choices=["longest", "fifo"], default="longest",
+                    help="start the longest expected jobs first (default) or in staging order")
+parser.add_argument("--job-mem", type=float, default=2.0, metavar="GB",
+                    help="peak memory assumed for jobs never run before (default: 2)")
+parser.add_argument("--mem-reserve", type=float, default=1.0, metavar="GB",
+                    help="memory always left free when admitting jobs (default: 1)")
+parser.add_argument("--no-mem-check", dest="mem_check", action="store_false",
+                    help="start jobs whenever a slot is free, whatever memory is left")
+parser.add_argument("--timeout-factor", type=float, default=4.0, metavar="F",
+                    help="kill a job once it runs F times longer than like runs took (default: 4, 0 for no timeouts)")
+parser.add_argument("--timeout-min", type=float, default=600, metavar="S",
+                    help="the shortest timeout in seconds (default: 600)")
+parser.add_argument("--job-timeout", type=float, default=0, metavar="S",
+                    help="the timeout in seconds of jobs never run before (default: 0, no limit)")
+parser.add_argument("--retries", type=int, default=2, metavar="N",
+                    help="times a job that timed out, failed or left an incomplete result is run again (default: 2)")
+parser.add_argument("--retry-delay", type=float, default=60, metavar="S",
+                    help="seconds before the first retry, doubled for every retry after (default: 60)")
+parser.add_argument("--capture-trace", action="store_true",
+                    help="capture each benchmark's memory accesses with lackey instead of simulating it")
+parser.add_argument("--trace-skip", type=int, default=0, metavar="N",
+                    help="accesses to skip before capturing (default: 0)")
+parser.add_argument("--trace-window", type=int, default=20000000, metavar="N",
+                    help="the most accesses to capture per invocation (default: 20000000, 0 for all)")
+parser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                    help="the folder holding spec/ and vgSpec2017/ (default: " + vgSpec2017Jobs.defaultWorkspace + ")")
+parser.add_argument("--valgrind", default="valgrind", metavar="CMD",
+                    help="the valgrind command to run (default: valgrind)")
+parser.add_argument("--compress", choices=sorted(vgSpec2017Compress.compressExtensions), default=None,
+                    help="compress every benchmark's result once it is final")
+parser.add_argument("--worker", action="append", default=[], metavar="N:CMD",
+                    help="run up to N jobs at once on the worker CMD starts (repeatable) - see vgSpec2017Remote.py")
+args = parser.parse_args()
+vgSpec2017Jobs.valgrindCommand = args.valgrind
+if args.capture_trace and args.toggle_collect:
+    parser.error("--capture-trace records every access, it cannot be combined with --toggle-collect")
+if args.compress and not vgSpec2017Compress.available(args.compress):
+    parser.error("--compress " + args.compress + " needs the zstandard module")
+try:
+    workers = [vgSpec2017Remote.parseWorkerSpec(worker) for worker in args.worker]
+except ValueError as e:
+    parser.error("--worker: " + str(e))
+
 #########################################
 #      DEFINE ABSOLUTE DIRECTORIES      #
 #########################################
 # Absolute path to the workspace
-baseOperatingDir = "/local/alec/cole_workspace/"
+baseOperatingDir = os.path.join(os.path.abspath(args.workspace), "")
 #Base directories for vgSpec2017(ours) and spec2017(spec's)
 spec2017Dir = baseOperatingDir + "spec/"
 vgSpecDir = baseOperatingDir + "vgSpec2017/"
@@ -62,6 +181,9 @@ vgLogsDir = vgSpecDir + "logs/"
 vgLogFile = vgLogsDir + "logfile.txt"
 vgBenchDir = vgSpecDir + "benchmarks/"
 vgResultDir = vgSpecDir + "results/"
+vgSimCacheDir = vgSpecDir + "simcache/"
+vgEventsFileName = "events.jsonl" # Per-job telemetry of this run, in vgLogsDir
+vgHistoryFileName = "history.jsonl" # Runtimes of every job ever run, in vgSpecDir
 vgMonitorSubprocScript = vgScriptsDir + "vgSpec2017Monitor.py"
 # BUILT LATER: "vgSpecThisResultsDir" is the reference for this simulation's results
 # Spec 2017 Subdirectories
@@ -72,53 +194,86 @@ spec2017RunDir = "run/" # NOTE: relative path - but its the same for every bmk
 #########################################
 #          ENVIRONMENT SETUP            #
 #########################################
-# Clean the benchmark folder
-cleanDirCmd =  "rm -r " + vgBenchDir + "*"
-cleanDir = subprocess.Popen(cleanDirCmd, shell = True)
-cleanDir.communicate()
-# Clean the logs folder
-cleanDirCmd =  "rm -r " + vgLogsDir + "*"
+# Clean the logs folder - the benchmark folder is staged incrementally instead of wiped
+cleanDirCmd =  "rm -rf " + vgLogsDir + "*"
 cleanDir = subprocess.Popen(cleanDirCmd, shell = True)
 cleanDir.communicate()
-# Locate all benchmark directories in spec2017BenchmarksDir -------- TODO: GCC nonexistent but folder made anyways
-for root, dir, file in os.walk(spec2017BenchmarksDir):
-    for dirs in dir:
-        # Check if this is a bmk directory - it will start with 3 numbers
-        if (dirs[0].isdigit() and dirs[1].isdigit() and dirs[2].isdigit()):
-            # Hardcoded avoidance of gcc - remove this check if no known issues with any benchmarks
-            if (dirs != "602.gcc_s" and dirs != "502.gcc_r"):
-                # Make a local folder for this
-                makeBmkDirCmd =  "mkdir -m 777 " + vgBenchDir + dirs
-                makeBmkDir = subprocess.Popen(makeBmkDirCmd, shell = True)
-                makeBmkDir.communicate()
-                # Copy the run directory to the local benchmark folder
-                copyRunDirCmd = "cp -r " + spec2017BenchmarksDir + dirs + "/" + spec2017RunDir + " " + vgBenchDir + dirs + "/"
-                copyRunDir = subprocess.Popen(copyRunDirCmd, shell = True)
-                copyRunDir.communicate()
+# Locate all benchmark directories in spec2017BenchmarksDir
+benchmarkList = []
+for dirs in os.listdir(spec2017BenchmarksDir):
+    # Check if this is a bmk directory - it will start with 3 numbers
+    if (dirs[0:3].isdigit() and os.path.isdir(spec2017BenchmarksDir + dirs + "/" + spec2017RunDir)):
+        # Hardcoded avoidance of gcc - remove this check if no known issues with any benchmarks
+        if (dirs != "602.gcc_s" and dirs != "502.gcc_r"):
+            benchmarkList.append(dirs)
 
 #########################################
 #          INITIALIZE RESULTS           #
 #########################################
-# Create Parent Directory to house simulation results in ../results/ folder - name is <day_month_sim>
-vgSpecThisResultsDir = str(datetime.datetime.now().month) + "_" + str(datetime.datetime.now().day) + "_vgRun"
-# If this isnt the first sim today
-copy = 1
-appender = ""
-checker = vgSpecThisResultsDir
-for root, dir, file in os.walk(vgResultDir):
-    for dirs in dir:
-        if dirs == checker:
-            appender = "_" + str(copy)
-            copy = copy + 1
-            checker = vgSpecThisResultsDir + appender
-# Make directory
-if appender != "":
-    vgSpecThisResultsDir = vgResultDir + vgSpecThisResultsDir + appender + "/"
+if args.resume:
+    # Pick the interrupted run back up with the settings it was started with
+    vgSpecThisResultsDir = vgResultDir + args.resume + "/"
+    with open(vgSpecThisResultsDir + "run_info.json") as runInfoFile:
+        runInfo = json.load(runInfoFile)
+    args.workload = runInfo["workload"]
+    args.toggle_collect = runInfo["toggleCollect"]
+    args.capture_trace = runInfo["tool"] == "lackey"
+    args.trace_skip = runInfo.get("traceSkip", 0)
+    args.trace_window = runInfo.get("traceWindow", 0)
+    args.compress = runInfo.get("compress")
 else:
-    vgSpecThisResultsDir = vgResultDir + vgSpecThisResultsDir + "/"
-makeResDirCmd =  "mkdir -m 777 " + vgSpecThisResultsDir
-makeResDir = subprocess.Popen(makeResDirCmd, shell = True)
-makeResDir.communicate()
+    # Create Parent Directory to house simulation results in ../results/ folder - name is <day_month_sim>
+    vgSpecThisResultsDir = str(datetime.datetime.now().month) + "_" + str(datetime.datetime.now().day) + "_vgRun"
+    # If this isnt the first sim today - a new run must never land in an earlier run's folder
+    copy = 1
+    appender = ""
+    while os.path.isdir(vgResultDir + vgSpecThisResultsDir + appender):
+        appender = "_" + str(copy)
+        copy = copy + 1
+    # Make directory
+    if appender != "":
+        vgSpecThisResultsDir = vgResultDir + vgSpecThisResultsDir + appender + "/"
+    else:
+        vgSpecThisResultsDir = vgResultDir + vgSpecThisResultsDir + "/"
+    makeResDirCmd =  "mkdir -m 777 " + vgSpecThisResultsDir
+    makeResDir = subprocess.Popen(makeResDirCmd, shell = True)
+    makeResDir.communicate()
+    # Record how this run was made next to its results
+    runInfo = {
+        "started"        : datetime.datetime.now().isoformat(),
+        "workload"       : args.workload,
+        "tool"           : "callgrind" if args.toggle_collect else "cachegrind",
+        "toggleCollect"  : args.toggle_collect,
+        "valgrindOptions": vgSpec2017Jobs.getValgrindOptions(args.toggle_collect),
+        "benchmarks"     : benchmarkList,
+        "compress"       : args.compress
+    }
+    if args.capture_trace:
+        runInfo["tool"] = "lackey"
+        runInfo["valgrindOptions"] = vgSpec2017Trace.getCaptureOptions(args.trace_skip, args.trace_window)
+        runInfo["traceSkip"] = args.trace_skip
+        runInfo["traceWindow"] = args.trace_window
+    with open(vgSpecThisResultsDir + "run_info.json", 'w') as runInfoFile:
+        json.dump(runInfo, runInfoFile, indent=4, sort_keys=True)
+journal = vgSpec2017Journal.RunJournal(vgSpecThisResultsDir)
+journal.record("resume" if args.resume else "start", benchmarks=benchmarkList)
+# Results are cachegrind outputs, or memory access traces when capturing
+resExtension = ".trace" if args.capture_trace else ".txt"
+# Benchmarks the journal lists as done (and whose result is still there) are not run again
+def hasResult(benchmark):
+    resFile = vgSpecThisResultsDir + benchmark + resExtension
+    return (vgSpec2017Compress.findResult(resFile) is not None or
+            vgSpec2017Compress.findResult(vgSpecThisResultsDir + "raw/" + benchmark + resExtension) is not None or
+            os.path.isfile(vgSpec2017Jobs.getPartResFile(resFile, 0)))
+finishedList = [bmk for bmk in journal.completed() if bmk in benchmarkList and hasResult(bmk)]
+benchmarkList = [bmk for bmk in benchmarkList if bmk not in finishedList]
+# Results of earlier simulations, keyed by their inputs and options
+simCache = vgSpec2017SimCache.SimCache(vgSimCacheDir, args.stage_mode) if args.sim_cache else None
+valgrindVersion = vgSpec2017SimCache.getValgrindVersion(args.valgrind) if args.sim_cache else ""
+# Per-job telemetry, and the runtimes of like runs for estimating how long this one takes
+events = vgSpec2017Journal.RunJournal(vgLogsDir, vgEventsFileName)
+history = vgSpec2017Journal.RuntimeHistory(vgSpec2017Journal.RunJournal(vgSpecDir, vgHistoryFileName),
+                                           args.workload + " " + runInfo["valgrindOptions"])
 
 #########################################
 #         START VGSPEC2017 RUN          #
@@ -126,73 +281,356 @@ makeResDir.communicate()
 # Record starting time
 startTime = time.time()
 # Init logfile
-logFile = open(vgLogFile, 'wr')
-logFile.write("\n*************** <> STARTING VGSPEC2017 RUN <> ***************\n\nBENCHMARK SCHEDULING BEGIN\n")
+logFile = open(vgLogFile, 'w')
+logFile.write("\n*************** <> STARTING VGSPEC2017 RUN <> ***************\n\n")
+if args.capture_trace:
+    logFile.write("Capturing memory access traces of the " + args.workload + " workload with: valgrind " + runInfo["valgrindOptions"] + "\n")
+else:
+    logFile.write("Simulating the " + args.workload + " workload with: valgrind " + runInfo["valgrindOptions"] + "\n")
+if args.resume:
+    logFile.write("Resuming run " + args.resume + ", skipping " + str(len(finishedList)) + " finished benchmarks: " + " ".join(sorted(finishedList)) + "\n")
+logFile.write("\nBENCHMARK SCHEDULING BEGIN\n")
 logFile.close()
-# Start valgrind on every benchmark
-benchmarkList = os.listdir(vgBenchDir)
-benchmarkLogList = []
-for benchmark in benchmarkList:
+# Stages one benchmark and hands its jobs to the pool as soon as they are ready to run.
+# Invocations simulated before (in any run) are taken from the simulation cache instead.
+# ARGS: the benchmark name
+# RETURNS: nothing
+def stageBenchmark(benchmark):
+    try:
+        # Get the executable path for this benchmark
+        # First need to get the actaul executable directory of the form "run_base_refrate_mytest-m64.0000/"
+        # Obviously the name could change from config file to config file, but "run_base" should stay the same
+        srcRunDir = spec2017BenchmarksDir + benchmark + "/" + spec2017RunDir
+        mostRecentExeDir = findMostRecentExeDir(srcRunDir, args.workload)
+        exeCommands = vgSpec2017Jobs.getExeCommands(srcRunDir + mostRecentExeDir)
+        # Get the results file name(s)
+        thisBenchmarkResFile = vgSpecThisResultsDir + benchmark + resExtension
+        if len(exeCommands) > 1:
+            resFiles = [vgSpec2017Jobs.getPartResFile(thisBenchmarkResFile, part) for part in range(len(exeCommands))]
+        else:
+            resFiles = [thisBenchmarkResFile]
+        # Reuse every invocation that has been simulated with the same inputs and options
+        keys = [None] * len(resFiles)
+        toRun = list(range(len(resFiles)))
+        if simCache and exeCommands:
+            for part, exeCommand in enumerate(exeCommands):
+                keys[part] = simCache.simulationKey(srcRunDir + mostRecentExeDir, exeCommand, runInfo["valgrindOptions"], valgrindVersion)
+                if simCache.fetch(keys[part], resFiles[part]):
+                    toRun.remove(part)
+                    journal.record("cached", benchmark=benchmark, part=part, key=keys[part])
+            logFile = open(vgLogFile, 'a')
+            logFile.write("Found " + str(len(resFiles) - len(toRun)) + " of " + str(len(resFiles)) + " invocations of benchmark " + benchmark + " in the simulation cache\n")
+            logFile.close()
+        if finishIfCached(benchmark, resFiles, toRun):
+            jobPool.submitAsync(None, stagePriority(benchmark))
+            return
+        thisBmkDir = vgBenchDir + benchmark + "/"
+        if not os.path.isdir(thisBmkDir):
+            os.makedirs(thisBmkDir)
+            os.chmod(thisBmkDir, 0o777)
+        # Bring the local copy of the run directory up to date
+        counts = vgSpec2017Staging.stageTree(srcRunDir, thisBmkDir + spec2017RunDir, args.stage_mode)
+        thisBenchmarkExeDir = thisBmkDir + spec2017RunDir + mostRecentExeDir
+        thisBenchmarkLog = vgLogsDir + benchmark + "_log.txt"
+        stageStr = ", ".join(str(counts[what]) + " " + what for what in sorted(counts))
+        logFile = open(vgLogFile, 'a')
+        logFile.write("Staged benchmark " + benchmark + " (" + stageStr + ", " + str(len(exeCommands)) + " invocations)\n")
+        logFile.close()
+        if len(exeCommands) <= 1:
+            jobPool.submitAsync(vgSpec2017Jobs.Job(benchmark, thisBenchmarkExeDir, thisBenchmarkLog, thisBenchmarkResFile, args.toggle_collect,
+                                                   key=keys[0], command=captureCmd(thisBenchmarkResFile, exeCommands)), stagePriority(benchmark))
+            return
+        # Every invocation is simulated as its own job and the results are merged once they are all done
+        jobs = []
+        for part in toRun:
+            partName = benchmark + " (" + str(part + 1) + "/" + str(len(exeCommands)) + ")"
+            partLog = vgLogsDir + benchmark + "_" + str(part) + "_log.txt"
+            jobs.append(vgSpec2017Jobs.Job(partName, thisBenchmarkExeDir, partLog, resFiles[part], args.toggle_collect, exeCommands[part], keys[part],
+                                           captureCmd(resFiles[part], exeCommands[part:part + 1])))
+            partOf[resFiles[part]] = benchmark
+        benchmarkParts[benchmark] = resFiles
+        jobPool.submitAsync(jobs, stagePriority(benchmark))
+    except Exception as e:
+        logFile = open(vgLogFile, 'a')
+        logFile.write("Could not stage benchmark " + benchmark + ": " + str(e) + "\n")
+        logFile.close()
+        jobPool.submitAsync(None, stagePriority(benchmark))
+
+# Builds the command capturing the trace of an invocation, when the run captures traces
+# ARGS: the trace file, the invocation's executable command (in a list, which may be empty)
+# RETURNS: the command, or None to simulate the invocation with valgrind as usual
+def captureCmd(resFile, exeCommands):
+    if not args.capture_trace or not exeCommands:
+        return None
+    return vgSpec2017Trace.getCaptureCmd(resFile, exeCommands[0], args.trace_skip, args.trace_window, args.valgrind)
+
+# Finishes a benchmark that has nothing left to simulate
+# ARGS: the benchmark name, its results files (one per invocation), the invocations left to run
+# RETURNS: True if the benchmark is finished, False if it still needs simulating
+def finishIfCached(benchmark, resFiles, toRun):
+    if toRun:
+        return False
+    if len(resFiles) > 1:
+        mergeBenchmark(benchmark, resFiles)
+    else:
+        compressBenchmark(benchmark)
+        journal.record("done", benchmark=benchmark)
+    return True
+
+# Compresses a benchmark's final result, when the run keeps its results compressed
+# ARGS: the benchmark name
+# RETURNS: nothing
+def compressBenchmark(benchmark):
+    resFile = vgSpecThisResultsDir + benchmark + resExtension
+    if not args.compress or args.capture_trace or not os.path.isfile(resFile):
+        return
+    try:
+        size = os.path.getsize(resFile)
+        compressedFile = vgSpec2017Compress.compressFile(resFile, args.compress)
+        logFile = open(vgLogFile, 'a')
+        logFile.write("Compressed the result of benchmark " + benchmark + " from " + "{:,}".format(size) + " to " +
+                      "{:,}".format(os.path.getsize(compressedFile)) + " bytes\n")
+        logFile.close()
+    except Exception as e:
         logFile = open(vgLogFile, 'a')
-        # Create the meta log for this benchmark and remember the path
+        logFile.write("Could not compress benchmark " + benchmark + ": " + str(e) + "\n")
+        logFile.close()
+
+# Merges the results of every invocation of a benchmark into its results file
+# ARGS: the benchmark name, the invocations' results files
+# RETURNS: nothing
+def mergeBenchmark(benchmark, partResFiles):
+    logFile = open(vgLogFile, 'a')
+    try:
+        # The results of the invocations that did run are kept for a look, and for --resume
+        if benchmark in failedList:
+            raise ValueError("an invocation failed")
+        missing = [path for path in partResFiles if not os.path.isfile(path)]
+        if missing:
+            raise IOError("missing results " + ", ".join(missing))
+        if args.capture_trace:
+            # Traces stay one per invocation - the sweep adds up their simulations
+            logFile.write("Captured the " + str(len(partResFiles)) + " invocations of benchmark " + benchmark + "\n")
+        else:
+            vgSpec2017Parser.mergeCachegrindOuts(partResFiles, vgSpec2017Compress.compressedName(vgSpecThisResultsDir + benchmark + ".txt", args.compress))
+            for path in partResFiles:
+                os.remove(path)
+            logFile.write("Merged the " + str(len(partResFiles)) + " invocations of benchmark " + benchmark + "\n")
+        if benchmark not in failedList:
+            journal.record("done", benchmark=benchmark)
+    except Exception as e:
+        logFile.write("Could not merge benchmark " + benchmark + ": " + str(e) + "\n")
+    logFile.close()
+
+# Benchmarks with several invocations: {invocation results file : benchmark} and
+# {benchmark : every invocation results file}
+partOf = {}
+benchmarkParts = {}
+# Benchmarks with an invocation valgrind failed on - never marked done, so a resume runs them again
+failedList = set()
+
+# Expected peak memory of a job (KB) from like runs, or the --job-mem guess for new jobs
+def expectedMemory(job):
+    return history.expectedPeak(job.name) or int(args.job_mem * 1024 * 1024)
+
+# The priority each benchmark's jobs are expected with, worked out once before staging
+# starts. The history changes as jobs finish, so working it out again at each hand-in
+# could give a priority the pool was never told to expect.
+benchmarkPriorities = {}
+
+# Expected runtime of a job from like runs. Jobs never seen before get the estimate
+# their benchmark was ordered by, so they keep their place among the benchmarks.
+# ARGS: the job
+# RETURNS: the expected runtime in seconds (0 with nothing to go on)
+def expectedRuntime(job):
+    return history.expected(job.name) or benchmarkPriorities.get(job.name.split(" (")[0]) or 0
+
+# The wall-clock time a job may run before it is killed, scaled to the runtime of like runs
+# ARGS: the job
+# RETURNS: the timeout in seconds, None for no limit
+def jobTimeout(job):
+    expected = history.expected(job.name)
+    if expected is None:
+        return args.job_timeout or None
+    if not args.timeout_factor:
+        return None
+    return max(expected * args.timeout_factor, args.timeout_min)
+
+# Checks the result a job left, once valgrind exited cleanly
+# ARGS: the job
+# RETURNS: None if the result is complete, else what is wrong with it
+def checkResult(job):
+    if not os.path.isfile(job.resFile):
+        return "no result was written"
+    if args.capture_trace:
+        return None
+    return vgSpec2017Parser.checkCachegrindOut(job.resFile)
+
+# RETURNS: the priority a benchmark's jobs are expected with (None in staging order)
+def stagePriority(benchmark):
+    return benchmarkPriorities.get(benchmark)
+
+# Stage every benchmark in parallel - each one is queued for valgrind as soon as
+# its own staging is done, and the pool decides how many run at once
+# Jobs are only started when their expected peak memory fits
+memoryOf = expectedMemory if args.mem_check else None
+memoryReserve = int(args.mem_reserve * 1024 * 1024)
+# With workers, every host takes the next queued job whenever it has a free slot
+executor = vgSpec2017Remote.RemoteExecutor(workers, baseOperatingDir) if workers else None
+if executor:
+    # The memory left on the workers' hosts is not known here
+    memoryOf = None
+if args.schedule == "longest":
+    # Longest jobs first, so no long job is left to start at the end of the run. Shorter
+    # jobs also wait for longer benchmarks that are still being staged.
+    jobPool = vgSpec2017Jobs.JobPool(args.jobs, expectedRuntime, memoryOf, memoryReserve, executor,
+                                     jobTimeout, checkResult, max(args.retries, 0), args.retry_delay)
+    for benchmark in benchmarkList:
+        benchmarkPriorities[benchmark] = vgSpec2017Jobs.expectedBenchmarkRuntime(benchmark, history)
+    benchmarkList.sort(key=stagePriority, reverse=True)
+else:
+    jobPool = vgSpec2017Jobs.JobPool(args.jobs, None, memoryOf, memoryReserve, executor,
+                                     jobTimeout, checkResult, max(args.retries, 0), args.retry_delay)
+for benchmark in benchmarkList:
+    jobPool.expect(1, stagePriority(benchmark))
+logFile = open(vgLogFile, 'a')
+for benchmark in benchmarkList:
+        # Create the meta log for this benchmark
         logFile.write("Creating log file for benchmark " + benchmark + "...\n")
         thisBenchmarkLog = vgLogsDir + benchmark + "_log.txt"
-        bmkLog = open(thisBenchmarkLog, 'wr')
+        bmkLog = open(thisBenchmarkLog, 'w')
         bmkLog.write("Scheduled...\n")
         bmkLog.close()
-        benchmarkLogList.append(thisBenchmarkLog)
-        # Get the executable path for this benchmark
-        # First need to get the actaul executable directory of the form "run_base_refrate_mytest-m64.0000/"
-        # Obviously the name could change from config file to config file, but "run_base" should stay the same
-        thisRunDir = vgBenchDir + benchmark + "/" + spec2017RunDir
-        mostRecentExeDir = findMostRecentExeDir(thisRunDir)
-        thisBenchmarkExeDir = vgBenchDir + benchmark + "/" + spec2017RunDir + mostRecentExeDir
-        # Get the results file name
-        thisBenchmarkResFile = vgSpecThisResultsDir + benchmark + ".txt"
-        # Start the monitor on this benchmark - args are (1) this benchmark exe path (2) this log file to write to (3) the results directory
-        MonitorCmd = "python " + vgMonitorSubprocScript + " " + thisBenchmarkExeDir + " " + thisBenchmarkLog + " " + thisBenchmarkResFile
-        logFile.write("Starting benchmark " + benchmark + "\n")
-        Monitor = subprocess.Popen(MonitorCmd, shell = True)
-	    Monitor.communicate()
+logFile.write("Running at most " + str(jobPool.maxJobs) + " benchmarks at once, " +
+              ("longest expected first" if args.schedule == "longest" else "in staging order") + "\n")
+if executor:
+    logFile.write("Running jobs on " + str(len(workers)) + " workers with " + str(executor.capacity()) +
+                  " slots: " + ", ".join(str(slots) + ":" + command for slots, command in workers) + "\n")
+if memoryOf and vgSpec2017Jobs.availableMemory() is not None:
+    logFile.write("Admitting jobs by expected peak memory: " + "{0:.1f}".format(vgSpec2017Jobs.availableMemory() / 1048576.0) +
+                  " GB available, " + str(args.mem_reserve) + " GB kept free\n")
 logFile.write("BENCHMARK SCHEDULING END\n\n")
 logFile.close()
+stagePool = ThreadPool(max(args.stage_jobs, 1))
+for benchmark in benchmarkList:
+    stagePool.apply_async(stageBenchmark, (benchmark,))
 
 
 #########################################
 #         MANAGE THE PROCESSES          #
 #########################################
-# Poll the log files for completion signals until run is complete
-completedBenchmarks = []
-while True:
-    for log in benchmarkLogList:
-        # print completedBenchmarks
-        checkedLog = open(log, 'r')
-        bmkStatus = checkedLog.readline()
-        checkedLog.close()
-        bmkStatus = bmkStatus.rstrip()
-        # By convention, the firts line of the meta log will read "Benchmark Done"
-        if (bmkStatus == "Done" and log not in completedBenchmarks):
-            completedBenchmarks.append(log)
-            # Update the overall run completion percentage
-            logFile = open(vgLogFile, 'a')
-            percentComplete = (float(len(completedBenchmarks)) / float(len(benchmarkLogList))) * 100.00
-            percentCompleteStr = str(percentComplete)
-            timeOfCompleteStr = str((time.time() - startTime)/3600)
-            notifyCompleteStr = "Benchmark logged in " + log + " has completed with a runtime of " + timeOfCompleteStr[:5] + " hours\n"
-            complPcntStr = percentCompleteStr[:5] + "% of jobs completed at " + timeOfCompleteStr + " elapsed hours\n"
-            updateStr = notifyCompleteStr + complPcntStr
-            logFile.write(updateStr)
-            logFile.close()
-        # Check if all benchmarks have completed and been processed
-        if (len(completedBenchmarks) == len(benchmarkLogList)):
-            totalRunTime = str((time.time() - startTime)/3600)
-            runCompleteStr = "All benchmarks complete. Total run time was " + totalRunTime + " elapsed hours\n"
-            endRunStr = "\n\n*************** <> ENDING VGSPEC2017 RUN <> ***************\n"
-            finalStr = runCompleteStr + endRunStr
-            logFile = open(vgLogFile, 'a')
-            logFile.write(finalStr)
-            logFile.close()
-            # If the run is done, quit
-            quit()
-    # Should give some time before checking again
-    time.sleep(3)
+# Estimates how much longer the run will take from the runtimes of earlier runs
+# RETURNS: a line for the run log
+def etaLine():
+    # Jobs that never ran before are assumed to take as long as a typical job
+    finished = [job.runTime() for job in jobPool.completed]
+    defaultRuntime = history.typical()
+    if defaultRuntime is None and finished:
+        defaultRuntime = sum(finished) / len(finished)
+    if defaultRuntime is None:
+        return "Estimated time remaining: unknown until the first job finishes\n"
+    remaining = vgSpec2017Jobs.estimateRemaining(jobPool, lambda job: history.expected(job.name), defaultRuntime)
+    events.record("eta", remaining=remaining)
+    finishAt = datetime.datetime.now() + datetime.timedelta(seconds=remaining)
+    return "Estimated time remaining: " + str(remaining/3600)[:5] + " hours (done around " + finishAt.strftime("%m/%d %H:%M") + ")\n"
+
+# Log every benchmark as it is started by the pool
+def logStart(job):
+    events.record("start", job=job.name, benchmark=partOf.get(job.resFile, job.name), exeDir=job.exeDir, resFile=job.resFile, host=job.host)
+    logFile = open(vgLogFile, 'a')
+    logFile.write("Starting benchmark " + job.name + (" on " + job.host if job.host else "") + "\n")
+    logFile.write(etaLine())
+    logFile.close()
+
+# Update the overall run completion percentage as benchmarks finish
+def logDone(job):
+    logFile = open(vgLogFile, 'a')
+    percentComplete = (float(len(jobPool.completed)) / float(jobPool.numJobs())) * 100.00
+    percentCompleteStr = str(percentComplete)
+    timeOfCompleteStr = str((time.time() - startTime)/3600)
+    notifyCompleteStr = "Benchmark logged in " + job.logFile + " has completed with a runtime of " + str(job.runTime()/3600)[:5] + " hours\n"
+    complPcntStr = percentCompleteStr[:5] + "% of jobs completed at " + timeOfCompleteStr + " elapsed hours\n"
+    benchmark = partOf.get(job.resFile, job.name)
+    # Record what the job cost and keep its runtime for later estimates
+    endRecord = {"job": job.name, "benchmark": benchmark, "returncode": job.returncode,
+                 "start": job.startTime, "end": job.endTime, "runtime": job.runTime(),
+                 "maxRssKB": job.maxRss, "userCpu": job.userTime, "sysCpu": job.sysTime, "oomKills": job.oomKills,
+                 "failure": job.failure, "retries": job.failures}
+    events.record("end", **endRecord)
+    history.add(endRecord)
+    if job.failure:
+        notifyCompleteStr = notifyCompleteStr + "Benchmark " + job.name + " FAILED after " + str(job.failures + 1) + " attempts: " + job.failure + "\n"
+    updateStr = notifyCompleteStr + complPcntStr + etaLine()
+    logFile.write(updateStr)
+    logFile.close()
+    journal.record("simulated", benchmark=benchmark, job=job.name, key=job.key, returncode=job.returncode, runtime=job.runTime())
+    if job.failure is None:
+        if simCache and job.key:
+            simCache.store(job.key, job.resFile)
+        if job.resFile not in partOf:
+            journal.record("done", benchmark=benchmark)
+            stagePool.apply_async(compressBenchmark, (benchmark,))
+    else:
+        failedList.add(benchmark)
+        journal.record("failed", benchmark=benchmark, job=job.name, reason=job.failure)
+    # Merge a benchmark's invocations in the background once the last one is done
+    if job.resFile in partOf:
+        partResFiles = benchmarkParts[benchmark]
+        if all(other.resFile not in partResFiles for other in jobPool.running + list(jobPool.pending)):
+            stagePool.apply_async(mergeBenchmark, (benchmark, partResFiles))
+
+# Pass valgrind's own messages (prefixed with "==<pid>==") through to the run log
+def logProgress(job, line):
+    if line.startswith("=="):
+        logFile = open(vgLogFile, 'a')
+        logFile.write(job.name + ": " + line + "\n")
+        logFile.close()
+
+# Note every job the OOM killer took down, lost with its worker or that failed, and that is queued again
+def logRequeue(job):
+    events.record("requeue", job=job.name, benchmark=partOf.get(job.resFile, job.name), runtime=time.time() - job.startTime,
+                  maxRssKB=job.maxRss, memoryHintKB=job.memoryHint, oomKills=job.oomKills, lostHost=job.lostHost,
+                  failure=job.failure, retries=job.failures)
+    logFile = open(vgLogFile, 'a')
+    if job.lostHost is not None:
+        logFile.write("Benchmark " + job.name + " was lost with worker " + job.lostHost + ", queued again for the other workers\n")
+    elif job.failure is not None:
+        logFile.write("Benchmark " + job.name + " failed (" + job.failure + "), retry " + str(job.failures) + " of " +
+                      str(args.retries) + " in " + str(int(job.notBefore - time.time() + 0.5)) + " s\n")
+    else:
+        logFile.write("Benchmark " + job.name + " was killed for running out of memory at " + str(job.maxRss) +
+                      " KB, queued again to run with at least " + str(job.memoryHint) + " KB free\n")
+    logFile.close()
+
+try:
+    jobPool.run(logStart, logDone, logProgress, logRequeue)
+finally:
+    if executor:
+        executor.close()
+# Wait for the last merges
+stagePool.close()
+stagePool.join()
+if simCache:
+    simCache.save()
+# Program totals of every benchmark side by side (traces have no totals until they are swept)
+if not args.capture_trace:
+    vgSpec2017Summary.buildRunSummary(vgSpecThisResultsDir)
+# All benchmarks have completed and been processed
+totalRunTime = str((time.time() - startTime)/3600)
+runCompleteStr = "All benchmarks complete. Total run time was " + totalRunTime + " elapsed hours\n"
+# How close the schedule came to the best possible one
+if jobPool.completed:
+    makespan = max(job.endTime for job in jobPool.completed) - min(job.startTime for job in jobPool.completed)
+    lowerBound = vgSpec2017Jobs.makespanLowerBound([job.runTime() for job in jobPool.completed], jobPool.maxJobs)
+    events.record("makespan", makespan=makespan, lowerBound=lowerBound, schedule=args.schedule)
+    runCompleteStr = runCompleteStr + "Simulation makespan was " + str(makespan/3600)[:5] + " hours against a lower bound of " + str(lowerBound/3600)[:5] + " hours"
+    if lowerBound > 0:
+        runCompleteStr = runCompleteStr + " (" + "{0:.1f}".format((makespan / lowerBound - 1) * 100) + "% over)"
+    runCompleteStr = runCompleteStr + "\n"
+if failedList:
+    runCompleteStr = runCompleteStr + str(len(failedList)) + " benchmarks FAILED: " + " ".join(sorted(failedList)) + "\n"
+endRunStr = "\n\n*************** <> ENDING VGSPEC2017 RUN <> ***************\n"
+finalStr = runCompleteStr + endRunStr
+logFile = open(vgLogFile, 'a')
+logFile.write(finalStr)
+logFile.close()
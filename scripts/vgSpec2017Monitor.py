@@ -10,6 +10,7 @@
 #   1) The full path of the dirctory of the benchmark executable
 #   2) The full path of the meta log file for signaling the status of this benchmark
 #   3) The full path of the file to store the results for this benchmark
+#   4) OPTIONAL: comma separated functions to limit collection to
 #
 # NOTE: This Software is provided AS IS.
 # If we did not have as much control over these parameters
@@ -25,30 +26,35 @@
 
 import os
 import datetime
-import time
 import subprocess
+import shlex
 import sys
 import random
+import vgSpec2017Jobs
+import vgSpec2017Parser
 
 
 # Args to this script
 #   1) The full path of the dirctory of the benchmark executable
 #   2) The full path of the meta log file for signaling the status of this benchmark
 #   3) The full path of the file to store the results for this benchmark
+#   4) OPTIONAL: comma separated functions to limit collection to
 # Process CLA
-if (len(sys.argv) != 4):
+if (len(sys.argv) != 4 and len(sys.argv) != 5):
     print ("USAGE\t:\n(1) The absolute path to the benchmark executable folder\n"+
                      "(2) The absolute path to the benchmark meta log file\n"+
-                     "(3) The absolute path of the file to store the results for this benchmark")
+                     "(3) The absolute path of the file to store the results for this benchmark\n"+
+                     "(4) OPTIONAL: comma separated functions to limit collection to")
     quit()
 else:
     benchmarkExeDir = sys.argv[1]
     benchmarkLogFile = sys.argv[2]
     benchmarkResFile = sys.argv[3]
+    toggleCollect = [fn for fn in sys.argv[4].split(",") if fn] if len(sys.argv) == 5 else []
 
 # Set up necessary absolute paths (taken from vgSpec2017Manager.py)
 # Absolute path to the workspace
-baseOperatingDir = "/local/alec/cole_workspace/"
+baseOperatingDir = os.path.join(os.path.abspath(vgSpec2017Jobs.defaultWorkspace), "")
 vgSpecDir = baseOperatingDir + "vgSpec2017/"
 #vgSpec2017 Subdirectories
 vgScriptsDir = vgSpecDir + "scripts/"
@@ -56,11 +62,10 @@ vgLogsDir = vgSpecDir + "logs/"
 vgLogFile = vgLogsDir + "logfile.txt"
 vgBenchDir = vgSpecDir + "benchmarks/"
 vgResultDir = vgSpecDir + "results/"
-vgExeCmdFile = "speccmds.cmd" # Expected in the benchmarkExeDir directory passed in
 
 
 # Initialize the meta log file
-metaLogFile = open(benchmarkLogFile, "wr")
+metaLogFile = open(benchmarkLogFile, "w")
 metaLogStartStr = "Running...\n" + "Executing benchmark in folder: " + benchmarkExeDir + "\n"
 metaLogFile.write(metaLogStartStr)
 metaLogFile.close()
@@ -79,27 +84,9 @@ metaLogFile.close()
 # metaLogFile.close()
 # quit()
 
-# Change directories and prepare the run by getting the executable command
+# Change directories and prepare the run by getting the executable commands
 os.chdir(benchmarkExeDir)
-with open(vgExeCmdFile) as f:
-    commands = f.readlines()
-exeCommand = ""
-copyDone = False;
-for cmd in commands:
-    if ((cmd[0:2] == "-o" or cmd[0:2] == "-i") and not copyDone):
-        # Once the -o or -i flag is seen, get the command from the line (and just the command)
-        i = 0
-        exeCommand = ""
-        copyStart = False;
-        for i in range(len(cmd)):
-            if(cmd[i:i+3] == "../"):
-                copyStart = True;
-                exeCommand = exeCommand + cmd[i]
-            elif(cmd[i:i+2] == " >"):
-                copyDone = True
-                break;
-            elif(copyStart):
-                exeCommand = exeCommand + cmd[i]
+exeCommands = vgSpec2017Jobs.getExeCommands(benchmarkExeDir)
 
 # # DEBUG - Command generation verification
 # resFile = open(benchmarkResFile, "wr")
@@ -110,31 +97,37 @@ for cmd in commands:
 # metaLogFile.close()
 # quit()
 
-# Start valgrind on the benchmark
+# Start valgrind on each invocation of the benchmark and block on its exit - the exit
+# status says the trace is done, so the log never has to be re-read
+if len(exeCommands) > 1:
+    partResFiles = [vgSpec2017Jobs.getPartResFile(benchmarkResFile, part) for part in range(len(exeCommands))]
+else:
+    partResFiles = [benchmarkResFile]
+failures = []
 with open(benchmarkLogFile, 'w') as output:
-    valgrindCmd = "valgrind --tool=cachegrind --branch-sim=yes --LL=2097152,16,64 --cachegrind-out-file=" + benchmarkResFile + " " + exeCommand
-    StartSimCmd = valgrindCmd + " &"
-    StartSim = subprocess.Popen(StartSimCmd, stdout=output, stderr=subprocess.STDOUT, shell=True)
-    StartSim.communicate()
-
-# Constantly check output file for keyword "LL miss rate:" which asserts whether the trace is done or not.
-DoneFlag = False
-while(1):
-    txtfile = open(benchmarkLogFile, 'r')
-    lines = txtfile.readlines()
-    txtfile.close()
-    for line in lines:
-        if line.find("LL miss rate:") != -1:
-            DoneFlag = True
-            break
-    if DoneFlag != True:
-        time.sleep(3)
-    else:
-        break
+    for exeCommand, partResFile in zip(exeCommands, partResFiles):
+        valgrindCmd = vgSpec2017Jobs.getValgrindCmd(partResFile, exeCommand, toggleCollect)
+        StartSim = subprocess.Popen(shlex.split(valgrindCmd), stdout=output, stderr=subprocess.STDOUT)
+        StartSim.wait()
+        # A crashed valgrind leaves no result, or one cut short
+        if StartSim.returncode != 0:
+            failures.append(exeCommand + ": valgrind exited with " + str(StartSim.returncode))
+        elif not os.path.isfile(partResFile):
+            failures.append(exeCommand + ": no result was written")
+        elif vgSpec2017Parser.checkCachegrindOut(partResFile):
+            failures.append(exeCommand + ": " + vgSpec2017Parser.checkCachegrindOut(partResFile))
+    for failure in failures:
+        output.write("FAILED " + failure + "\n")
+# Let the manager know that I have failed, keeping whatever results there are
+if failures or not exeCommands:
+    vgSpec2017Jobs.writeStatus(benchmarkLogFile, "Failed")
+    sys.exit(1)
+# Several invocations are merged into the one results file
+if len(exeCommands) > 1:
+    vgSpec2017Parser.mergeCachegrindOuts(partResFiles, benchmarkResFile)
+    for partResFile in partResFiles:
+        os.remove(partResFile)
 
 # Let the manager know that I have finished
-metaLogFile = open(benchmarkLogFile, "r+b")
-metaLogFile.seek(0,0)
-metaLogFile.write("Done     \n") # Added the extra spaces to make it look nice - no functional impact
-metaLogFile.close()
+vgSpec2017Jobs.writeStatus(benchmarkLogFile, "Done")
 sys.exit()
@@ -0,0 +1,275 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Reads raw cachegrind output files (the "###.bmk_name.txt" files a
+# vgSpec 2017 run leaves in its results folder) straight into an
+# in-memory table, so the results can be analyzed without running
+# cg_annotate first. Also reads callgrind output written with name and
+# position compression off, which is what region-of-interest runs make.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import vgSpec2017Compress
+
+# Bumped whenever the parsed table changes shape or meaning
+PARSER_VERSION = 3
+
+# The events a vgSpec 2017 run collects, in cachegrind's order
+cgEvents = ['Ir', 'I1mr', 'ILmr', 'Dr', 'D1mr', 'DLmr', 'Dw', 'D1mw', 'DLmw', 'Bc', 'Bcm', 'Bi', 'Bim']
+
+# The parsed contents of one cachegrind output file
+#   events    : the event names, in the order of every count list
+#   summary   : the program totals, one count per event
+#   functions : {(source file, function) : {line number : [count per event]}}
+class CgTable(object):
+    def __init__(self):
+        self.desc = []
+        self.cmd = ""
+        self.events = []
+        self.summary = []
+        self.functions = {}
+
+    # RETURNS: the column of the given event (i.e. "DLmr") in every count list
+    def eventIndex(self, event):
+        return self.events.index(event)
+
+    # RETURNS: the program total for the given event
+    def total(self, event):
+        return self.summary[self.eventIndex(event)]
+
+    # Sums the given event over every function, like cg_annotate does per source line
+    # RETURNS: {(source file, line number) : count} for every line with a nonzero count
+    def lineTotals(self, event):
+        eventIndex = self.eventIndex(event)
+        totals = {}
+        for (fl, fn), lines in self.functions.items():
+            for lineNo, counts in lines.items():
+                value = counts[eventIndex]
+                if value:
+                    key = (fl, lineNo)
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+# Splits the "(id) name" compression valgrind may use for file and function names
+# ARGS: the text after "fl=" or "fn=", the table of names seen so far
+# RETURNS: the full name
+def _expandName(text, names):
+    if text[0:1] == "(":
+        end = text.index(")")
+        nameId = text[1:end]
+        name = text[end+1:].strip()
+        if name:
+            names[nameId] = name
+        return names.get(nameId, name)
+    return text
+
+# Parses a raw cachegrind output file in a single pass
+# ARGS: the full path of the cachegrind output file
+# RETURNS: a CgTable holding every per-line count in the file
+def parseCachegrindOut(resultToParse):
+    table = CgTable()
+    fileNames = {}
+    fnNames = {}
+    fl = "???"      # The file of the current function
+    fi = fl         # The file the records are from, which an inlined function changes
+    fn = "???"
+    lines = table.functions.setdefault((fi, fn), {})
+    numEvents = 0
+    skipCallCost = False
+    with vgSpec2017Compress.openResult(resultToParse) as f:
+        for line in f:
+            # Per-line event records are by far the most common, so check for them first
+            if line[0:1].isdigit():
+                # Callgrind follows a "calls=" line with the inclusive cost of the call,
+                # which is already counted in the callee
+                if skipCallCost:
+                    skipCallCost = False
+                    continue
+                splitData = line.split()
+                lineNo = int(splitData[0])
+                counts = [int(x) for x in splitData[1:]]
+                # Trailing zero counts may be left off
+                if len(counts) < numEvents:
+                    counts.extend([0] * (numEvents - len(counts)))
+                if lineNo in lines:
+                    old = lines[lineNo]
+                    for i in range(numEvents):
+                        old[i] += counts[i]
+                else:
+                    lines[lineNo] = counts
+            elif line.startswith("fn="):
+                fn = _expandName(line[3:].rstrip("\n"), fnNames)
+                # An inlined file only lasts until the next function, which is back in its own file
+                fi = fl
+                lines = table.functions.setdefault((fi, fn), {})
+            elif line.startswith("fl="):
+                fl = fi = _expandName(line[3:].rstrip("\n"), fileNames)
+                lines = table.functions.setdefault((fi, fn), {})
+            elif line.startswith("fi=") or line.startswith("fe="):
+                # Callgrind's inlined code: the records that follow are from another file
+                fi = _expandName(line[3:].rstrip("\n"), fileNames)
+                lines = table.functions.setdefault((fi, fn), {})
+            elif line.startswith("events:"):
+                table.events = line[7:].split()
+                numEvents = len(table.events)
+            elif line.startswith("calls="):
+                skipCallCost = True
+            elif line.startswith("summary:") or line.startswith("totals:"):
+                table.summary = [int(x) for x in line.split(":", 1)[1].split()]
+            elif line.startswith("desc:"):
+                table.desc.append(line[5:].strip())
+            elif line.startswith("cmd:"):
+                table.cmd = line[4:].strip()
+    # Drop the empty entries left by switching file before function
+    table.functions = dict((key, lines) for key, lines in table.functions.items() if lines)
+    # Fall back on summing the records if the summary line is missing
+    if len(table.summary) != numEvents:
+        table.summary = [0] * numEvents
+        for lines in table.functions.values():
+            for counts in lines.values():
+                for i in range(numEvents):
+                    table.summary[i] += counts[i]
+    return table
+
+# Reads just the events and program totals of a raw result. The "events:" line is at the
+# top of the file and the "summary:" line at the bottom, so only the two ends are read.
+# A compressed result cannot be read from the end, so it is decompressed in one pass.
+# ARGS: the full path of the cachegrind output file, how many bytes at the end to search
+# RETURNS: (events, summary) - the whole file is parsed if the summary is not near the end
+def readSummary(resultToParse, tailBytes=65536):
+    if vgSpec2017Compress.methodOf(resultToParse):
+        return readSummaryStream(resultToParse)
+    events, summary = _readEnds(resultToParse, tailBytes)
+    if events is None or summary is None or len(summary) != len(events):
+        table = parseCachegrindOut(resultToParse)
+        return table.events, table.summary
+    return events, summary
+
+# Reads the "events:" line at the top of an uncompressed result and the last "summary:"
+# line in the given number of bytes at its end
+# ARGS: the full path of the cachegrind output file, how many bytes at the end to search
+# RETURNS: (events, summary), either None if its line was not found
+def _readEnds(resultToParse, tailBytes):
+    events = None
+    with open(resultToParse, 'rb') as f:
+        for line in f:
+            if line.startswith(b"events:"):
+                events = line[7:].decode("utf-8").split()
+                break
+            # The events always come before the first record
+            if line[0:1].isdigit() or line.startswith(b"fl=") or line.startswith(b"fn="):
+                break
+        f.seek(0, 2)
+        f.seek(max(f.tell() - tailBytes, 0))
+        tail = f.read()
+    summary = None
+    for line in reversed(tail.splitlines()):
+        if line.startswith(b"summary:") or line.startswith(b"totals:"):
+            summary = [int(x) for x in line.split(b":", 1)[1].split()]
+            break
+    # Trailing zero totals may be left off, like in the records
+    if events is not None and summary is not None and len(summary) < len(events):
+        summary.extend([0] * (len(events) - len(summary)))
+    return events, summary
+
+# Checks that valgrind wrote a raw result out in full. The "summary:" line is written
+# last, so a result cut short by a crash or a kill has none.
+# ARGS: the full path of the (uncompressed) cachegrind output file, how many bytes at the end to search
+# RETURNS: None if the result is complete, else what is wrong with it
+def checkCachegrindOut(resultToCheck, tailBytes=65536):
+    if os.path.getsize(resultToCheck) == 0:
+        return "the result is empty"
+    try:
+        events, summary = _readEnds(resultToCheck, tailBytes)
+    except ValueError:
+        return "the result is not cachegrind output"
+    if events is None:
+        return "the result has no events line"
+    if summary is None:
+        return "the result has no summary line, it was cut short"
+    if len(summary) != len(events):
+        return "the result's summary does not match its events"
+    return None
+
+# Same as readSummary, in one forward pass that only splits the "events:" and "summary:" lines
+# ARGS: the full path of the cachegrind output file
+# RETURNS: (events, summary)
+def readSummaryStream(resultToParse):
+    events = None
+    summary = None
+    with vgSpec2017Compress.openResult(resultToParse, 'rb') as f:
+        for line in f:
+            if line.startswith(b"summary:") or line.startswith(b"totals:"):
+                summary = [int(x) for x in line.split(b":", 1)[1].split()]
+            elif events is None and line.startswith(b"events:"):
+                events = line[7:].decode("utf-8").split()
+    if events is not None and summary is not None and len(summary) < len(events):
+        summary.extend([0] * (len(events) - len(summary)))
+    if events is None or summary is None or len(summary) != len(events):
+        table = parseCachegrindOut(resultToParse)
+        return table.events, table.summary
+    return events, summary
+
+# Adds several parsed results together, the same way cg_merge does
+# ARGS: a list of CgTables, all with the same events
+# RETURNS: a new CgTable holding the sum of every table
+def mergeCgTables(tables):
+    merged = CgTable()
+    merged.desc = list(tables[0].desc)
+    merged.events = list(tables[0].events)
+    merged.cmd = "; ".join(table.cmd for table in tables if table.cmd)
+    numEvents = len(merged.events)
+    merged.summary = [0] * numEvents
+    for table in tables:
+        if table.events != merged.events:
+            raise ValueError("cannot merge results with different events: " +
+                             " ".join(table.events) + " vs " + " ".join(merged.events))
+        for i in range(numEvents):
+            merged.summary[i] += table.summary[i]
+        for key, lines in table.functions.items():
+            mergedLines = merged.functions.setdefault(key, {})
+            for lineNo, counts in lines.items():
+                if lineNo in mergedLines:
+                    old = mergedLines[lineNo]
+                    for i in range(numEvents):
+                        old[i] += counts[i]
+                else:
+                    mergedLines[lineNo] = list(counts)
+    return merged
+
+# Writes a table back out as a cachegrind output file cg_annotate can read
+# ARGS: the CgTable, the full path of the file to write (compressed if it ends in .gz or .zst)
+# RETURNS: nothing
+def writeCachegrindOut(table, resultToWrite):
+    # A retried job may be merging the same benchmark, so the temporary file is its own
+    tmpPath = vgSpec2017Compress.tempPath(resultToWrite)
+    with vgSpec2017Compress.openResult(tmpPath, 'w', vgSpec2017Compress.methodOf(resultToWrite)) as out:
+        for desc in table.desc:
+            out.write("desc: " + desc + "\n")
+        out.write("cmd: " + table.cmd + "\n")
+        out.write("events: " + " ".join(table.events) + "\n")
+        for fl, fn in sorted(table.functions):
+            out.write("fl=" + fl + "\nfn=" + fn + "\n")
+            lines = table.functions[(fl, fn)]
+            for lineNo in sorted(lines):
+                out.write(str(lineNo) + " " + " ".join(str(x) for x in lines[lineNo]) + "\n")
+        out.write("summary: " + " ".join(str(x) for x in table.summary) + "\n")
+    os.rename(tmpPath, resultToWrite)
+
+# Merges the results of every invocation of a benchmark into one result
+# ARGS: the full paths of the results to merge, the full path of the merged result
+# RETURNS: nothing
+def mergeCachegrindOuts(resultsToMerge, mergedResult):
+    writeCachegrindOut(mergeCgTables([parseCachegrindOut(path) for path in resultsToMerge]), mergedResult)
@@ -0,0 +1,525 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# A long-lived query service over the parsed results of any number of
+# runs. "serve" starts a local HTTP server answering in JSON; the other
+# commands are its client. Questions like "the top 20 D1mr lines in
+# 505.mcf_r" or "which benchmark has the worst branch miss rate" are then
+# answered in milliseconds, without re-running vgSpec2017GetResults.py
+# and without reading or writing the formatted/ tree.
+#
+# A benchmark's table is only loaded the first time it is asked about
+# (from the run's "cache/" folder when it can be, see vgSpec2017Cache.py)
+# and stays in memory until the least recently used tables are evicted
+# to keep within --max-tables and --max-mb. A table whose raw result has
+# changed since it was loaded is loaded again.
+#
+# The server needs NumPy, same as vgSpec2017Engine. The client does not.
+#
+# Args to this script
+#   serve       Start the server
+#     --port N        The port to listen on (default: 8017)
+#     --bind ADDR     The address to listen on (default: 127.0.0.1, this host only)
+#     --max-tables N  The most benchmark tables kept in memory (default: 16)
+#     --max-mb N      The most memory the kept tables may take (default: 4096)
+#     --workspace DIR The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#                     else /local/alec/cole_workspace/)
+#   runs                      List the runs and their benchmarks
+#   top RUN BMK               The hottest source lines of a benchmark (--event, -k)
+#   rollup RUN BMK            The hottest functions (--by fn) or source files (--by fl)
+#   region RUN BMK FILE LINE  The counts of every event around a line (--radius)
+#   rank RUN                  The benchmarks of a run ranked by an event or derived metric (--key, -k)
+#   stats                     What the server has loaded
+#   --server URL              The server to ask (default: http://127.0.0.1:8017)
+#   --json                    Print the server's answer as it is
+#
+# i.e. vgSpec2017Query.py top 3_21_vgRun 505.mcf_r --event D1mr -k 20
+#      curl "http://127.0.0.1:8017/rank?run=3_21_vgRun&key=Bmrate"
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import json
+import time
+import argparse
+import linecache
+import threading
+from collections import OrderedDict
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, urlencode
+    from urllib.request import urlopen
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import urlencode
+    from urllib2 import urlopen, HTTPError, URLError
+import vgSpec2017Jobs
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Cache
+import vgSpec2017Summary
+
+#########################################
+#           QUERY SETTINGS              #
+#########################################
+defaultPort = 8017
+defaultServer = "http://127.0.0.1:" + str(defaultPort)
+
+# A bad query, answered with the given HTTP status
+class QueryError(Exception):
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+#########################################
+#           LOADED TABLES               #
+#########################################
+# A benchmark's EventTable, with what its queries need worked out once
+#   source    : (raw result, size, mtime) the table was loaded from
+#   lineKeys  : every (source file, line number) with a count, packed as file * numLines + line, sorted
+#   lineCounts: lines x events array of counts, summed over every function
+class LoadedTable(object):
+    def __init__(self, table, source):
+        np = vgSpec2017Engine.np
+        self.table = table
+        self.source = source
+        self.numLines = int(table.lines.max()) + 1 if len(table.lines) else 1
+        self.lineKeys, inverse = np.unique(table.files * self.numLines + table.lines, return_inverse=True)
+        self.lineCounts = table.groupTotals(inverse.ravel(), len(self.lineKeys))
+        self.rollups = {}
+        self.nbytes = (table.counts.nbytes + table.lines.nbytes + table.files.nbytes + table.fns.nbytes +
+                       self.lineKeys.nbytes + self.lineCounts.nbytes)
+
+    # RETURNS: the (group names, groups x events counts) of a rollup by "fl" or "fn", worked out once
+    def rollup(self, by):
+        if by not in self.rollups:
+            self.rollups[by] = self.table.rollup(by)
+        return self.rollups[by]
+
+    # Finds a source file from its full path or the end of it (i.e. "mcf.c" or "src/mcf.c")
+    # RETURNS: the file's index into the table's fileNames
+    def findFile(self, name):
+        if name in self.table.fileNames:
+            return self.table.fileNames.index(name)
+        matches = [i for i, fileName in enumerate(self.table.fileNames) if fileName.endswith("/" + name.lstrip("/"))]
+        if len(matches) != 1:
+            raise QueryError(("no source file matches " if not matches else "several source files match ") + name +
+                             "".join(" " + self.table.fileNames[i] for i in matches[:10]), 404)
+        return matches[0]
+
+# Keeps the most recently used tables in memory
+class TableCache(object):
+    def __init__(self, maxTables, maxBytes):
+        self.maxTables = maxTables
+        self.maxBytes = maxBytes
+        self.tables = OrderedDict() # {(run, benchmark) : LoadedTable}, least recently used first
+        self.lock = threading.Lock()
+        self.loading = {} # {(run, benchmark) : [lock held while loading, threads using it]}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Gets a table, loading it if it is not kept or its raw result changed
+    # ARGS: the (run, benchmark) key, (raw result, size, mtime) of the result now, a
+    # function loading the table
+    # RETURNS: the LoadedTable
+    def get(self, key, source, load):
+        with self.lock:
+            entry = self.kept(key, source)
+            if entry is not None:
+                return entry
+            # One thread loads a key, the others asking for it wait for that load
+            loading = self.loading.setdefault(key, [threading.Lock(), 0])
+            loading[1] += 1
+        try:
+            with loading[0]:
+                with self.lock:
+                    # Another thread may have loaded it while this one waited
+                    entry = self.kept(key, source)
+                    if entry is not None:
+                        return entry
+                    self.misses += 1
+                # Loaded outside the cache lock, so queries on other tables never wait on a parse
+                entry = load()
+                with self.lock:
+                    self.tables.pop(key, None)
+                    self.tables[key] = entry
+                    # The table just loaded is kept, however big
+                    while len(self.tables) > 1 and (len(self.tables) > self.maxTables or self.nbytes() > self.maxBytes):
+                        self.tables.popitem(last=False)
+                        self.evictions += 1
+                return entry
+        finally:
+            with self.lock:
+                loading[1] -= 1
+                if loading[1] == 0:
+                    del self.loading[key]
+
+    # Marks a kept table as just used. Called holding the lock
+    # ARGS: the (run, benchmark) key, (raw result, size, mtime) of the result now
+    # RETURNS: the LoadedTable, None if it is not kept or is stale
+    def kept(self, key, source):
+        entry = self.tables.get(key)
+        if entry is None or entry.source != source:
+            return None
+        self.tables.pop(key)
+        self.tables[key] = entry
+        self.hits += 1
+        return entry
+
+    # RETURNS: the memory the kept tables take (bytes)
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.tables.values())
+
+#########################################
+#             QUERIES                   #
+#########################################
+# Answers queries over the runs in a results folder
+class QueryService(object):
+    def __init__(self, resultDir, maxTables=16, maxBytes=4096 << 20):
+        self.resultDir = os.path.join(os.path.abspath(resultDir), "")
+        self.tables = TableCache(maxTables, maxBytes)
+        self.summaryLocks = {} # {run : lock held while its summary is rebuilt}
+        self.lock = threading.Lock()
+        self.startTime = time.time()
+
+    # RETURNS: the root results directory of a run
+    def runDir(self, run):
+        if not run or run.startswith(".") or "/" in run or os.sep in run:
+            raise QueryError("bad run name " + str(run))
+        root = self.resultDir + run + "/"
+        if not os.path.isdir(root):
+            raise QueryError("no run " + run, 404)
+        return root
+
+    # Gets a benchmark's table, loading it the first time it is asked for
+    # RETURNS: the LoadedTable
+    def table(self, run, bmkName):
+        root = self.runDir(run)
+        rawResult = vgSpec2017Summary.findRawResults(root).get(bmkName)
+        if rawResult is None:
+            raise QueryError("no result for " + str(bmkName) + " in run " + run, 404)
+        stat = os.stat(rawResult)
+        source = (rawResult, stat.st_size, stat.st_mtime)
+        def load():
+            try:
+                table, cached = vgSpec2017Cache.loadTable(rawResult, root + "cache/")
+            except ValueError as e:
+                raise QueryError(bmkName + " in run " + run + " is not cachegrind output: " + str(e), 422)
+            return LoadedTable(table, source)
+        return self.tables.get((run, bmkName), source, load)
+
+    # RETURNS: the column of an event in a table
+    def eventIndex(self, loaded, event):
+        if event not in loaded.table.events:
+            raise QueryError("unknown event " + str(event) + " (expected one of " + " ".join(loaded.table.events) + ")")
+        return loaded.table.eventIndex(event)
+
+    # Lists every run and its benchmarks
+    def runs(self):
+        runs = []
+        if os.path.isdir(self.resultDir):
+            for run in sorted(os.listdir(self.resultDir)):
+                if os.path.isdir(self.resultDir + run):
+                    runs.append({"run": run, "benchmarks": sorted(vgSpec2017Summary.findRawResults(self.resultDir + run + "/"))})
+        return {"runs": runs}
+
+    # The hottest source lines of a benchmark for an event, summed over every function
+    # ARGS: the run, the benchmark, the event, the most lines to return
+    def top(self, run, bmk, event="DLmr", k=10):
+        np = vgSpec2017Engine.np
+        loaded = self.table(run, bmk)
+        column = loaded.lineCounts[:, self.eventIndex(loaded, event)]
+        total = int(column.sum())
+        k = min(k, int(np.count_nonzero(column)))
+        hot = []
+        if k > 0:
+            # Only the k hottest are sorted, ties going to the earlier line
+            rows = np.argpartition(-column, k - 1)[:k]
+            rows = rows[np.lexsort((loaded.lineKeys[rows], -column[rows]))]
+            for row in rows:
+                fileName = loaded.table.fileNames[loaded.lineKeys[row] // loaded.numLines]
+                lineNo = int(loaded.lineKeys[row] % loaded.numLines)
+                hot.append({"file": fileName, "line": lineNo, "count": int(column[row]),
+                            "percent": column[row] * 100.0 / total, "source": linecache.getline(fileName, lineNo).rstrip()})
+        return {"run": run, "benchmark": bmk, "event": event, "total": total, "lines": hot}
+
+    # The hottest functions or source files of a benchmark for an event
+    # ARGS: the run, the benchmark, the event, "fn" or "fl", the most groups to return
+    def rollup(self, run, bmk, event="DLmr", by="fn", k=10):
+        np = vgSpec2017Engine.np
+        if by not in ("fn", "fl"):
+            raise QueryError("by is fn (functions) or fl (source files), not " + str(by))
+        loaded = self.table(run, bmk)
+        if by == "fn" and not loaded.table.hasFunctions():
+            raise QueryError(bmk + " in run " + run + " does not know its functions", 422)
+        names, sums = loaded.rollup(by)
+        column = sums[:, self.eventIndex(loaded, event)]
+        total = int(column.sum())
+        order = np.argsort(-column, kind='stable')[:k]
+        groups = [{"name": names[i], "count": int(column[i]), "percent": column[i] * 100.0 / total}
+                  for i in order if column[i] > 0]
+        return {"run": run, "benchmark": bmk, "event": event, "by": by, "total": total, "groups": groups}
+
+    # The counts of every event on the lines around a line of a source file
+    # ARGS: the run, the benchmark, the source file (or the end of its path), the line
+    # number, the lines to take above and below it
+    def region(self, run, bmk, file, line, radius=30):
+        np = vgSpec2017Engine.np
+        loaded = self.table(run, bmk)
+        fileId = loaded.findFile(file)
+        fileName = loaded.table.fileNames[fileId]
+        first = max(line - radius, 1)
+        last = line + radius
+        # The file's lines are one sorted stretch of the packed keys
+        start, end = np.searchsorted(loaded.lineKeys, [fileId * loaded.numLines + first, fileId * loaded.numLines + last + 1])
+        counts = dict((int(loaded.lineKeys[row] % loaded.numLines), loaded.lineCounts[row]) for row in range(start, end))
+        lines = []
+        for lineNo in range(first, last + 1):
+            text = linecache.getline(fileName, lineNo)
+            if not text and lineNo not in counts:
+                continue
+            lineCounts = counts.get(lineNo)
+            lines.append({"line": lineNo, "source": text.rstrip(),
+                          "counts": dict((event, int(lineCounts[i])) for i, event in enumerate(loaded.table.events)) if lineCounts is not None else {}})
+        return {"run": run, "benchmark": bmk, "file": fileName, "line": line, "events": loaded.table.events, "lines": lines}
+
+    # Ranks the benchmarks of a run by an event or derived metric, from the run summary
+    # ARGS: the run, the event or metric, the most benchmarks to return
+    def rank(self, run, key="DLmr", k=None):
+        if key not in vgSpec2017Parser.cgEvents and key not in vgSpec2017Engine.derivedMetrics:
+            raise QueryError("unknown event or metric " + str(key))
+        root = self.runDir(run)
+        with self.lock:
+            summaryLock = self.summaryLocks.setdefault(run, threading.Lock())
+        # Only the results that changed since the summary was written are read. One rebuild of a
+        # run's summary at a time, so request threads don't write its files over each other
+        with summaryLock:
+            rows = vgSpec2017Summary.buildRunSummary(root)
+        ranked = vgSpec2017Summary.rankBenchmarks(rows, key)[:k]
+        return {"run": run, "key": key, "benchmarks": [{"benchmark": bmkName, "value": value} for bmkName, value in ranked],
+                "failed": dict((row["benchmark"], row["failed"]) for row in rows if row.get("failed"))}
+
+    # What the server has loaded
+    def stats(self):
+        with self.tables.lock:
+            loaded = [{"run": run, "benchmark": bmk, "rows": len(entry.table.lines), "mb": entry.nbytes / 1048576.0}
+                      for (run, bmk), entry in self.tables.tables.items()]
+            return {"resultDir": self.resultDir, "uptime": time.time() - self.startTime, "tables": loaded,
+                    "mb": self.tables.nbytes() / 1048576.0, "maxTables": self.tables.maxTables,
+                    "maxMb": self.tables.maxBytes / 1048576.0, "hits": self.tables.hits,
+                    "misses": self.tables.misses, "evictions": self.tables.evictions}
+
+#########################################
+#             HTTP SERVER               #
+#########################################
+# The parameters every query takes: {name : (type, default)}
+required = object() # The default of a parameter every query has to give
+queryParams = {
+    "runs"  : {},
+    "top"   : {"run": (str, required), "bmk": (str, required), "event": (str, "DLmr"), "k": (int, 10)},
+    "rollup": {"run": (str, required), "bmk": (str, required), "event": (str, "DLmr"), "by": (str, "fn"), "k": (int, 10)},
+    "region": {"run": (str, required), "bmk": (str, required), "file": (str, required), "line": (int, required), "radius": (int, 30)},
+    "rank"  : {"run": (str, required), "key": (str, "DLmr"), "k": (int, None)},
+    "stats" : {}
+}
+
+# Answers GET /<query>?<parameters> with JSON
+class QueryHandler(BaseHTTPRequestHandler):
+    service = None # The QueryService, set by serve()
+
+    def do_GET(self):
+        startTime = time.time()
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        try:
+            if name not in queryParams:
+                raise QueryError("unknown query " + name + " (expected one of " + " ".join(sorted(queryParams)) + ")", 404)
+            given = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+            params = {}
+            for param, (paramType, default) in queryParams[name].items():
+                if param not in given:
+                    if default is required:
+                        raise QueryError("the " + name + " query needs " + param)
+                    params[param] = default
+                    continue
+                try:
+                    params[param] = paramType(given[param])
+                except ValueError:
+                    raise QueryError(param + " has to be a number, not " + given[param])
+            answer = getattr(self.service, name)(**params)
+            answer["ms"] = (time.time() - startTime) * 1000.0
+            self.reply(200, answer)
+        except QueryError as e:
+            self.reply(e.status, {"error": str(e)})
+        except Exception as e:
+            self.reply(500, {"error": type(e).__name__ + ": " + str(e)})
+
+    def reply(self, status, answer):
+        data = json.dumps(answer, sort_keys=True).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Queries are not logged line by line
+    def log_message(self, format, *args):
+        pass
+
+# Every query gets its own thread, so a table being loaded holds up no other query
+class QueryServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+# Serves queries until interrupted
+# ARGS: the QueryService, the address and port to listen on
+# RETURNS: nothing
+def serve(service, bind, port):
+    QueryHandler.service = service
+    server = QueryServer((bind, port), QueryHandler)
+    sys.stdout.write("Answering queries on the runs in " + service.resultDir + " at http://" + bind + ":" + str(port) + "/\n")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+#########################################
+#                CLIENT                 #
+#########################################
+# Asks the server one query
+# ARGS: the server URL, the query name, its parameters
+# RETURNS: the answer
+def ask(server, name, **params):
+    params = dict((key, value) for key, value in params.items() if value is not None)
+    try:
+        response = urlopen(server.rstrip("/") + "/" + name + "?" + urlencode(params))
+    except HTTPError as e:
+        raise QueryError(json.loads(e.read().decode("utf-8")).get("error", str(e)), e.code)
+    except URLError as e:
+        raise QueryError("no server at " + server + " (start one with \"vgSpec2017Query.py serve\"): " + str(e.reason), 503)
+    return json.loads(response.read().decode("utf-8"))
+
+# Prints an answer the way the formatted results read
+# ARGS: the query name, the answer
+# RETURNS: nothing
+def writeAnswer(name, answer):
+    out = sys.stdout
+    if name == "runs":
+        for run in answer["runs"]:
+            out.write("%-30s %s\n" % (run["run"], " ".join(run["benchmarks"])))
+    elif name == "top":
+        out.write("Hottest lines of " + answer["benchmark"] + " by " + answer["event"] + " ({:,} in total)\n".format(answer["total"]))
+        for line in answer["lines"]:
+            where = os.path.basename(line["file"]) + ":" + str(line["line"])
+            out.write('{0:<30} {1:<20} {2:<10} {3}\n'.format(where, "{:,}".format(line["count"]),
+                                                             "{0:.2f} %".format(line["percent"]), line["source"].strip()))
+    elif name == "rollup":
+        out.write("Hottest " + ("functions" if answer["by"] == "fn" else "source files") + " of " + answer["benchmark"] +
+                  " by " + answer["event"] + " ({:,} in total)\n".format(answer["total"]))
+        for group in answer["groups"]:
+            out.write('{0:<20} {1:<10} {2}\n'.format("{:,}".format(group["count"]), "{0:.2f} %".format(group["percent"]), group["name"]))
+    elif name == "region":
+        out.write(answer["file"] + "\n")
+        out.write('{0:<10} '.format("Line") + " ".join('{0:>12}'.format(event) for event in answer["events"]) + "  Instruction\n")
+        for line in answer["lines"]:
+            marker = ">" if line["line"] == answer["line"] else " "
+            out.write('{0:<10} '.format(marker + str(line["line"])) +
+                      " ".join('{0:>12}'.format("{:,}".format(line["counts"][event]) if line["counts"].get(event) else ".") for event in answer["events"]) +
+                      "  " + line["source"] + "\n")
+    elif name == "rank":
+        for row in answer["benchmarks"]:
+            value = row["value"]
+            num = "{:,}".format(value) if isinstance(value, int) else "{0:.4f}".format(value)
+            out.write("%-30s %s\n" % (row["benchmark"], num))
+        for bmkName in sorted(answer["failed"]):
+            out.write("%-30s FAILED: %s\n" % (bmkName, answer["failed"][bmkName]))
+    elif name == "stats":
+        out.write("Serving " + answer["resultDir"] + " for " + "{0:.0f}".format(answer["uptime"]) + " s\n")
+        out.write(str(len(answer["tables"])) + " of at most " + str(answer["maxTables"]) + " tables loaded, " +
+                  "{0:.1f}".format(answer["mb"]) + " of " + "{0:.0f}".format(answer["maxMb"]) + " MB\n")
+        out.write(str(answer["hits"]) + " hits, " + str(answer["misses"]) + " loads, " + str(answer["evictions"]) + " evictions\n")
+        for table in answer["tables"]:
+            out.write("  %-30s %-20s %10s rows %8.1f MB\n" % (table["run"], table["benchmark"], "{:,}".format(table["rows"]), table["mb"]))
+    if name != "runs" and name != "stats":
+        out.write("(" + "{0:.1f}".format(answer["ms"]) + " ms)\n")
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Query the parsed results of vgSpec 2017 runs through a long-lived server")
+    parser.add_argument("--server", default=defaultServer, help="the server to ask (default: " + defaultServer + ")")
+    parser.add_argument("--json", action="store_true", help="print the server's answer as it is")
+    subparsers = parser.add_subparsers(dest="command")
+    serveParser = subparsers.add_parser("serve", help="start the server")
+    serveParser.add_argument("--port", type=int, default=defaultPort, help="the port to listen on (default: " + str(defaultPort) + ")")
+    serveParser.add_argument("--bind", default="127.0.0.1", help="the address to listen on (default: 127.0.0.1)")
+    serveParser.add_argument("--max-tables", type=int, default=16, help="the most benchmark tables kept in memory (default: 16)")
+    serveParser.add_argument("--max-mb", type=int, default=4096, help="the most memory the kept tables may take (default: 4096)")
+    serveParser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                             help="the folder holding spec/ and vgSpec2017/ (default: " + vgSpec2017Jobs.defaultWorkspace + ")")
+    subparsers.add_parser("runs", help="list the runs and their benchmarks")
+    topParser = subparsers.add_parser("top", help="the hottest source lines of a benchmark")
+    rollupParser = subparsers.add_parser("rollup", help="the hottest functions or source files of a benchmark")
+    regionParser = subparsers.add_parser("region", help="the counts of every event around a line")
+    for subparser in (topParser, rollupParser, regionParser):
+        subparser.add_argument("run", help="the name of the directory of the run's results (i.e. \"3_21_vgRun\")")
+        subparser.add_argument("bmk", help="the benchmark (i.e. \"505.mcf_r\")")
+    for subparser in (topParser, rollupParser):
+        subparser.add_argument("--event", default="DLmr", help="the event to rank by (default: DLmr)")
+        subparser.add_argument("-k", type=int, default=10, help="the most to list (default: 10)")
+    rollupParser.add_argument("--by", choices=["fn", "fl"], default="fn", help="functions (fn, the default) or source files (fl)")
+    regionParser.add_argument("file", help="the source file, or the end of its path")
+    regionParser.add_argument("line", type=int, help="the line number")
+    regionParser.add_argument("--radius", type=int, default=30, help="lines to take above and below the line (default: 30)")
+    rankParser = subparsers.add_parser("rank", help="the benchmarks of a run ranked by an event or derived metric")
+    rankParser.add_argument("run", help="the name of the directory of the run's results (i.e. \"3_21_vgRun\")")
+    rankParser.add_argument("--key", default="DLmr", help="the event or derived metric to rank by (default: DLmr)")
+    rankParser.add_argument("-k", type=int, default=None, help="the most benchmarks to list (default: all)")
+    subparsers.add_parser("stats", help="what the server has loaded")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("expected a command (" + " ".join(["serve"] + sorted(queryParams)) + ")")
+    if args.command == "serve" and not vgSpec2017Engine.available():
+        parser.error("the server needs NumPy")
+    return args
+
+def main():
+    args = parseArgs()
+    if args.command == "serve":
+        resultDir = os.path.join(os.path.abspath(args.workspace), "vgSpec2017", "results")
+        serve(QueryService(resultDir, max(args.max_tables, 1), args.max_mb << 20), args.bind, args.port)
+        return
+    params = dict((param, getattr(args, param, None)) for param in queryParams[args.command])
+    try:
+        answer = ask(args.server, args.command, **params)
+    except QueryError as e:
+        sys.stderr.write("Error: " + str(e) + "\n")
+        sys.exit(1)
+    if args.json:
+        sys.stdout.write(json.dumps(answer, indent=1, sort_keys=True) + "\n")
+    else:
+        writeAnswer(args.command, answer)
+
+if __name__ == "__main__":
+    main()
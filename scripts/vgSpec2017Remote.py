@@ -0,0 +1,397 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Runs the Manager's jobs on other hosts. Each host runs a worker (this
+# script's "worker" command) started over any command transport - ssh,
+# a batch system's launcher, or nothing at all for a worker on this host.
+# The Manager and its workers talk in JSON lines over the worker's stdin
+# and stdout.
+#
+# The Manager's job pool stays the one shared queue. A host takes the next
+# job whenever one of its slots frees up, so no host sits idle while jobs
+# are queued, and the jobs of a host whose worker goes away are queued again
+# for the other hosts to take. Each worker runs its jobs with the same
+# LocalExecutor as a single-host run, streams their output back into their
+# meta logs, and ships their results back into the run directory.
+#
+# Workers need the staged benchmarks (vgSpec2017/benchmarks/) and the scripts
+# at the same place under their workspace, i.e. on a shared or mirrored file
+# system. Results never need to be written there.
+#
+# Args to this script
+#   worker              Serve jobs over stdin and stdout (started by the Manager)
+#   --workspace DIR     The folder holding spec/ and vgSpec2017/ on this host
+#                       (default: $VGSPEC2017_WORKSPACE, else /local/alec/cole_workspace/)
+#   --scratch DIR       Where results are kept until shipped back (default: a temporary folder)
+#
+# i.e. vgSpec2017Manager.py --worker "8:ssh hostA python /path/to/vgSpec2017Remote.py worker"
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import json
+import zlib
+import shlex
+import base64
+import shutil
+import signal
+import socket
+import tempfile
+import argparse
+import threading
+import subprocess
+import vgSpec2017Jobs
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+#########################################
+#           REMOTE SETTINGS             #
+#########################################
+resultChunkBytes = 1 << 20 # Bytes of a result sent per message
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Splits a --worker option into its slots and command
+# ARGS: "<slots>:<command>" (i.e. "8:ssh hostA python vgSpec2017Remote.py worker")
+# RETURNS: (slots, command)
+def parseWorkerSpec(text):
+    slots, sep, command = text.partition(":")
+    if not sep or not slots.strip().isdigit() or int(slots) < 1 or not command.strip():
+        raise ValueError("expected <slots>:<command>, got \"" + text + "\"")
+    return int(slots), command.strip()
+
+# Writes one message to a stream, whole
+# ARGS: the stream, the lock guarding it, the message (a dict)
+# RETURNS: nothing
+def sendMessage(stream, lock, message):
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    with lock:
+        stream.write(data)
+        stream.flush()
+
+#########################################
+#           MANAGER SIDE                #
+#########################################
+# One worker and the jobs it is running
+class RemoteHost(object):
+    def __init__(self, name, slots, command, workspace):
+        self.name = name            # "<hostname>:<pid>" once the worker says hello
+        self.slots = slots          # The most jobs to run there at once
+        self.workspace = workspace  # This host's workspace, mapped onto the worker's
+        self.jobs = {}              # {job id : job running there}
+        self.results = {}           # {job id : (open result file, decompressor)}
+        self.events = None
+        self.alive = True
+        self.lock = threading.Lock()
+        self.sendLock = threading.Lock()
+        self.proc = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reader = threading.Thread(target=self._read)
+        reader.daemon = True
+        reader.start()
+
+    # RETURNS: the slots not taken by a job
+    def free(self):
+        with self.lock:
+            return self.slots - len(self.jobs) if self.alive else 0
+
+    # Hands a job to the worker
+    # ARGS: the job, its id, the pool's event queue
+    def run(self, job, jobId, events):
+        with self.lock:
+            self.events = events
+            alive = self.alive
+            if alive:
+                self.jobs[jobId] = job
+        message = {"op": "run", "id": jobId, "name": job.name, "exeDir": job.exeDir, "exeCommand": job.exeCommand,
+                   "toggleCollect": job.toggleCollect, "command": job.command, "resFile": job.resFile,
+                   "valgrind": vgSpec2017Jobs.valgrindCommand, "workspace": self.workspace}
+        try:
+            if not alive:
+                raise IOError("worker is gone")
+            sendMessage(self.proc.stdin, self.sendLock, message)
+        except (IOError, OSError, ValueError):
+            # The reader hands the job back instead if it saw the worker go first
+            with self.lock:
+                lost = self.jobs.pop(jobId, None) is not None or not alive
+            if lost:
+                job.lostHost = self.name
+                events.put(("exit", job))
+
+    # Asks the worker to kill a job it is running
+    # RETURNS: True if the job runs there
+    def kill(self, job):
+        with self.lock:
+            jobIds = [jobId for jobId, other in self.jobs.items() if other is job]
+        for jobId in jobIds:
+            try:
+                sendMessage(self.proc.stdin, self.sendLock, {"op": "kill", "id": jobId})
+            except (IOError, OSError, ValueError):
+                # The reader hands the job back once it sees the worker gone
+                pass
+        return bool(jobIds)
+
+    # Follows the worker's messages until it goes away
+    def _read(self):
+        for line in iter(self.proc.stdout.readline, b""):
+            try:
+                message = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            self._handle(message)
+        self.proc.wait()
+        # Every job still out there is queued again for the other hosts
+        with self.lock:
+            self.alive = False
+            lost = list(self.jobs.values())
+            self.jobs = {}
+        for resFile, decompressor in self.results.values():
+            resFile.close()
+        self.results = {}
+        for job in lost:
+            job.lostHost = self.name
+            self.events.put(("exit", job))
+
+    def _handle(self, message):
+        op = message.get("op")
+        if op == "hello":
+            self.name = message["host"] + ":" + str(message["pid"])
+            return
+        job = self.jobs.get(message.get("id"))
+        if job is None:
+            return
+        if op == "output":
+            with open(job.logFile, 'a') as logFile:
+                logFile.write("".join(line + "\n" for line in message["lines"]))
+        elif op == "result":
+            if message["id"] not in self.results:
+                self.results[message["id"]] = (open(job.resFile + ".tmp", 'wb'), zlib.decompressobj())
+            resFile, decompressor = self.results[message["id"]]
+            resFile.write(decompressor.decompress(base64.b64decode(message["data"])))
+        elif op == "done":
+            if message["id"] in self.results:
+                resFile, decompressor = self.results.pop(message["id"])
+                resFile.write(decompressor.flush())
+                resFile.close()
+                os.rename(job.resFile + ".tmp", job.resFile)
+            job.returncode = message["returncode"]
+            job.maxRss = message.get("maxRss")
+            job.userTime = message.get("userTime")
+            job.sysTime = message.get("sysTime")
+            job.oomKilled = message.get("oomKilled", False)
+            with self.lock:
+                self.jobs.pop(message["id"], None)
+            self.events.put(("exit", job))
+
+    # Tells the worker to stop and waits for it
+    def close(self):
+        try:
+            sendMessage(self.proc.stdin, self.sendLock, {"op": "quit"})
+            self.proc.stdin.close()
+        except (IOError, OSError, ValueError):
+            pass
+        self.proc.wait()
+
+# Runs jobs on workers, each with its own number of slots
+class RemoteExecutor(object):
+    checksMemory = False # The memory left on the workers' hosts is not known here
+
+    # ARGS: [(slots, command starting a worker)], this host's workspace
+    def __init__(self, workers, workspace):
+        self.hosts = [RemoteHost("worker " + str(i + 1), slots, command, workspace) for i, (slots, command) in enumerate(workers)]
+        self.nextId = 0
+
+    # RETURNS: the slots of every worker still there
+    def capacity(self):
+        return sum(host.slots for host in self.hosts if host.alive)
+
+    # Starts the job on the worker with the most free slots
+    # ARGS: the job, the queue to put ("exit", job) on once it is done or lost
+    def start(self, job, events):
+        self.nextId += 1
+        host = max(self.hosts, key=lambda host: host.free())
+        job.host = host.name
+        host.run(job, self.nextId, events)
+
+    def memoryUsed(self, job):
+        return None
+
+    # Kills a running job on whichever worker runs it - its exit is reported as usual
+    def kill(self, job):
+        for host in self.hosts:
+            if host.kill(job):
+                return
+
+    def close(self):
+        for host in self.hosts:
+            host.close()
+
+#########################################
+#             WORKER SIDE               #
+#########################################
+# Runs the jobs the Manager sends until it says to stop or goes away
+class Worker(object):
+    def __init__(self, workspace, scratchDir):
+        self.workspace = os.path.join(os.path.abspath(workspace), "")
+        self.scratchDir = scratchDir
+        self.executor = vgSpec2017Jobs.LocalExecutor()
+        self.events = queue.Queue()
+        self.jobs = {} # {job id : job}
+        self.out = getattr(sys.stdout, "buffer", sys.stdout)
+        self.sendLock = threading.Lock()
+
+    def send(self, message):
+        sendMessage(self.out, self.sendLock, message)
+
+    # Puts every message from the Manager on the event queue
+    def _readRequests(self):
+        stdin = getattr(sys.stdin, "buffer", sys.stdin)
+        for line in iter(stdin.readline, b""):
+            try:
+                request = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            self.events.put(("request", request))
+            # Stop reading before the worker shuts down, not while it does
+            if request.get("op") == "quit":
+                return
+        self.events.put(("request", {"op": "quit"}))
+
+    # Builds the job the Manager asked for, with its paths moved to this host's
+    # workspace and its result going to the scratch folder
+    # ARGS: the "run" message
+    # RETURNS: the job
+    def makeJob(self, message):
+        jobDir = os.path.join(self.scratchDir, str(message["id"])) + "/"
+        os.makedirs(jobDir)
+        resFile = jobDir + os.path.basename(message["resFile"])
+        workspace = message["workspace"]
+        def mapPath(text):
+            if text is None or workspace == self.workspace:
+                return text
+            return text.replace(workspace, self.workspace)
+        command = message["command"]
+        if command:
+            command = mapPath(command.replace(message["resFile"], resFile))
+        job = vgSpec2017Jobs.Job(message["name"], mapPath(message["exeDir"]), jobDir + "log.txt", resFile,
+                                 message["toggleCollect"], mapPath(message["exeCommand"]), None, command)
+        job.id = message["id"]
+        vgSpec2017Jobs.valgrindCommand = mapPath(message["valgrind"])
+        open(job.logFile, 'w').close()
+        job.tail = vgSpec2017Jobs.LogTail(job.logFile)
+        return job
+
+    # Sends the new lines of a job's log, and its unfinished last line too if it is done
+    def forwardOutput(self, job, final=False):
+        lines = job.tail.readLines()
+        if final and job.tail.partial:
+            lines.append(job.tail.partial)
+            job.tail.partial = ""
+        if lines:
+            self.send({"op": "output", "id": job.id, "lines": lines})
+
+    # Ships a finished job's result and status back, then forgets the job
+    def finish(self, job):
+        self.forwardOutput(job, True)
+        if os.path.isfile(job.resFile):
+            compressor = zlib.compressobj()
+            with open(job.resFile, 'rb') as resFile:
+                chunk = resFile.read(resultChunkBytes)
+                while chunk:
+                    data = compressor.compress(chunk)
+                    if data:
+                        self.send({"op": "result", "id": job.id, "data": base64.b64encode(data).decode("ascii")})
+                    chunk = resFile.read(resultChunkBytes)
+            self.send({"op": "result", "id": job.id, "data": base64.b64encode(compressor.flush()).decode("ascii")})
+        self.send({"op": "done", "id": job.id, "returncode": job.returncode, "maxRss": job.maxRss,
+                   "userTime": job.userTime, "sysTime": job.sysTime, "oomKilled": job.oomKilled})
+        del self.jobs[job.id]
+        shutil.rmtree(os.path.dirname(job.logFile), ignore_errors=True)
+
+    # Serves jobs until told to stop or the Manager goes away. Jobs still running
+    # then are killed, since nobody is left to take their results.
+    def serve(self):
+        reader = threading.Thread(target=self._readRequests)
+        reader.daemon = True
+        reader.start()
+        try:
+            self._serve()
+        except (IOError, OSError):
+            # The Manager stopped reading
+            pass
+        for job in self.jobs.values():
+            try:
+                job.proc.send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+
+    def _serve(self):
+        self.send({"op": "hello", "host": socket.gethostname(), "pid": os.getpid()})
+        while True:
+            try:
+                kind, item = self.events.get(True, vgSpec2017Jobs.progressInterval)
+            except queue.Empty:
+                kind, item = None, None
+            for job in self.jobs.values():
+                self.forwardOutput(job)
+            if kind == "request" and item.get("op") == "quit":
+                break
+            elif kind == "request" and item.get("op") == "kill":
+                if item["id"] in self.jobs:
+                    self.executor.kill(self.jobs[item["id"]])
+            elif kind == "request" and item.get("op") == "run":
+                try:
+                    job = self.makeJob(item)
+                    self.jobs[job.id] = job
+                    self.executor.start(job, self.events)
+                except Exception as e:
+                    # Could not even start - report it like a failed run
+                    self.send({"op": "output", "id": item["id"], "lines": ["Could not start the job: " + str(e)]})
+                    self.send({"op": "done", "id": item["id"], "returncode": -1})
+                    self.jobs.pop(item["id"], None)
+            elif kind == "exit":
+                self.finish(item)
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Run vgSpec 2017 jobs for a Manager on another host")
+    subparsers = parser.add_subparsers(dest="command")
+    workerParser = subparsers.add_parser("worker", help="serve jobs over stdin and stdout")
+    workerParser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                              help="the folder holding spec/ and vgSpec2017/ on this host")
+    workerParser.add_argument("--scratch", default=None,
+                              help="where results are kept until shipped back (default: a temporary folder)")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("expected a command (worker)")
+    return args
+
+def main():
+    args = parseArgs()
+    scratchDir = args.scratch or tempfile.mkdtemp(prefix="vgSpec2017Worker")
+    try:
+        Worker(args.workspace, scratchDir).serve()
+    finally:
+        if not args.scratch:
+            shutil.rmtree(scratchDir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Rehearses a whole vgSpec2017Manager.py run without SPEC or valgrind,
+# to measure what the scheduling itself costs. A fake workspace is
+# built with one spec2017 benchmark folder (and speccmds.cmd) per job,
+# and the Manager is run on it with a stand-in for valgrind that
+# sleeps, holds memory and writes a small cachegrind output.
+#
+# Args to this script
+#   --benchmarks N  The number of fake benchmarks (default: 100, at most 1000)
+#   --invocations K The invocations (speccmds.cmd lines) of every benchmark (default: 1)
+#   --slots N       The most jobs the Manager runs at once (default: number of cores)
+#   --hosts N       Run the jobs on N workers of vgSpec2017Remote.py, started on this host,
+#                   with --slots jobs each (default: 0, the Manager runs them itself)
+#   --durations D   How long each stand-in runs (default: uniform:0.5:2), one of
+#                   fixed:S, uniform:A:B, lognormal:MEDIAN:SIGMA or pareto:MIN:ALPHA (seconds)
+#   --mem D         The memory each stand-in holds, in MB, in the same form (default: fixed:0)
+#   --seed N        Seeds the durations and memory of every job (default: 1)
+#   --workdir DIR   Where to build the workspace (default: a temporary folder, removed after).
+#                   A kept workspace keeps its history.jsonl, so a second run is scheduled
+#                   from the runtimes of the first.
+#   --manager-args  Extra arguments for the Manager (i.e. "--schedule fifo")
+#                   The Manager is given the largest stand-in's peak memory as --job-mem,
+#                   so jobs are admitted by what they really hold. --manager-args may
+#                   override it (i.e. "--no-mem-check").
+#   --output FILE   Also write the measurements to FILE as JSON
+#
+# The report gives the makespan against its lower bound, how busy the slots were,
+# the time between a slot freeing and its next job starting, what every job took
+# beyond its stand-in's sleep, and the Manager's own CPU time.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import json
+import time
+import shlex
+import random
+import shutil
+import hashlib
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+import vgSpec2017Jobs
+import vgSpec2017Parser
+import vgSpec2017Journal
+
+#########################################
+#         SIMULATION SETTINGS           #
+#########################################
+exeDirName = "run_base_refrate_mytest-m64.0000"
+distributions = ["fixed", "uniform", "lognormal", "pareto"]
+# Passed from the harness to every stand-in through the Manager's environment
+durationsVariable = "VGSIM_DURATIONS"
+memoryVariable = "VGSIM_MEM"
+standInOverheadMB = 32 # The stand-in's own interpreter, on top of the memory it holds
+seedVariable = "VGSIM_SEED"
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Checks a distribution given as "<name>:<parameter>:..."
+# ARGS: the distribution text
+# RETURNS: (name, [parameters]), raising ValueError if it is not one of distributions
+def parseDistribution(text):
+    fields = text.split(":")
+    counts = {"fixed": 1, "uniform": 2, "lognormal": 2, "pareto": 2}
+    if fields[0] not in counts or len(fields) != counts[fields[0]] + 1:
+        raise ValueError("expected fixed:S, uniform:A:B, lognormal:MEDIAN:SIGMA or pareto:MIN:ALPHA, not " + text)
+    return fields[0], [float(x) for x in fields[1:]]
+
+# Draws a value for one job. The same job always gets the same value, so the
+# harness and the stand-ins agree without talking to each other.
+# ARGS: the distribution text, the seed, what to draw for (i.e. the job's command), what the value is for
+# RETURNS: the value
+def drawValue(distribution, seed, jobKey, purpose):
+    name, params = parseDistribution(distribution)
+    digest = hashlib.sha1((str(seed) + " " + purpose + " " + jobKey).encode("utf-8")).hexdigest()
+    rng = random.Random(int(digest[:12], 16))
+    if name == "fixed":
+        return params[0]
+    if name == "uniform":
+        return rng.uniform(params[0], params[1])
+    if name == "lognormal":
+        return params[0] * rng.lognormvariate(0, params[1])
+    return params[0] * rng.paretovariate(params[1])
+
+# RETURNS: the executable command of an invocation, as it appears in speccmds.cmd
+def getSimCommand(benchmark, part):
+    return "../" + exeDirName + "/sim " + benchmark + " " + str(part)
+
+#########################################
+#           STAND-IN VALGRIND           #
+#########################################
+# Writes a small cachegrind output whose counts grow with the job's duration
+# ARGS: the output file, the executable command, the duration
+# RETURNS: nothing
+def writeStandInResult(resultFile, exeCommand, duration):
+    table = vgSpec2017Parser.CgTable()
+    table.desc = ["I1 cache: 32768 B, 64 B, 8-way associative"]
+    table.cmd = exeCommand
+    table.events = list(vgSpec2017Parser.cgEvents)
+    scale = int(duration * 1000) + 1
+    table.functions[("sim.c", "main")] = dict((lineNo, [scale * lineNo] * len(table.events)) for lineNo in range(1, 11))
+    table.summary = [sum(scale * lineNo for lineNo in range(1, 11))] * len(table.events)
+    vgSpec2017Parser.writeCachegrindOut(table, resultFile)
+
+# Stands in for valgrind: sleeps for the job's duration holding the job's memory,
+# then writes the output file valgrind would have
+# ARGS: the valgrind arguments (options, then the executable command)
+# RETURNS: the exit code
+def standIn(argv):
+    if "--version" in argv:
+        sys.stdout.write("valgrind-standin\n")
+        return 0
+    startTime = time.time()
+    resultFile = None
+    for i, arg in enumerate(argv):
+        if arg.startswith("--cachegrind-out-file=") or arg.startswith("--callgrind-out-file="):
+            resultFile = arg.split("=", 1)[1]
+        if not arg.startswith("--"):
+            break
+    exeCommand = " ".join(argv[i:])
+    seed = os.environ.get(seedVariable, "1")
+    duration = drawValue(os.environ.get(durationsVariable, "fixed:1"), seed, exeCommand, "duration")
+    memoryMB = drawValue(os.environ.get(memoryVariable, "fixed:0"), seed, exeCommand, "memory")
+    sys.stdout.write("==" + str(os.getpid()) + "== Stand-in valgrind: " + "{0:.2f}".format(duration) + " s, " +
+                     "{0:.0f}".format(memoryMB) + " MB\n")
+    sys.stdout.flush()
+    held = bytearray(int(memoryMB * 1048576))
+    # Touch every page, so the memory is really resident
+    for i in range(0, len(held), 4096):
+        held[i] = 1
+    time.sleep(max(duration - (time.time() - startTime), 0))
+    if resultFile:
+        writeStandInResult(resultFile, exeCommand, duration)
+    sys.stdout.write("==" + str(os.getpid()) + "== Stand-in done\n")
+    return 0
+
+#########################################
+#            FAKE WORKSPACE             #
+#########################################
+# Builds the spec2017 and vgSpec2017 folders the Manager expects
+# ARGS: the workspace folder, the number of benchmarks, the invocations of each
+# RETURNS: the list of (benchmark, invocation) jobs
+def buildWorkspace(workDir, numBenchmarks, numInvocations):
+    jobs = []
+    for name in ["logs", "benchmarks", "results"]:
+        path = os.path.join(workDir, "vgSpec2017", name)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    for i in range(numBenchmarks):
+        benchmark = "{0:03d}.sim{1}_r".format(i, i)
+        exeDir = os.path.join(workDir, "spec", "benchspec", "CPU", benchmark, "run", exeDirName)
+        if not os.path.isdir(os.path.join(exeDir, "data")):
+            os.makedirs(os.path.join(exeDir, "data"))
+        with open(os.path.join(exeDir, "data", "in.txt"), 'w') as f:
+            f.write("input of " + benchmark + "\n")
+        with open(os.path.join(exeDir, vgSpec2017Jobs.vgExeCmdFile), 'w') as f:
+            f.write("-r\n-N C\n-C " + exeDir + "\n")
+            for part in range(numInvocations):
+                f.write("-o out" + str(part) + ".txt -e err" + str(part) + ".txt " + getSimCommand(benchmark, part) + " data/in.txt\n")
+                jobs.append((benchmark, part))
+    return jobs
+
+#########################################
+#               REPORT                  #
+#########################################
+# Works out how well the Manager used its slots from its events.jsonl
+# ARGS: the "end" records of the run, the number of slots, {job command : stand-in
+# duration}, the Manager's wall clock seconds, the Manager's CPU seconds (its own and
+# its children's)
+# RETURNS: a dict of measurements
+def measureRun(ends, slots, durations, wallSeconds, cpuSeconds):
+    starts = sorted(end["start"] for end in ends)
+    finishes = sorted(end["end"] for end in ends)
+    makespan = finishes[-1] - starts[0]
+    busy = sum(end["runtime"] for end in ends)
+    # Past the first <slots> jobs, every start takes the slot of an earlier finish
+    latencies = [start - finish for start, finish in zip(starts[slots:], finishes) if start >= finish]
+    overheads = [end["runtime"] - durations[end["job"]] for end in ends if end["job"] in durations]
+    jobCpu = sum((end.get("userCpu") or 0) + (end.get("sysCpu") or 0) for end in ends)
+    return {
+        "jobs"               : len(ends),
+        "failed"             : len([end for end in ends if end["returncode"] != 0]),
+        "slots"              : slots,
+        "makespan"           : makespan,
+        "lowerBound"         : vgSpec2017Jobs.makespanLowerBound(list(durations.values()), slots),
+        "utilization"        : busy / (slots * makespan) if makespan > 0 else None,
+        "dispatchLatencyMean": sum(latencies) / len(latencies) if latencies else 0,
+        "dispatchLatencyMax" : max(latencies) if latencies else 0,
+        "jobOverheadMean"    : sum(overheads) / len(overheads) if overheads else 0,
+        "jobOverheadMax"     : max(overheads) if overheads else 0,
+        "managerWall"        : wallSeconds,
+        "managerCpu"         : cpuSeconds - jobCpu if cpuSeconds is not None else None
+    }
+
+# Writes the measurements of a run
+def writeReport(result):
+    sys.stdout.write("\nJobs:                " + str(result["jobs"]) + " on " + str(result["slots"]) + " slots" +
+                     (" (" + str(result["failed"]) + " FAILED)" if result["failed"] else "") + "\n")
+    sys.stdout.write("Makespan:            " + "{0:.2f}".format(result["makespan"]) + " s against a lower bound of " +
+                     "{0:.2f}".format(result["lowerBound"]) + " s")
+    if result["lowerBound"] > 0:
+        sys.stdout.write(" (" + "{0:+.1f}".format((result["makespan"] / result["lowerBound"] - 1) * 100) + "%)")
+    sys.stdout.write("\n")
+    if result["utilization"] is not None:
+        sys.stdout.write("Slot utilization:    " + "{0:.1f}".format(result["utilization"] * 100) + "%\n")
+    sys.stdout.write("Dispatch latency:    " + "{0:.3f}".format(result["dispatchLatencyMean"]) + " s mean, " +
+                     "{0:.3f}".format(result["dispatchLatencyMax"]) + " s max (slot free to next start)\n")
+    sys.stdout.write("Job overhead:        " + "{0:.3f}".format(result["jobOverheadMean"]) + " s mean, " +
+                     "{0:.3f}".format(result["jobOverheadMax"]) + " s max (runtime beyond the stand-in's sleep)\n")
+    sys.stdout.write("Manager wall time:   " + "{0:.2f}".format(result["managerWall"]) + " s (" +
+                     "{0:.2f}".format(result["managerWall"] - result["makespan"]) + " s outside the jobs)\n")
+    if result["managerCpu"] is not None:
+        sys.stdout.write("Manager CPU time:    " + "{0:.2f}".format(result["managerCpu"]) + " s (without its jobs" +
+                         (", with its " + str(result["hosts"]) + " workers" if result.get("hosts") else "") + ")\n")
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Rehearse a vgSpec2017Manager.py run with a stand-in valgrind")
+    parser.add_argument("--benchmarks", type=int, default=100,
+                        help="the number of fake benchmarks (default: 100, at most 1000)")
+    parser.add_argument("--invocations", type=int, default=1,
+                        help="the invocations of every benchmark (default: 1)")
+    parser.add_argument("--slots", type=int, default=None,
+                        help="the most jobs the Manager runs at once (default: number of cores)")
+    parser.add_argument("--hosts", type=int, default=0,
+                        help="run the jobs on N local workers with --slots jobs each (default: 0, no workers)")
+    parser.add_argument("--durations", default="uniform:0.5:2",
+                        help="seconds each stand-in runs: fixed:S, uniform:A:B, lognormal:MEDIAN:SIGMA or pareto:MIN:ALPHA")
+    parser.add_argument("--mem", default="fixed:0",
+                        help="MB each stand-in holds, in the same form as --durations (default: fixed:0)")
+    parser.add_argument("--seed", type=int, default=1, help="seeds the durations and memory of every job (default: 1)")
+    parser.add_argument("--workdir", help="where to build the workspace (default: a temporary folder, removed after)")
+    parser.add_argument("--manager-args", default="", help="extra arguments for the Manager (i.e. \"--schedule fifo\")")
+    parser.add_argument("--output", metavar="FILE", help="also write the measurements to FILE as JSON")
+    args = parser.parse_args(argv)
+    if not 1 <= args.benchmarks <= 1000:
+        parser.error("--benchmarks takes 1 to 1000 benchmarks")
+    if args.invocations < 1:
+        parser.error("--invocations needs at least one invocation")
+    if args.hosts < 0:
+        parser.error("--hosts takes 0 or more workers")
+    for distribution in (args.durations, args.mem):
+        try:
+            parseDistribution(distribution)
+        except ValueError as e:
+            parser.error(str(e))
+    if not args.slots or args.slots < 1:
+        args.slots = multiprocessing.cpu_count()
+    return args
+
+# Builds the workspace, runs the Manager on it and reports how the run went
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    args = parseArgs()
+    workDir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="vgSpecSchedSim")
+    try:
+        jobs = buildWorkspace(workDir, args.benchmarks, args.invocations)
+        # The Manager names the jobs of a benchmark with several invocations "<benchmark> (<n>/<k>)"
+        durations = {}
+        peakMB = 0
+        for benchmark, part in jobs:
+            jobName = benchmark if args.invocations == 1 else benchmark + " (" + str(part + 1) + "/" + str(args.invocations) + ")"
+            exeCommand = getSimCommand(benchmark, part) + " data/in.txt"
+            durations[jobName] = drawValue(args.durations, args.seed, exeCommand, "duration")
+            peakMB = max(peakMB, drawValue(args.mem, args.seed, exeCommand, "memory"))
+        # The Manager admits jobs with no history by --job-mem, so it is told the stand-ins' real
+        # peak. Its 2 GB default would otherwise measure the admission, not the scheduling.
+        jobMemGB = (peakMB + standInOverheadMB) / 1024.0
+        scriptsDir = os.path.dirname(os.path.abspath(__file__))
+        standInCmd = sys.executable + " " + os.path.join(scriptsDir, "vgSpec2017SchedSim.py") + " standin"
+        slots = args.slots * max(args.hosts, 1)
+        managerCmd = ([sys.executable, os.path.join(scriptsDir, "vgSpec2017Manager.py"), "--workspace", workDir,
+                       "--valgrind", standInCmd, "--jobs", str(slots), "--no-sim-cache", "--job-mem", "{0:.3f}".format(jobMemGB)] +
+                      shlex.split(args.manager_args))
+        # Workers are started the way they would be over ssh, only on this host
+        workerCmd = sys.executable + " " + os.path.join(scriptsDir, "vgSpec2017Remote.py") + " worker --workspace " + workDir
+        for host in range(args.hosts):
+            managerCmd.extend(["--worker", str(args.slots) + ":" + workerCmd])
+        env = dict(os.environ)
+        env[durationsVariable] = args.durations
+        env[memoryVariable] = args.mem
+        env[seedVariable] = str(args.seed)
+        sys.stdout.write("Running the Manager on " + str(len(jobs)) + " jobs (" + args.durations + " s, " +
+                         "{0:.0f}".format(peakMB + standInOverheadMB) + " MB peak each)" +
+                         (" with " + str(args.hosts) + " workers" if args.hosts else "") + "...")
+        sys.stdout.flush()
+        eventsFile = os.path.join(workDir, "vgSpec2017", "logs", "events.jsonl")
+        startTime = time.time()
+        manager = subprocess.Popen(managerCmd, env=env)
+        cpuSeconds = None
+        if hasattr(os, "wait4"):
+            pid, status, usage = os.wait4(manager.pid, 0)
+            manager.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            cpuSeconds = usage.ru_utime + usage.ru_stime
+        else:
+            manager.wait()
+        wallSeconds = time.time() - startTime
+        sys.stdout.write("done\n")
+        if manager.returncode != 0:
+            sys.stdout.write("The Manager exited with " + str(manager.returncode) + ", see " + os.path.join(workDir, "vgSpec2017", "logs") + "\n")
+        ends = [entry for entry in vgSpec2017Journal.RunJournal(os.path.dirname(eventsFile), os.path.basename(eventsFile)).records()
+                if entry["event"] == "end"]
+        if not ends:
+            sys.stdout.write("No job finished, nothing to report\n")
+            return
+        result = measureRun(ends, slots, durations, wallSeconds, cpuSeconds)
+        result["hosts"] = args.hosts
+        result["durations"] = args.durations
+        result["managerArgs"] = args.manager_args
+        result["jobMemGB"] = jobMemGB
+        writeReport(result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=4, sort_keys=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workDir)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "standin":
+        sys.exit(standIn(sys.argv[2:]))
+    main()
@@ -0,0 +1,144 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Keeps the raw result of every valgrind simulation, keyed by a hash of
+# what went into it: the executable and its input files, the command
+# line, the valgrind options and the valgrind version. A benchmark whose
+# key has been simulated before (in any run) gets the stored result
+# instead of another simulation.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import json
+import shlex
+import hashlib
+import threading
+import subprocess
+import vgSpec2017Cache
+import vgSpec2017Compress
+import vgSpec2017Staging
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# ARGS: the valgrind command
+# RETURNS: the output of "valgrind --version", or "" if valgrind could not be run
+def getValgrindVersion(valgrind="valgrind"):
+    try:
+        versionCmd = subprocess.Popen(shlex.split(valgrind) + ["--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return versionCmd.communicate()[0].decode("utf-8", "replace").strip()
+    except OSError:
+        return ""
+
+# Gets the files a benchmark writes (its -o and -e files) from its speccmds.cmd,
+# so the outputs of earlier runs are not taken for inputs
+# ARGS: the lines of speccmds.cmd
+# RETURNS: the set of output file names
+def getOutputFiles(commands):
+    outputs = set()
+    for cmd in commands:
+        words = cmd.split()
+        for i in range(len(words) - 1):
+            if words[i] == "-o" or words[i] == "-e":
+                outputs.add(words[i + 1])
+    return outputs
+
+#########################################
+#          SIMULATION CACHE             #
+#########################################
+# The folder of stored results and a memo of the input hashes, so unchanged
+# input files (matched on size and mtime) are not read again
+class SimCache(object):
+    def __init__(self, cacheDir, stageMode="auto"):
+        self.cacheDir = cacheDir
+        self.stageMode = stageMode
+        self.memoFile = os.path.join(cacheDir, "inputs.json")
+        self.lock = threading.Lock()
+        vgSpec2017Cache.makeDir(cacheDir)
+        try:
+            with open(self.memoFile) as f:
+                self.memo = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.memo = {}
+
+    # Hashes one input file, reusing the memo if the file has not changed
+    # RETURNS: the hex SHA-1 of the file's contents
+    def hashInput(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            known = self.memo.get(path)
+        if known and known[0] == stat.st_size and known[1] == int(stat.st_mtime):
+            return known[2]
+        digest = vgSpec2017Cache.hashFile(path)
+        with self.lock:
+            self.memo[path] = [stat.st_size, int(stat.st_mtime), digest]
+        return digest
+
+    # Works out the key of simulating one invocation of a benchmark
+    # ARGS: the benchmark's executable directory, the executable command, the valgrind
+    # options, the valgrind version
+    # RETURNS: the key as a hex string
+    def simulationKey(self, exeDir, exeCommand, valgrindOptions, valgrindVersion):
+        with open(os.path.join(exeDir, "speccmds.cmd")) as f:
+            outputs = getOutputFiles(f.readlines())
+        sha = hashlib.sha1()
+        for part in (exeCommand, valgrindOptions, valgrindVersion):
+            sha.update((part + "\n").encode("utf-8"))
+        # Every file the benchmark could read: its run directory and the executable
+        inputs = []
+        for root, dirs, files in os.walk(exeDir):
+            dirs.sort()
+            for name in sorted(files):
+                relPath = os.path.relpath(os.path.join(root, name), exeDir)
+                if relPath not in outputs and relPath != "speccmds.cmd":
+                    inputs.append(relPath)
+        exePath = os.path.normpath(os.path.join(exeDir, exeCommand.split()[0]))
+        if os.path.isfile(exePath) and os.path.relpath(exePath, exeDir) not in inputs:
+            inputs.append(os.path.relpath(exePath, exeDir))
+        for relPath in inputs:
+            sha.update((relPath + " " + self.hashInput(os.path.join(exeDir, relPath)) + "\n").encode("utf-8"))
+        return sha.hexdigest()
+
+    # RETURNS: the file the result of a key is stored in
+    def resultFile(self, key):
+        return os.path.join(self.cacheDir, key + ".txt")
+
+    # Puts the stored result of a key in place
+    # ARGS: the key, the results file to fill
+    # RETURNS: True if there was a stored result
+    def fetch(self, key, resFile):
+        if not os.path.isfile(self.resultFile(key)):
+            return False
+        vgSpec2017Staging.stageFile(self.resultFile(key), resFile, self.stageMode)
+        return True
+
+    # Stores a finished simulation's result under its key
+    # ARGS: the key, the results file
+    # RETURNS: nothing
+    def store(self, key, resFile):
+        if os.path.isfile(resFile) and not os.path.isfile(self.resultFile(key)):
+            # Staged to the side and renamed, so a killed run never leaves half a result
+            tmpFile = vgSpec2017Compress.tempPath(self.resultFile(key))
+            vgSpec2017Staging.stageFile(resFile, tmpFile, self.stageMode)
+            os.rename(tmpFile, self.resultFile(key))
+
+    # Writes the input hash memo back out
+    def save(self):
+        with self.lock:
+            # Other sweeps may save the same memo, so each writes its own temporary file
+            tmpFile = vgSpec2017Compress.tempPath(self.memoFile)
+            with open(tmpFile, 'w') as f:
+                json.dump(self.memo, f)
+            os.rename(tmpFile, self.memoFile)
@@ -0,0 +1,113 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Stages a benchmark's spec2017 run directory into the vgSpec 2017
+# benchmarks folder. Files that are already staged and unchanged (same
+# size and modification time) are left alone. Everything else is
+# reflinked where the filesystem can share the data copy-on-write,
+# hard linked if asked to, and copied otherwise.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import shutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl that makes one file share another's data blocks (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# How a file that needs staging gets there
+#   auto : reflink, falling back to a copy
+#   link : hard link, falling back to a copy. Only safe if the benchmarks never
+#          write to a file they were given, since the spec2017 copy changes too.
+#   copy : always copy
+stageModes = ['auto', 'link', 'copy']
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Tries to reflink src to dst
+# RETURNS: True if dst now shares src's data
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as srcFile:
+            with open(dst, 'wb') as dstFile:
+                fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+    except (IOError, OSError):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+# RETURNS: True if dst is already a staged copy of src
+def _isStaged(src, dst):
+    try:
+        srcStat = os.stat(src)
+        dstStat = os.stat(dst)
+    except OSError:
+        return False
+    return (srcStat.st_size == dstStat.st_size and int(srcStat.st_mtime) == int(dstStat.st_mtime))
+
+# Brings one file up to date
+# ARGS: the source file, the staged file, the stage mode
+# RETURNS: what was done: "unchanged", "reflinked", "linked" or "copied"
+def stageFile(src, dst, mode):
+    if os.path.islink(src):
+        target = os.readlink(src)
+        if os.path.islink(dst) and os.readlink(dst) == target:
+            return "unchanged"
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.symlink(target, dst)
+        return "copied"
+    if _isStaged(src, dst):
+        return "unchanged"
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'auto' and _reflink(src, dst):
+        return "reflinked"
+    if mode == 'link':
+        try:
+            os.link(src, dst)
+            return "linked"
+        except OSError:
+            pass
+    # copy2 keeps the modification time, so the next stage sees the file as unchanged
+    shutil.copy2(src, dst)
+    return "copied"
+
+# Brings a whole directory tree up to date. Files only in the staged copy
+# (i.e. outputs of an earlier simulation) are left alone.
+# ARGS: the source directory, the staged directory, the stage mode
+# RETURNS: {what was done : number of files}
+def stageTree(srcDir, dstDir, mode='auto'):
+    counts = {"unchanged" : 0, "reflinked" : 0, "linked" : 0, "copied" : 0}
+    for root, dirs, files in os.walk(srcDir):
+        dstRoot = os.path.join(dstDir, os.path.relpath(root, srcDir))
+        if not os.path.isdir(dstRoot):
+            os.makedirs(dstRoot)
+        for filename in files:
+            counts[stageFile(os.path.join(root, filename), os.path.join(dstRoot, filename), mode)] += 1
+        # Symlinked directories are staged as symlinks, not walked
+        for dirname in list(dirs):
+            if os.path.islink(os.path.join(root, dirname)):
+                dirs.remove(dirname)
+                counts[stageFile(os.path.join(root, dirname), os.path.join(dstRoot, dirname), mode)] += 1
+    return counts
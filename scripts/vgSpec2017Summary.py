@@ -0,0 +1,207 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# The run-level summary: one row per benchmark with its program totals
+# for every event and the derived metrics of vgSpec2017Engine, written
+# to "summary.csv" and "summary.json" in the run's results folder.
+#
+# Every row comes from the "summary:" line at the end of the benchmark's
+# raw result (see vgSpec2017Parser.readSummary), so no result is parsed
+# in full. Rows are reused from summary.json for results that have not
+# changed since, which makes ranking the suite by an event nearly free.
+# Benchmarks the run journal lists as failed are kept in the summary with
+# the reason in its "Failed" column, whether or not they left a result.
+#
+# Args to this script
+#   1) The name of the directory of the run's results (i.e. "3_21_vgRun")
+#   --sort      The event or derived metric to rank the benchmarks by (default: DLmr)
+#   --top N     Only list the top N benchmarks (default: all)
+#   --jobs N    Read N results at once (default: 8)
+#   --workspace DIR  The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#               else /local/alec/cole_workspace/)
+#
+# The Manager and vgSpec2017GetResults.py write the summary at the end of a run.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import csv
+import json
+import argparse
+from multiprocessing.pool import ThreadPool
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Compress
+import vgSpec2017Journal
+import vgSpec2017Jobs
+
+summaryCsvName = "summary.csv"
+summaryJsonName = "summary.json"
+summaryMetrics = sorted(vgSpec2017Engine.derivedMetrics)
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Finds every benchmark's raw result in a run, whether or not it has been moved into raw/
+# yet, and whether or not it is compressed
+# ARGS: the root results directory of the run
+# RETURNS: {benchmark name : full path of its raw result}
+def findRawResults(root):
+    pattern = "*.*.txt" # All result files must be of the form ###.bmk_name.txt
+    results = {}
+    for folder in (root, root + "raw/"):
+        if os.path.isdir(folder):
+            for filename in vgSpec2017Compress.listResults(folder, pattern):
+                results[vgSpec2017Compress.stripCompression(filename)[0:-4]] = folder + filename
+    return results
+
+# Builds the summary row of one benchmark
+# ARGS: a (benchmark name, raw result) pair
+# RETURNS: the row as a dict, None if the result is not cachegrind output
+def summarizeResult(item):
+    bmkName, rawResult = item
+    stat = os.stat(rawResult)
+    try:
+        events, summary = vgSpec2017Parser.readSummary(rawResult)
+    except ValueError:
+        return None
+    totals = dict(zip(events, summary))
+    return {
+        "benchmark": bmkName,
+        "file"     : rawResult,
+        "size"     : stat.st_size,
+        "mtime"    : stat.st_mtime,
+        "totals"   : totals,
+        "metrics"  : dict((name, vgSpec2017Engine.metricFromTotals(name, totals)) for name in summaryMetrics)
+    }
+
+#########################################
+#             RUN SUMMARY               #
+#########################################
+# Reads the rows of a run's summary.json
+# ARGS: the root results directory of the run
+# RETURNS: {benchmark name : row}, empty if there is no summary yet
+def readRunSummary(root):
+    try:
+        with open(root + summaryJsonName) as f:
+            return dict((row["benchmark"], row) for row in json.load(f)["benchmarks"])
+    except (IOError, OSError, ValueError, KeyError):
+        return {}
+
+# Brings a run's summary up to date, reading only the results that changed since it was written
+# ARGS: the root results directory of the run, the most results to read at once
+# RETURNS: the rows, sorted by benchmark name
+def buildRunSummary(root, jobs=8):
+    known = readRunSummary(root)
+    failed = vgSpec2017Journal.RunJournal(root).failed()
+    rows = {}
+    toRead = []
+    for bmkName, rawResult in findRawResults(root).items():
+        row = known.get(bmkName)
+        stat = os.stat(rawResult)
+        if row and row["file"] == rawResult and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+            rows[bmkName] = row
+        else:
+            toRead.append((bmkName, rawResult))
+    if toRead:
+        pool = ThreadPool(max(min(jobs, len(toRead)), 1))
+        try:
+            for row in pool.map(summarizeResult, toRead):
+                if row is None:
+                    continue
+                rows[row["benchmark"]] = row
+        finally:
+            pool.close()
+            pool.join()
+    # Failed benchmarks are listed too, with or without a result
+    for bmkName in failed:
+        if bmkName not in rows:
+            rows[bmkName] = {"benchmark": bmkName, "file": None, "size": None, "mtime": None, "totals": {},
+                             "metrics": dict((name, None) for name in summaryMetrics)}
+    rows = [dict(rows[bmkName], failed=failed.get(bmkName)) for bmkName in sorted(rows)]
+    if toRead or rows != [known[bmkName] for bmkName in sorted(known)]:
+        writeRunSummary(root, rows)
+    return rows
+
+# Writes the summary of a run as CSV and JSON
+# ARGS: the root results directory of the run, the rows
+# RETURNS: nothing
+def writeRunSummary(root, rows):
+    events = list(vgSpec2017Parser.cgEvents)
+    for row in rows:
+        events.extend(event for event in row["totals"] if event not in events)
+    # Each writer has its own temporary files, so the Manager, the scripts and the query
+    # server can rewrite a run's summary at the same time
+    tmpCsv = vgSpec2017Compress.tempPath(root + summaryCsvName)
+    with open(tmpCsv, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Benchmark"] + events + summaryMetrics + ["Failed"])
+        for row in rows:
+            writer.writerow([row["benchmark"]] + [row["totals"].get(event, "") for event in events] +
+                            ["" if row["metrics"][name] is None else "{0:.4f}".format(row["metrics"][name]) for name in summaryMetrics] +
+                            [row.get("failed") or ""])
+    os.rename(tmpCsv, root + summaryCsvName)
+    tmpJson = vgSpec2017Compress.tempPath(root + summaryJsonName)
+    with open(tmpJson, 'w') as f:
+        json.dump({"events": events, "metrics": summaryMetrics, "benchmarks": rows}, f, indent=1, sort_keys=True)
+    os.rename(tmpJson, root + summaryJsonName)
+
+# Ranks the benchmarks of a run by an event or derived metric
+# ARGS: the summary rows, the event or metric name
+# RETURNS: [(benchmark name, value)], highest first, leaving out failed benchmarks and
+# benchmarks without the value
+def rankBenchmarks(rows, key):
+    field = "metrics" if key in vgSpec2017Engine.derivedMetrics else "totals"
+    ranked = [(row["benchmark"], row[field].get(key)) for row in rows if row[field].get(key) is not None and not row.get("failed")]
+    ranked.sort(key=lambda x:x[1], reverse=True)
+    return ranked
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and rank the benchmarks of a vgSpec 2017 run")
+    parser.add_argument("run", help="the name of the directory of the run's results (i.e. \"3_21_vgRun\")")
+    parser.add_argument("--sort", default="DLmr",
+                        help="the event or derived metric to rank the benchmarks by (default: DLmr)")
+    parser.add_argument("--top", type=int, default=None, help="only list the top N benchmarks (default: all)")
+    parser.add_argument("--jobs", type=int, default=8, help="the number of results to read at once (default: 8)")
+    parser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                        help="the folder holding spec/ and vgSpec2017/ (default: " + vgSpec2017Jobs.defaultWorkspace + ")")
+    args = parser.parse_args(argv)
+    if args.sort not in vgSpec2017Parser.cgEvents and args.sort not in vgSpec2017Engine.derivedMetrics:
+        parser.error("unknown event or metric " + args.sort)
+    return args
+
+# Brings the summary of the run named on the command line up to date and ranks its benchmarks
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    args = parseArgs()
+    root = os.path.join(os.path.abspath(args.workspace), "vgSpec2017", "results", args.run) + "/"
+    rows = buildRunSummary(root, args.jobs)
+    ranked = rankBenchmarks(rows, args.sort)
+    for bmkName, value in ranked[:args.top]:
+        num = "{:,}".format(value) if isinstance(value, int) else "{0:.4f}".format(value)
+        sys.stdout.write("%-30s %s\n" % (bmkName, num))
+    for row in rows:
+        if row.get("failed"):
+            sys.stdout.write("%-30s FAILED: %s\n" % (row["benchmark"], row["failed"]))
+    sys.stdout.write("Summary of " + str(len(rows)) + " benchmarks in " + root + summaryCsvName + "\n")
+
+if __name__ == "__main__":
+    main()
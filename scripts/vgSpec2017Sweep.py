@@ -0,0 +1,181 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Simulates the memory access traces of a vgSpec 2017 run made with
+# "vgSpec2017Manager.py --capture-trace" for a whole matrix of cache
+# configurations, without running valgrind again.
+#
+# Args to this script
+#   1) The name of the directory of the run's results (i.e. "3_21_vgRun")
+#   --I1    The I1 cache: <size>,<associativity>,<line size> (default: 32768,8,64)
+#   --D1    The D1 caches to try (default: 32768,8,64)
+#   --LL    The LL caches to try (default: 2097152,16,64)
+#   --jobs N    Simulate N benchmarks at once (default: 1)
+#   --workspace DIR  The folder holding spec/ and vgSpec2017/ (default: $VGSPEC2017_WORKSPACE,
+#               else /local/alec/cole_workspace/)
+#
+# --D1 and --LL take valgrind's syntax, but each field may list several values
+# separated by ":" and the options may be repeated, i.e.
+#   --LL 1048576:2097152:4194304,8:16,64 --LL 8388608,16,64
+# Every D1 is simulated with every LL.
+#
+# Each configuration's miss counts are written as a cachegrind output file (the
+# same events and summary line, no per-line counts) to
+# "sweep/<benchmark>/D1_<size>_<assoc>_<line>-LL_<size>_<assoc>_<line>.txt" in the
+# run's results folder, and every benchmark gets a table of them in "sweep/<benchmark>.txt".
+# Needs NumPy.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import fnmatch
+import multiprocessing
+import argparse
+import vgSpec2017Parser
+import vgSpec2017Engine
+import vgSpec2017Trace
+import vgSpec2017Jobs
+from vgSpec2017GetResults import makeResultsDir
+
+#########################################
+#           UTILITY FUNCTIONS           #
+#########################################
+# Finds every benchmark's traces in a run, one per invocation
+# ARGS: the root results directory of the run
+# RETURNS: {benchmark name : [trace files]}
+def findTraces(root):
+    traces = {}
+    for filename in sorted(os.listdir(root)):
+        if fnmatch.fnmatch(filename, "*.*.trace"):
+            bmkName = filename[0:-6]
+            # Invocations of the same benchmark are named <benchmark>.part<N>.trace
+            if bmkName.rsplit(".", 1)[-1].startswith("part"):
+                bmkName = bmkName.rsplit(".", 1)[0]
+            traces.setdefault(bmkName, []).append(root + filename)
+    return traces
+
+# RETURNS: the name of a configuration's result file
+def configFileName(d1Config, llConfig):
+    return ("D1_" + str(d1Config).replace(",", "_") + "-LL_" + str(llConfig).replace(",", "_") + ".txt")
+
+#########################################
+#               SWEEP                   #
+#########################################
+# Simulates every configuration for one benchmark and writes its results
+# ARGS: the benchmark name, its trace files, the output directory, the I1 config,
+# the D1 configs, the LL configs
+# RETURNS: the number of accesses simulated
+def sweepBenchmark(bmkName, traceFiles, outputDir, i1Config, d1Configs, llConfigs):
+    totals = {}
+    accesses = 0
+    # Every invocation starts with cold caches, so their counts just add up
+    for traceFile in traceFiles:
+        trace = vgSpec2017Trace.readTrace(traceFile)
+        accesses += len(trace[0])
+        for configs, counts in vgSpec2017Trace.simulateTrace(trace, i1Config, d1Configs, llConfigs).items():
+            if configs in totals:
+                totals[configs] = [a + b for a, b in zip(totals[configs], counts)]
+            else:
+                totals[configs] = counts
+    bmkDir = outputDir + bmkName + "/"
+    makeResultsDir(bmkDir)
+    columns = "{:<20} {:<20}" + " {:>16}" * len(vgSpec2017Trace.simEvents) + "\n"
+    with open(outputDir + bmkName + ".txt", 'w') as out:
+        header = "-------------------------------------------------------------------------------------------------\n"
+        header = header + "------------------------ CACHE SWEEP OF " + bmkName + " ------------------------\n"
+        header = header + "-------------------------------------------------------------------------------------------------\n"
+        out.write(header)
+        out.write("I1 " + str(i1Config) + ", " + "{:,}".format(accesses) + " accesses traced\n\n")
+        out.write(columns.format("D1", "LL", *vgSpec2017Trace.simEvents))
+        for d1Config in d1Configs:
+            for llConfig in llConfigs:
+                counts = totals[(i1Config, d1Config, llConfig)]
+                out.write(columns.format(str(d1Config), str(llConfig), *["{:,}".format(x) for x in counts]))
+                table = vgSpec2017Parser.CgTable()
+                table.desc = [i1Config.describe("I1"), d1Config.describe("D1"), llConfig.describe("LL")]
+                table.cmd = " ".join(traceFiles)
+                table.events = list(vgSpec2017Trace.simEvents)
+                table.summary = counts
+                vgSpec2017Parser.writeCachegrindOut(table, bmkDir + configFileName(d1Config, llConfig))
+    return accesses
+
+# Runs sweepBenchmark on an argument tuple, for the process pool
+# RETURNS: the benchmark name and the number of accesses simulated
+def sweepBenchmarkTask(task):
+    return task[0], sweepBenchmark(*task)
+
+#########################################
+#                 MAIN                  #
+#########################################
+# ARGS: the arguments to parse (default: sys.argv)
+# RETURNS: the parsed arguments, with the cache configurations expanded
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the traces of a vgSpec 2017 run for many cache configurations")
+    parser.add_argument("run", help="the name of the directory of the run's results (i.e. \"3_21_vgRun\")")
+    parser.add_argument("--I1", default="32768,8,64",
+                        help="the I1 cache: <size>,<associativity>,<line size> (default: 32768,8,64)")
+    parser.add_argument("--D1", action="append", default=[],
+                        help="D1 caches to try, fields may list values separated by \":\" (default: 32768,8,64)")
+    parser.add_argument("--LL", action="append", default=[],
+                        help="LL caches to try, fields may list values separated by \":\" (default: 2097152,16,64)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="the number of benchmarks to simulate at once (default: 1)")
+    parser.add_argument("--workspace", default=vgSpec2017Jobs.defaultWorkspace,
+                        help="the folder holding spec/ and vgSpec2017/ (default: " + vgSpec2017Jobs.defaultWorkspace + ")")
+    args = parser.parse_args(argv)
+    if not vgSpec2017Engine.available():
+        parser.error("simulating traces needs NumPy")
+    try:
+        args.i1Config = vgSpec2017Trace.parseCacheConfigs(args.I1)
+        args.d1Configs = [c for text in (args.D1 or ["32768,8,64"]) for c in vgSpec2017Trace.parseCacheConfigs(text)]
+        args.llConfigs = [c for text in (args.LL or ["2097152,16,64"]) for c in vgSpec2017Trace.parseCacheConfigs(text)]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(args.i1Config) != 1:
+        parser.error("--I1 takes a single cache")
+    args.i1Config = args.i1Config[0]
+    return args
+
+# Simulates every benchmark traced in the run named on the command line
+# ARGS: NONE
+# RETURNS: nothing
+def main():
+    args = parseArgs()
+    root = os.path.join(os.path.abspath(args.workspace), "vgSpec2017", "results", args.run) + "/"
+    traces = findTraces(root)
+    if not traces:
+        sys.stdout.write("No traces in " + root + " - was the run made with --capture-trace?\n")
+        return
+    outputDir = root + "sweep/"
+    makeResultsDir(outputDir)
+    sys.stdout.write("Simulating " + str(len(args.d1Configs) * len(args.llConfigs)) + " cache configurations for " +
+                     str(len(traces)) + " benchmarks\n")
+    tasks = [(bmkName, traces[bmkName], outputDir, args.i1Config, args.d1Configs, args.llConfigs) for bmkName in sorted(traces)]
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            for bmkName, accesses in pool.imap_unordered(sweepBenchmarkTask, tasks):
+                sys.stdout.write("Simulated " + bmkName + " (" + "{:,}".format(accesses) + " accesses)\n")
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            bmkName, accesses = sweepBenchmarkTask(task)
+            sys.stdout.write("Simulated " + bmkName + " (" + "{:,}".format(accesses) + " accesses)\n")
+    sys.stdout.write("Sweep complete. Please see " + outputDir + "\n")
+
+if __name__ == "__main__":
+    main()
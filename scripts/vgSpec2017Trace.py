@@ -0,0 +1,359 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Memory access traces and the offline cache simulator that replays
+# them. A benchmark's accesses are captured once with valgrind's lackey
+# tool (optionally only a window of them) into a compressed trace, and
+# any number of I1/D1/LL cache configurations are then simulated from
+# that trace without running valgrind again.
+#
+# Run directly, this script captures a trace (the Manager does this for
+# every job in --capture-trace mode):
+#   vgSpec2017Trace.py capture [--skip N] [--window N] TRACEFILE -- COMMAND...
+#
+# The simulator is LRU and set-associative like cachegrind's. For one line
+# size and number of sets, an access hits in an A-way cache exactly when
+# fewer than A other lines of its set were touched since its line was last
+# used (its stack distance), so every associativity comes out of a single
+# pass. Stack distances are counted with NumPy, a whole level of a divide
+# and conquer at a time.
+#
+# Needs NumPy, same as vgSpec2017Engine.
+#
+# NOTE: This Software is provided AS IS.
+# If we did not have as much control over these parameters
+# as we do, much more error handling would be needed to ensure
+# safe operation. For our purposes, however, this would be trivial
+# since the application this is intended for is highly controled.
+#
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import zlib
+import shutil
+import struct
+import signal
+import shlex
+import tempfile
+import threading
+import subprocess
+import argparse
+try:
+    from shlex import quote as shellQuote
+except ImportError:
+    from pipes import quote as shellQuote
+import vgSpec2017Engine
+
+np = vgSpec2017Engine.np
+
+#########################################
+#            TRACE SETTINGS             #
+#########################################
+lackeyOptions = "--tool=lackey --trace-mem=yes"
+chunkAccesses = 1 << 20 # Accesses per compressed chunk of a trace file
+# Access kinds, as lackey names them
+INSTR, LOAD, STORE, MODIFY = 0, 1, 2, 3
+lackeyKinds = {'I': INSTR, 'L': LOAD, 'S': STORE, 'M': MODIFY}
+# The events a simulation reports, in cachegrind's order
+simEvents = ['Ir', 'I1mr', 'ILmr', 'Dr', 'D1mr', 'DLmr', 'Dw', 'D1mw', 'DLmw']
+
+#########################################
+#             TRACE FILES               #
+#########################################
+# A trace file is a run of chunks, each a (count, compressed length) header and
+# the zlib compressed kinds (uint8), address deltas (int64) and sizes (uint8)
+# of <count> accesses. Addresses are stored as deltas since they compress far better.
+
+# Writes one chunk of accesses
+# ARGS: the open trace file, lists of the kinds, addresses and sizes
+# RETURNS: nothing
+def _writeChunk(out, kinds, addrs, sizes):
+    addrArray = np.array(addrs, dtype=np.uint64).view(np.int64)
+    deltas = np.diff(addrArray, prepend=np.int64(0))
+    payload = (np.array(kinds, dtype=np.uint8).tobytes() + deltas.astype('<i8').tobytes() +
+               np.array(sizes, dtype=np.uint8).tobytes())
+    data = zlib.compress(payload, 6)
+    out.write(struct.pack('<II', len(kinds), len(data)))
+    out.write(data)
+
+# Reads every access back out of a trace file
+# ARGS: the trace file
+# RETURNS: (kinds, addresses, sizes) arrays
+def readTrace(traceFile):
+    kinds = []
+    addrs = []
+    sizes = []
+    with open(traceFile, 'rb') as f:
+        header = f.read(8)
+        while len(header) == 8:
+            count, length = struct.unpack('<II', header)
+            payload = zlib.decompress(f.read(length))
+            kinds.append(np.frombuffer(payload, dtype=np.uint8, count=count))
+            deltas = np.frombuffer(payload, dtype='<i8', count=count, offset=count)
+            addrs.append(np.cumsum(deltas).astype(np.int64))
+            sizes.append(np.frombuffer(payload, dtype=np.uint8, count=count, offset=9 * count))
+            header = f.read(8)
+    if not kinds:
+        return np.zeros(0, np.uint8), np.zeros(0, np.int64), np.zeros(0, np.uint8)
+    return np.concatenate(kinds), np.concatenate(addrs), np.concatenate(sizes)
+
+# Captures a command's memory accesses with lackey into a trace file
+# ARGS: the trace file, the command (list of words), the accesses to skip before
+# recording, the most accesses to record (0 for all of them), the valgrind command
+# RETURNS: valgrind's exit code (0 if it was stopped once the window was full)
+def captureTrace(traceFile, command, skip=0, window=0, valgrind="valgrind"):
+    # Lackey's trace goes through a pipe, so it never lands on disk uncompressed
+    tmpDir = tempfile.mkdtemp()
+    fifo = os.path.join(tmpDir, "lackey.fifo")
+    os.mkfifo(fifo)
+    valgrindCmd = shlex.split(valgrind) + lackeyOptions.split() + ["--log-file=" + fifo] + command
+    lackey = subprocess.Popen(valgrindCmd)
+    # If valgrind dies before opening its log, opening the other end of the pipe
+    # lets the reader see the end of it instead of waiting forever
+    readerDone = threading.Event()
+    def unblockReader():
+        lackey.wait()
+        while not readerDone.is_set():
+            try:
+                os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            readerDone.wait(0.1)
+    waiter = threading.Thread(target=unblockReader)
+    waiter.daemon = True
+    waiter.start()
+    seen = 0
+    recorded = 0
+    stopped = False
+    kinds = []
+    addrs = []
+    sizes = []
+    try:
+        with open(traceFile + ".tmp", 'wb') as out:
+            with open(fifo) as trace:
+                for line in trace:
+                    # "I  0023C790,2" or " L BE801950,4" - anything else is valgrind's own output
+                    kind = lackeyKinds.get(line[0:1] if line[0:1] == "I" else line[1:2])
+                    if kind is None or line[0:2] == "==":
+                        continue
+                    seen += 1
+                    if seen <= skip:
+                        continue
+                    addr, size = line[3:].split(",")
+                    kinds.append(kind)
+                    addrs.append(int(addr, 16))
+                    sizes.append(min(int(size), 255))
+                    recorded += 1
+                    if len(kinds) == chunkAccesses:
+                        _writeChunk(out, kinds, addrs, sizes)
+                        kinds, addrs, sizes = [], [], []
+                    if window and recorded >= window:
+                        stopped = True
+                        break
+            if kinds:
+                _writeChunk(out, kinds, addrs, sizes)
+    finally:
+        readerDone.set()
+        if stopped:
+            # The window is full, there is no need to run the benchmark to the end
+            try:
+                lackey.send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+        waiter.join()
+        shutil.rmtree(tmpDir)
+    returncode = 0 if stopped else lackey.returncode
+    # A failed capture leaves no trace behind, so it is never taken for a finished one
+    if returncode == 0:
+        os.rename(traceFile + ".tmp", traceFile)
+    else:
+        os.remove(traceFile + ".tmp")
+    return returncode
+
+# Builds the command a job runs to capture a trace (this script, run by the same python)
+# ARGS: the trace file, the executable command, the accesses to skip, the most to record,
+# the valgrind command
+# RETURNS: the command as a string
+def getCaptureCmd(traceFile, exeCommand, skip=0, window=0, valgrind="valgrind"):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vgSpec2017Trace.py")
+    return (sys.executable + " " + script + " capture --skip " + str(skip) + " --window " + str(window) +
+            " --valgrind " + shellQuote(valgrind) + " " + traceFile + " -- " + exeCommand)
+
+# RETURNS: the settings of a capture as a string, for the run info and the simulation cache
+def getCaptureOptions(skip=0, window=0):
+    return lackeyOptions + " (skip " + str(skip) + ", window " + str(window) + ")"
+
+#########################################
+#          CACHE CONFIGURATIONS         #
+#########################################
+# One cache geometry, given the way valgrind's --I1/--D1/--LL options are
+class CacheConfig(object):
+    def __init__(self, size, assoc, lineSize):
+        self.size = size
+        self.assoc = assoc
+        self.lineSize = lineSize
+        self.numSets = size // (assoc * lineSize)
+        if (self.numSets * assoc * lineSize != size or self.numSets & (self.numSets - 1) or
+                lineSize & (lineSize - 1) or self.numSets < 1):
+            raise ValueError("cache " + str(self) + " needs a power of two number of sets and line size")
+        self.lineBits = lineSize.bit_length() - 1
+
+    def __str__(self):
+        return str(self.size) + "," + str(self.assoc) + "," + str(self.lineSize)
+
+    # RETURNS: the line in cachegrind's "desc:" format (i.e. "D1 cache: 32768 B, 64 B, 8-way associative")
+    def describe(self, name):
+        return name + " cache: " + str(self.size) + " B, " + str(self.lineSize) + " B, " + str(self.assoc) + "-way associative"
+
+# Expands a cache option into every configuration it names. Each of the three
+# fields may list several values separated by ":", i.e. "1048576:2097152,8:16,64"
+# ARGS: the option text
+# RETURNS: a list of CacheConfigs
+def parseCacheConfigs(text):
+    fields = text.split(",")
+    if len(fields) != 3:
+        raise ValueError("expected <size>,<associativity>,<line size>: " + text)
+    values = [[int(x) for x in field.split(":")] for field in fields]
+    return [CacheConfig(size, assoc, lineSize) for size in values[0] for assoc in values[1] for lineSize in values[2]]
+
+#########################################
+#              SIMULATION               #
+#########################################
+# For every query i, counts the j < i with prev[j] <= limit[i]. Done as a divide and
+# conquer over the bits of the index: at level k, a query with bit k set counts the
+# left half of its 2^(k+1) block, and every level is a single sort and search.
+# ARGS: the prev array, the query indexes (ascending), the limit of each query
+# RETURNS: the counts
+def _countEarlierAtMost(prev, queries, limits):
+    n = len(prev)
+    counts = np.zeros(len(queries), dtype=np.int64)
+    index = np.arange(n, dtype=np.int64)
+    stride = np.int64(n + 1)
+    level = 0
+    while (1 << level) < n:
+        inRight = ((queries >> level) & 1) == 1
+        if inRight.any():
+            left = index[((index >> level) & 1) == 0]
+            keys = np.sort((left >> (level + 1)) * stride + prev[left] + 1)
+            blocks = (queries[inRight] >> (level + 1)) * stride
+            counts[inRight] += (np.searchsorted(keys, blocks + limits[inRight] + 1, 'right') -
+                                np.searchsorted(keys, blocks, 'left'))
+        level += 1
+    return counts
+
+# Works out the LRU stack distance of every reference: how many other lines of its
+# set were used since its own line was last used
+# ARGS: the line of every reference in program order, the number of sets (a power of two)
+# RETURNS: the distances, -1 for the first use of a line
+def stackDistances(lines, numSets):
+    n = len(lines)
+    distances = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return distances
+    # Every set is its own LRU stack, so lay the sets out one after another
+    bySet = np.argsort(lines & (numSets - 1), kind='stable')
+    seq = lines[bySet]
+    byLine = np.argsort(seq, kind='stable')
+    prev = np.full(n, -1, dtype=np.int64)
+    same = seq[byLine[1:]] == seq[byLine[:-1]]
+    prev[byLine[1:][same]] = byLine[:-1][same]
+    # Lines used between a reference and its line's last use are those whose
+    # own last use is at or before it: #{j < i : prev[j] <= p} - (p + 1)
+    queries = np.nonzero(prev >= 0)[0]
+    limits = prev[queries]
+    seqDistances = np.full(n, -1, dtype=np.int64)
+    seqDistances[queries] = _countEarlierAtMost(prev, queries, limits) - (limits + 1)
+    distances[bySet] = seqDistances
+    return distances
+
+# Simulates one cache level for every associativity of a line size and set count
+# ARGS: the addresses and sizes of the accesses reaching the level (program order),
+# the line size bits, the number of sets, the associativities
+# RETURNS: {associativity : miss flag of every access}. An access that spans two
+# lines misses if either line does, like cachegrind.
+def simulateLevel(addrs, sizes, lineBits, numSets, assocs):
+    first = addrs >> lineBits
+    last = (addrs + np.maximum(sizes.astype(np.int64), 1) - 1) >> lineBits
+    spans = np.nonzero(last != first)[0]
+    # Second lines straight after the first, keeping program order
+    owner = np.concatenate([np.arange(len(addrs)), spans])
+    order = np.argsort(owner, kind='stable')
+    refLines = np.concatenate([first, last[spans]])[order]
+    distances = stackDistances(refLines, numSets)
+    owner = owner[order]
+    misses = {}
+    for assoc in assocs:
+        refMiss = (distances < 0) | (distances >= assoc)
+        accessMiss = np.zeros(len(addrs), dtype=bool)
+        np.logical_or.at(accessMiss, owner, refMiss)
+        misses[assoc] = accessMiss
+    return misses
+
+# Groups cache configurations that can share one stack distance pass
+# RETURNS: {(line bits, number of sets) : [configs]}
+def _groupConfigs(configs):
+    groups = {}
+    for config in configs:
+        groups.setdefault((config.lineBits, config.numSets), []).append(config)
+    return groups
+
+# Simulates a trace for every combination of the given cache configurations
+# ARGS: the (kinds, addresses, sizes) of a trace, the I1 configuration, the D1
+# configurations, the LL configurations
+# RETURNS: {(I1, D1, LL) configs : [count per event in simEvents]}
+def simulateTrace(trace, i1Config, d1Configs, llConfigs):
+    kinds, addrs, sizes = trace
+    isInstr = kinds == INSTR
+    # Like cachegrind, a modify (a load and store of the same data) is counted as one read
+    isRead = (kinds == LOAD) | (kinds == MODIFY)
+    isWrite = kinds == STORE
+    instrIdx = np.nonzero(isInstr)[0]
+    dataIdx = np.nonzero(~isInstr)[0]
+    base = [int(isInstr.sum()), 0, 0, int(isRead.sum()), 0, 0, int(isWrite.sum()), 0, 0]
+    i1Miss = simulateLevel(addrs[instrIdx], sizes[instrIdx], i1Config.lineBits, i1Config.numSets, [i1Config.assoc])[i1Config.assoc]
+    results = {}
+    for (lineBits, numSets), d1Group in _groupConfigs(d1Configs).items():
+        d1Misses = simulateLevel(addrs[dataIdx], sizes[dataIdx], lineBits, numSets, [c.assoc for c in d1Group])
+        for d1Config in d1Group:
+            # The LL only sees what missed in I1 or D1, in program order
+            l1Miss = np.zeros(len(kinds), dtype=bool)
+            l1Miss[instrIdx[i1Miss]] = True
+            l1Miss[dataIdx[d1Misses[d1Config.assoc]]] = True
+            llIdx = np.nonzero(l1Miss)[0]
+            counts = list(base)
+            counts[1] = int(i1Miss.sum())
+            counts[4] = int((l1Miss & isRead).sum())
+            counts[7] = int((l1Miss & isWrite).sum())
+            for (llLineBits, llNumSets), llGroup in _groupConfigs(llConfigs).items():
+                llMisses = simulateLevel(addrs[llIdx], sizes[llIdx], llLineBits, llNumSets, [c.assoc for c in llGroup])
+                for llConfig in llGroup:
+                    llMiss = np.zeros(len(kinds), dtype=bool)
+                    llMiss[llIdx[llMisses[llConfig.assoc]]] = True
+                    configCounts = list(counts)
+                    configCounts[2] = int((llMiss & isInstr).sum())
+                    configCounts[5] = int((llMiss & isRead).sum())
+                    configCounts[8] = int((llMiss & isWrite).sum())
+                    results[(i1Config, d1Config, llConfig)] = configCounts
+    return results
+
+#########################################
+#                 MAIN                  #
+#########################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture a command's memory accesses into a vgSpec 2017 trace")
+    subparsers = parser.add_subparsers(dest="action")
+    capture = subparsers.add_parser("capture", help="run the command under lackey and write its trace")
+    capture.add_argument("--skip", type=int, default=0, help="accesses to skip before recording")
+    capture.add_argument("--window", type=int, default=0, help="the most accesses to record (default: all)")
+    capture.add_argument("--valgrind", default="valgrind", help="the valgrind command (default: valgrind)")
+    capture.add_argument("traceFile", help="the trace file to write")
+    capture.add_argument("command", nargs=argparse.REMAINDER, help="-- then the command to run")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[0:1] == ["--"] else args.command
+    sys.exit(captureTrace(args.traceFile, command, args.skip, args.window, args.valgrind))
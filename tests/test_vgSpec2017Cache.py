@@ -0,0 +1,103 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Checks that vgSpec2017Cache.py hands back a parsed table only while
+# the raw result and the parser are the ones it was saved from, and
+# treats a damaged cache file as a miss.
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import vgSpec2017Engine
+import vgSpec2017Parser
+import vgSpec2017Cache
+
+result = ["events: Ir DLmr", "fl=a.c", "fn=f", "1 10 1", "2 5 0", "fl=b.c", "fn=g", "7 3 2", "summary: 18 3"]
+
+@unittest.skipIf(not vgSpec2017Engine.available(), "needs NumPy")
+class LoadTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.tmpDir, "cache")
+        self.rawResult = os.path.join(self.tmpDir, "505.mcf_r.txt")
+        self.writeResult(result)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def writeResult(self, lines):
+        with open(self.rawResult, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+    # RETURNS: the table and whether it came from the cache
+    def load(self):
+        return vgSpec2017Cache.loadTable(self.rawResult, self.cacheDir)
+
+    def testKeyFollowsContentsAndParser(self):
+        key = vgSpec2017Cache.cacheKey(self.rawResult)
+        self.assertEqual(vgSpec2017Cache.cacheKey(self.rawResult), key)
+        self.assertTrue(key.endswith("-" + str(vgSpec2017Parser.PARSER_VERSION)))
+        self.writeResult(result[:-1] + ["summary: 18 4"])
+        self.assertNotEqual(vgSpec2017Cache.cacheKey(self.rawResult), key)
+
+    def testSecondLoadComesFromTheCache(self):
+        parsed, cached = self.load()
+        self.assertFalse(cached)
+        self.assertTrue(os.path.isfile(vgSpec2017Cache.cacheFile(self.rawResult, self.cacheDir)))
+        table, cached = self.load()
+        self.assertTrue(cached)
+        self.assertEqual(table.events, parsed.events)
+        self.assertEqual(table.total("Ir"), 18)
+        self.assertEqual(list(table.summary), [18, 3])
+        self.assertEqual(table.counts.tolist(), parsed.counts.tolist())
+        self.assertEqual(table.fileNames, parsed.fileNames)
+        # No temporary files are left behind
+        self.assertEqual(os.listdir(self.cacheDir), [os.path.basename(vgSpec2017Cache.cacheFile(self.rawResult, self.cacheDir))])
+
+    def testChangedResultIsParsedAgain(self):
+        self.load()
+        self.writeResult(result[:3] + ["1 20 1"] + result[4:-1] + ["summary: 28 3"])
+        table, cached = self.load()
+        self.assertFalse(cached)
+        self.assertEqual(table.total("Ir"), 28)
+        self.assertTrue(self.load()[1])
+
+    def testNewParserVersionIsParsedAgain(self):
+        self.load()
+        version = vgSpec2017Parser.PARSER_VERSION
+        vgSpec2017Parser.PARSER_VERSION = version + 1
+        try:
+            self.assertFalse(self.load()[1])
+        finally:
+            vgSpec2017Parser.PARSER_VERSION = version
+
+    def testDamagedCacheFileIsAMiss(self):
+        self.load()
+        path = vgSpec2017Cache.cacheFile(self.rawResult, self.cacheDir)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for damaged in (data[:len(data) // 2], data[:10], b"", b"not a zip file at all"):
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            table, cached = self.load()
+            self.assertFalse(cached)
+            self.assertEqual(table.total("Ir"), 18)
+
+    def testCacheFolderMadeByAnotherJob(self):
+        os.makedirs(self.cacheDir)
+        self.assertFalse(self.load()[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Checks that vgSpec2017Diff.py lines up the rows of two runs by source
+# file, function and line, whatever order the runs list them in, and
+# reports the lines that changed the most.
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import vgSpec2017Engine
+import vgSpec2017Parser
+import vgSpec2017Diff
+
+baseline = ["events: Ir DLmr", "fl=a.c", "fn=f", "1 10 1", "2 5 0", "fl=b.c", "fn=g", "7 3 2", "summary: 18 3"]
+# Listed in another order, so every file and function gets another id. f's line 1 got
+# slower, g's line 7 faster, f's line 2 is gone and h is new.
+compared = ["events: Ir DLmr Bc", "fl=c.c", "fn=h", "4 6 6 1", "fl=b.c", "fn=g", "7 1 0 0", "fl=a.c", "fn=f", "1 30 2 0",
+            "summary: 37 8 1"]
+
+@unittest.skipIf(not vgSpec2017Engine.available(), "needs NumPy")
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    # Writes a raw result into a run's results folder
+    # ARGS: the run name, the result's lines
+    # RETURNS: the root results directory of the run
+    def writeRun(self, run, lines):
+        root = os.path.join(self.tmpDir, run, "")
+        os.makedirs(root)
+        with open(root + "505.mcf_r.txt", 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        return root
+
+    # RETURNS: the EventTable of the given raw result lines
+    def table(self, lines):
+        fd, path = tempfile.mkstemp(suffix=".txt", dir=self.tmpDir)
+        with os.fdopen(fd, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        return vgSpec2017Engine.fromCgTable(vgSpec2017Parser.parseCachegrindOut(path))
+
+    # RETURNS: {(file, function, line) : (before counts, after counts)} of the aligned rows
+    def rows(self, aligned):
+        return dict(((aligned.fileNames[aligned.files[i]], aligned.fnNames[aligned.fns[i]], int(aligned.lines[i])),
+                     (aligned.counts[0][i].tolist(), aligned.counts[1][i].tolist())) for i in range(len(aligned.lines)))
+
+    def testRowsLineUpByFileFunctionAndLine(self):
+        aligned = vgSpec2017Engine.AlignedTables(self.table(baseline), self.table(compared))
+        # Only the events both runs have are compared
+        self.assertEqual(aligned.events, ["Ir", "DLmr"])
+        self.assertEqual(self.rows(aligned), {("a.c", "f", 1): ([10, 1], [30, 2]),
+                                              ("a.c", "f", 2): ([5, 0], [0, 0]),
+                                              ("b.c", "g", 7): ([3, 2], [1, 0]),
+                                              ("c.c", "h", 4): ([0, 0], [6, 6])})
+
+    def testSameLineInTwoFunctionsStaysApart(self):
+        a = self.table(["events: Ir", "fl=a.c", "fn=f", "3 1", "fn=g", "3 2", "summary: 3"])
+        b = self.table(["events: Ir", "fl=a.c", "fn=g", "3 5", "summary: 5"])
+        aligned = vgSpec2017Engine.AlignedTables(a, b)
+        self.assertEqual(self.rows(aligned), {("a.c", "f", 3): ([1], [0]), ("a.c", "g", 3): ([2], [5])})
+
+    def testTopChanges(self):
+        aligned = vgSpec2017Engine.AlignedTables(self.table(baseline), self.table(compared))
+        regressions, improvements = aligned.topChanges("Ir", 10)
+        self.assertEqual([int(aligned.lines[i]) for i in regressions], [1, 4])
+        self.assertEqual([int(aligned.lines[i]) for i in improvements], [2, 7])
+        regressions, improvements = aligned.topChanges("Ir", 1)
+        self.assertEqual([int(aligned.lines[i]) for i in regressions], [1])
+        self.assertEqual([int(aligned.lines[i]) for i in improvements], [2])
+
+    def testAgainstAnEmptyRun(self):
+        aligned = vgSpec2017Engine.AlignedTables(self.table(["events: Ir", "summary: 0"]),
+                                                 self.table(["events: Ir", "fl=a.c", "fn=f", "1 4", "summary: 4"]))
+        self.assertEqual(self.rows(aligned), {("a.c", "f", 1): ([0], [4])})
+
+    def testDiffBenchmarkReport(self):
+        roots = (self.writeRun("base", baseline), self.writeRun("new", compared))
+        outputDir = os.path.join(self.tmpDir, "diff", "")
+        os.makedirs(outputDir)
+        totals = vgSpec2017Diff.diffBenchmark("505.mcf_r.txt", roots, outputDir, ["Ir", "DLmr", "Bc"], 10)
+        # Bc is only in one run, so it is left out
+        self.assertEqual(totals, {"Ir": (18, 37), "DLmr": (3, 8)})
+        with open(outputDir + "505.mcf_r.txt") as f:
+            report = f.read()
+        self.assertIn("Ir: 18 -> 37 (+105.56 %)", report)
+        self.assertEqual(vgSpec2017Diff.percentChange(0, 5), "new")
+        self.assertEqual(vgSpec2017Diff.percentChange(0, 0), "0.00 %")
+        self.assertEqual(vgSpec2017Diff.percentChange(200, 150), "-25.00 %")
+
+if __name__ == "__main__":
+    unittest.main()
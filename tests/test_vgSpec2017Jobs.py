@@ -0,0 +1,250 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Checks the order the JobPool of vgSpec2017Jobs.py starts jobs in, how
+# it admits them by expected peak memory, and the runtime estimates the
+# Manager orders benchmarks by. Jobs run on
+# a stand-in executor, so no valgrind is needed.
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import vgSpec2017Jobs
+import vgSpec2017Journal
+
+# Runs every job for <runtime> seconds, keeping the order they started in and the
+# most that were ever running at once
+class FakeExecutor(object):
+    checksMemory = True
+
+    def __init__(self, runtime=0.0, oomKills=None):
+        self.runtime = runtime
+        self.oomKills = oomKills or {} # {job name : times the OOM killer ends it, at what peak (KB)}
+        self.started = []
+        self.alive = 0
+        self.mostAlive = 0
+        self.lock = threading.Lock()
+
+    def capacity(self):
+        return None
+
+    def start(self, job, events):
+        with self.lock:
+            self.started.append(job.name)
+            self.alive += 1
+            self.mostAlive = max(self.mostAlive, self.alive)
+        timer = threading.Timer(self.runtime, self._exit, (job, events))
+        timer.daemon = True
+        timer.start()
+
+    def _exit(self, job, events):
+        with self.lock:
+            self.alive -= 1
+            kills, peak = self.oomKills.get(job.name, (0, None))
+            job.oomKilled = self.started.count(job.name) <= kills
+        job.returncode = -9 if job.oomKilled else 0
+        job.maxRss = peak
+        events.put(("exit", job))
+
+    def memoryUsed(self, job):
+        return 0
+
+    def kill(self, job):
+        pass
+
+    def close(self):
+        pass
+
+# Makes jobs and pools in a folder of their own
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    # RETURNS: a job with a log in the test folder and the given priority
+    def makeJob(self, name, priority=0):
+        job = vgSpec2017Jobs.Job(name, self.tmpDir, os.path.join(self.tmpDir, name + "_log.txt"),
+                                 os.path.join(self.tmpDir, name + ".txt"))
+        job.priority = priority
+        return job
+
+    # RETURNS: a pool running jobs on <executor>, highest job.priority first
+    def makePool(self, executor, maxJobs=1, **options):
+        return vgSpec2017Jobs.JobPool(maxJobs, lambda job: job.priority, executor=executor, **options)
+
+class JobPoolTest(PoolTestCase):
+    def testHighestPriorityFirst(self):
+        executor = FakeExecutor()
+        pool = self.makePool(executor)
+        for name, priority in (("short", 1), ("long", 30), ("medium", 5)):
+            pool.submit(self.makeJob(name, priority))
+        pool.run()
+        self.assertEqual(executor.started, ["long", "medium", "short"])
+
+    def testEqualPrioritiesKeepSubmissionOrder(self):
+        executor = FakeExecutor()
+        pool = self.makePool(executor)
+        for name in ("a", "b", "c"):
+            pool.submit(self.makeJob(name))
+        pool.run()
+        self.assertEqual(executor.started, ["a", "b", "c"])
+
+    def testWithoutPriorityInSubmissionOrder(self):
+        executor = FakeExecutor()
+        pool = vgSpec2017Jobs.JobPool(1, executor=executor)
+        for name, priority in (("short", 1), ("long", 30)):
+            pool.submit(self.makeJob(name, priority))
+        pool.run()
+        self.assertEqual(executor.started, ["short", "long"])
+
+    # A queued job waits for an expected job with a higher priority still being staged
+    def testWaitsForExpectedHigherPriority(self):
+        executor = FakeExecutor()
+        pool = self.makePool(executor)
+        pool.expect(1, 30)
+        pool.submit(self.makeJob("short", 1))
+        timer = threading.Timer(0.2, pool.submitAsync, (self.makeJob("long", 30), 30))
+        timer.start()
+        pool.run()
+        timer.join()
+        self.assertEqual(executor.started, ["long", "short"])
+
+    # An expected job that is not coming after all (or comes as several) stops holding others back
+    def testExpectedJobsReplacedOrDropped(self):
+        executor = FakeExecutor()
+        pool = self.makePool(executor)
+        pool.expect(2, 30)
+        pool.submit(self.makeJob("short", 1))
+        pool.submitAsync(None, 30)
+        pool.submitAsync([self.makeJob("part1", 30), self.makeJob("part2", 20)], 30)
+        completed = pool.run()
+        self.assertEqual(executor.started, ["part1", "part2", "short"])
+        self.assertEqual(len(completed), 3)
+        self.assertEqual(pool.expectedPriorities, [])
+
+class MemoryAdmissionTest(PoolTestCase):
+    def setUp(self):
+        PoolTestCase.setUp(self)
+        self.availableMemory = vgSpec2017Jobs.availableMemory
+        vgSpec2017Jobs.availableMemory = lambda: 5 << 20
+
+    def tearDown(self):
+        vgSpec2017Jobs.availableMemory = self.availableMemory
+        PoolTestCase.tearDown(self)
+
+    # RETURNS: a pool of 4 slots admitting jobs by job.memory (KB)
+    def makeMemoryPool(self, executor, memoryReserve=0):
+        return self.makePool(executor, 4, memoryOf=lambda job: job.memory, memoryReserve=memoryReserve)
+
+    # RETURNS: a job expected to peak at <gb> GB
+    def makeMemoryJob(self, name, gb, priority=0):
+        job = self.makeJob(name, priority)
+        job.memory = gb << 20
+        return job
+
+    def testJobsThatDoNotFitTogetherRunAlone(self):
+        executor = FakeExecutor(0.05)
+        pool = self.makeMemoryPool(executor)
+        for name in ("a", "b", "c"):
+            pool.submit(self.makeMemoryJob(name, 3))
+        pool.run()
+        self.assertEqual(executor.mostAlive, 1)
+
+    def testReserveIsKeptFree(self):
+        executor = FakeExecutor(0.05)
+        pool = self.makeMemoryPool(executor)
+        for name in ("a", "b"):
+            pool.submit(self.makeMemoryJob(name, 2))
+        pool.run()
+        self.assertEqual(executor.mostAlive, 2)
+        executor = FakeExecutor(0.05)
+        pool = self.makeMemoryPool(executor, memoryReserve=2 << 20)
+        for name in ("a", "b"):
+            pool.submit(self.makeMemoryJob(name, 2))
+        pool.run()
+        self.assertEqual(executor.mostAlive, 1)
+
+    # A smaller job further down the queue goes ahead of one that does not fit yet
+    def testSmallerJobGoesAhead(self):
+        executor = FakeExecutor(0.1)
+        pool = self.makeMemoryPool(executor)
+        pool.submit(self.makeMemoryJob("big1", 3, 3))
+        pool.submit(self.makeMemoryJob("big2", 3, 2))
+        pool.submit(self.makeMemoryJob("small", 1, 1))
+        pool.run()
+        self.assertEqual(executor.started, ["big1", "small", "big2"])
+
+    # A job the OOM killer ends is run again, needing more than it died at
+    def testOomKilledJobIsRequeued(self):
+        executor = FakeExecutor(oomKills={"a": (1, 4 << 20)})
+        pool = self.makeMemoryPool(executor)
+        job = self.makeMemoryJob("a", 1)
+        pool.submit(job)
+        completed = pool.run()
+        self.assertEqual(executor.started, ["a", "a"])
+        self.assertEqual(completed, [job])
+        self.assertEqual(job.oomKills, 1)
+        self.assertEqual(job.memoryHint, (4 << 20) * 3 // 2)
+
+    # Every retry is ended too, so the job gives up after its OOM retries
+    def testOomRetriesRunOut(self):
+        executor = FakeExecutor(oomKills={"a": (10, 1 << 20)})
+        pool = self.makeMemoryPool(executor)
+        pool.submit(self.makeMemoryJob("a", 1))
+        completed = pool.run()
+        self.assertEqual(len(executor.started), vgSpec2017Jobs.maxOomRetries + 1)
+        self.assertEqual(completed[0].returncode, -9)
+
+class ExpectedBenchmarkRuntimeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    # RETURNS: a RuntimeHistory holding the given {job : runtime}
+    def makeHistory(self, runtimes):
+        history = vgSpec2017Journal.RuntimeHistory(vgSpec2017Journal.RunJournal(self.tmpDir), "test")
+        for job, runtime in sorted(runtimes.items()):
+            history.add({"job": job, "runtime": runtime, "returncode": 0})
+        return history
+
+    def testLongestInvocationOfARunBenchmark(self):
+        history = self.makeHistory({"505.mcf_r": 100, "502.gcc_r (1/2)": 40, "502.gcc_r (2/2)": 70})
+        self.assertEqual(vgSpec2017Jobs.expectedBenchmarkRuntime("505.mcf_r", history), 100)
+        self.assertEqual(vgSpec2017Jobs.expectedBenchmarkRuntime("502.gcc_r", history), 70)
+
+    # With no history at all, benchmarks still come out longest first
+    def testReferenceRuntimeOnAFirstRun(self):
+        history = self.makeHistory({})
+        estimates = dict((name, vgSpec2017Jobs.expectedBenchmarkRuntime(name, history))
+                         for name in ("503.bwaves_r", "505.mcf_r", "508.namd_r"))
+        self.assertEqual(sorted(estimates, key=estimates.get, reverse=True), ["503.bwaves_r", "505.mcf_r", "508.namd_r"])
+
+    # Benchmarks that never ran are scaled by how the benchmarks that did run compare to SPEC's runtimes
+    def testReferenceRuntimeScaledToHistory(self):
+        history = self.makeHistory({"505.mcf_r": 1616 * 10})
+        self.assertAlmostEqual(vgSpec2017Jobs.expectedBenchmarkRuntime("508.namd_r", history), 950 * 10)
+
+    def testUnknownBenchmarkGetsTypicalRuntime(self):
+        self.assertEqual(vgSpec2017Jobs.expectedBenchmarkRuntime("000.sim0_r", self.makeHistory({})), 0)
+        history = self.makeHistory({"000.sim1_r": 10, "000.sim2_r": 30})
+        self.assertEqual(vgSpec2017Jobs.expectedBenchmarkRuntime("000.sim0_r", history), 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Checks that the native parser of vgSpec2017Parser.py reads cachegrind
+# and callgrind output into the same per-line counts cg_annotate shows,
+# and that the invocations of a benchmark merge the way cg_merge does.
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import vgSpec2017Parser
+import vgSpec2017Jobs
+
+class ParseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    # Writes a result file into the test folder
+    # ARGS: the file's lines, the file name
+    # RETURNS: the full path of the file
+    def writeResult(self, lines, name="result.txt"):
+        path = os.path.join(self.tmpDir, name)
+        with open(path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    # RETURNS: the CgTable parsed from the given lines
+    def parse(self, lines):
+        return vgSpec2017Parser.parseCachegrindOut(self.writeResult(lines))
+
+class ParseCachegrindOutTest(ParseTestCase):
+    def testCachegrindOutput(self):
+        table = self.parse(["desc: I1 cache: 32768 B, 64 B, 8-way associative",
+                            "cmd: ./mcf inp.in",
+                            "events: Ir Dr DLmr",
+                            "fl=mcf.c", "fn=main", "10 5 2 1", "11 3",
+                            "fn=helper", "20 7 1 0",
+                            "fl=util.c", "fn=helper", "5 1 1 1",
+                            "summary: 16 4 2"])
+        self.assertEqual(table.events, ["Ir", "Dr", "DLmr"])
+        self.assertEqual(table.cmd, "./mcf inp.in")
+        self.assertEqual(table.desc, ["I1 cache: 32768 B, 64 B, 8-way associative"])
+        self.assertEqual(table.summary, [16, 4, 2])
+        # Trailing zero counts left off are filled in
+        self.assertEqual(table.functions, {("mcf.c", "main"): {10: [5, 2, 1], 11: [3, 0, 0]},
+                                           ("mcf.c", "helper"): {20: [7, 1, 0]},
+                                           ("util.c", "helper"): {5: [1, 1, 1]}})
+        self.assertEqual(table.total("Ir"), 16)
+        self.assertEqual(table.lineTotals("DLmr"), {("mcf.c", 10): 1, ("util.c", 5): 1})
+
+    def testRepeatedLinesAreSummed(self):
+        table = self.parse(["events: Ir", "fl=a.c", "fn=f", "3 4", "fn=g", "3 1", "fn=f", "3 2", "summary: 7"])
+        self.assertEqual(table.functions[("a.c", "f")], {3: [6]})
+        self.assertEqual(table.lineTotals("Ir"), {("a.c", 3): 7})
+
+    def testMissingSummaryIsSummed(self):
+        table = self.parse(["events: Ir Dr", "fl=a.c", "fn=f", "1 4 1", "2 6 2"])
+        self.assertEqual(table.summary, [10, 3])
+
+    def testCompressedNames(self):
+        table = self.parse(["events: Ir", "fl=(1) a.c", "fn=(1) f", "1 2", "fl=(2) b.c", "fn=(2) g", "1 3",
+                            "fl=(1)", "fn=(1)", "2 4", "summary: 9"])
+        self.assertEqual(sorted(table.functions), [("a.c", "f"), ("b.c", "g")])
+        self.assertEqual(table.functions[("a.c", "f")], {1: [2], 2: [4]})
+
+    # The inclusive cost after a "calls=" line is already counted in the callee
+    def testCallCostIsSkipped(self):
+        table = self.parse(["events: Ir", "fl=a.c", "fn=main", "4 1", "cfn=f", "calls=1 10", "5 100",
+                            "fn=f", "10 100", "totals: 101"])
+        self.assertEqual(table.functions[("a.c", "main")], {4: [1]})
+        self.assertEqual(table.summary, [101])
+
+    # An inlined file lasts until the next function, which is back in the last "fl=" file
+    def testInlinedFileEndsAtNextFunction(self):
+        table = self.parse(["events: Ir Dr", "fl=a.c", "fn=f", "1 1 0", "fi=inl.h", "2 5", "fe=a.c", "3 1 1",
+                            "fi=inl.h", "6 2", "fn=g", "4 7", "summary: 16 1"])
+        self.assertEqual(table.functions, {("a.c", "f"): {1: [1, 0], 3: [1, 1]},
+                                           ("inl.h", "f"): {2: [5, 0], 6: [2, 0]},
+                                           ("a.c", "g"): {4: [7, 0]}})
+
+    def testInlinedCompressedFileName(self):
+        table = self.parse(["events: Ir", "fl=(1) a.c", "fn=(1) f", "fi=(2) inl.h", "2 5", "fn=(2) g", "4 7",
+                            "fn=(1)", "fi=(2)", "3 1", "summary: 13"])
+        self.assertEqual(table.functions, {("inl.h", "f"): {2: [5], 3: [1]}, ("a.c", "g"): {4: [7]}})
+
+class MergeTest(ParseTestCase):
+    # RETURNS: the CgTables of two invocations of one benchmark
+    def parts(self):
+        first = self.parse(["desc: I1 cache: 32768 B, 64 B, 8-way associative", "cmd: ./gcc a.c", "events: Ir Dr",
+                            "fl=a.c", "fn=f", "1 5 1", "2 1", "fl=b.c", "fn=g", "3 2 2", "summary: 8 3"])
+        second = self.parse(["desc: I1 cache: 32768 B, 64 B, 8-way associative", "cmd: ./gcc b.c", "events: Ir Dr",
+                             "fl=a.c", "fn=f", "1 10 0", "fl=c.c", "fn=h", "9 4 4", "summary: 14 4"])
+        return [first, second]
+
+    def testMergeSumsLikeCgMerge(self):
+        merged = vgSpec2017Parser.mergeCgTables(self.parts())
+        self.assertEqual(merged.events, ["Ir", "Dr"])
+        self.assertEqual(merged.summary, [22, 7])
+        self.assertEqual(merged.cmd, "./gcc a.c; ./gcc b.c")
+        self.assertEqual(merged.desc, ["I1 cache: 32768 B, 64 B, 8-way associative"])
+        self.assertEqual(merged.functions, {("a.c", "f"): {1: [15, 1], 2: [1, 0]},
+                                            ("b.c", "g"): {3: [2, 2]},
+                                            ("c.c", "h"): {9: [4, 4]}})
+
+    def testMergeLeavesPartsAlone(self):
+        parts = self.parts()
+        vgSpec2017Parser.mergeCgTables(parts)
+        self.assertEqual(parts[0].functions[("a.c", "f")], {1: [5, 1], 2: [1, 0]})
+
+    def testMergeNeedsTheSameEvents(self):
+        parts = self.parts()
+        parts[1].events = ["Ir", "Dw"]
+        self.assertRaises(ValueError, vgSpec2017Parser.mergeCgTables, parts)
+
+    # The merged file reads back the same, plain or compressed, and leaves no temporary file
+    def testMergedResultReadsBack(self):
+        paths = [self.writeResult(["events: Ir Dr", "fl=a.c", "fn=f", "1 5 1", "summary: 5 1"], "bmk.part0"),
+                 self.writeResult(["events: Ir Dr", "fl=a.c", "fn=f", "1 2 2", "2 1", "summary: 3 2"], "bmk.part1")]
+        for name in ("bmk.txt", "bmk.txt.gz"):
+            merged = os.path.join(self.tmpDir, name)
+            vgSpec2017Parser.mergeCachegrindOuts(paths, merged)
+            table = vgSpec2017Parser.parseCachegrindOut(merged)
+            self.assertEqual(table.functions, {("a.c", "f"): {1: [7, 3], 2: [1, 0]}})
+            self.assertEqual(table.summary, [8, 3])
+            self.assertEqual(vgSpec2017Parser.readSummary(merged), (["Ir", "Dr"], [8, 3]))
+        self.assertEqual(sorted(os.listdir(self.tmpDir)), ["bmk.part0", "bmk.part1", "bmk.txt", "bmk.txt.gz"])
+
+    def testEveryInvocationInSpeccmds(self):
+        with open(os.path.join(self.tmpDir, vgSpec2017Jobs.vgExeCmdFile), 'w') as f:
+            f.write("-r\n-N C\n-C /spec/run\n"
+                    "-o out0.txt -e err0.txt ../run_base/gcc_r a.c -O3 > a.out\n"
+                    "-o out1.txt -e err1.txt ../run_base/gcc_r b.c\n")
+        self.assertEqual(vgSpec2017Jobs.getExeCommands(self.tmpDir), ["../run_base/gcc_r a.c -O3", "../run_base/gcc_r b.c"])
+        self.assertEqual(vgSpec2017Jobs.getExeCommand(self.tmpDir), "../run_base/gcc_r a.c -O3")
+        self.assertEqual(vgSpec2017Jobs.getPartResFile("/r/502.gcc_r.txt", 1), "/r/502.gcc_r.part1")
+        self.assertEqual(vgSpec2017Jobs.getPartResFile("/r/502.gcc_r.txt.gz", 0), "/r/502.gcc_r.txt.part0.gz")
+
+if __name__ == "__main__":
+    unittest.main()
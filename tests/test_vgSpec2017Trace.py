@@ -0,0 +1,53 @@
+#*************************************************************
+#
+# SPEC 2017 Bottleneck Analysis (Valgrind and SPEC2017)
+#
+# Checks the trace simulation of vgSpec2017Trace.py counts accesses the
+# way cachegrind does, so sweep results compare with the Manager's.
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# MuRI 2019
+# Cole Boulanger & Alec Sheran
+#
+#*************************************************************
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import vgSpec2017Engine
+import vgSpec2017Trace
+
+@unittest.skipIf(not vgSpec2017Engine.available(), "needs NumPy")
+class SimulateTraceTest(unittest.TestCase):
+    # Simulates lackey records ("I", "L", "S" or "M", address, size) with cachegrind's default caches
+    # RETURNS: {event : count}
+    def simulate(self, records):
+        np = vgSpec2017Engine.np
+        kinds = np.array([vgSpec2017Trace.lackeyKinds[kind] for kind, addr, size in records], dtype=np.uint8)
+        addrs = np.array([addr for kind, addr, size in records], dtype=np.int64)
+        sizes = np.array([size for kind, addr, size in records], dtype=np.uint8)
+        i1 = vgSpec2017Trace.CacheConfig(32768, 8, 64)
+        d1 = vgSpec2017Trace.CacheConfig(32768, 8, 64)
+        ll = vgSpec2017Trace.CacheConfig(2097152, 16, 64)
+        results = vgSpec2017Trace.simulateTrace((kinds, addrs, sizes), i1, [d1], [ll])
+        return dict(zip(vgSpec2017Trace.simEvents, results[(i1, d1, ll)]))
+
+    # Cachegrind counts a modify as one data read, never as a write
+    def testModifyCountsAsRead(self):
+        counts = self.simulate([("I", 0x1000, 4), ("M", 0x2000, 8), ("I", 0x1004, 4), ("M", 0x2000, 8),
+                                ("S", 0x3000, 8), ("L", 0x4000, 4)])
+        self.assertEqual(counts, {'Ir': 2, 'I1mr': 1, 'ILmr': 1,
+                                  'Dr': 3, 'D1mr': 2, 'DLmr': 2,
+                                  'Dw': 1, 'D1mw': 1, 'DLmw': 1})
+
+    # A trace of modifies alone has no writes at all
+    def testModifyOnly(self):
+        counts = self.simulate([("M", 0x2000, 8), ("M", 0x2040, 8), ("M", 0x2000, 8)])
+        self.assertEqual((counts['Dr'], counts['D1mr'], counts['DLmr']), (3, 2, 2))
+        self.assertEqual((counts['Dw'], counts['D1mw'], counts['DLmw']), (0, 0, 0))
+
+if __name__ == "__main__":
+    unittest.main()